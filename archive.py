@@ -0,0 +1,310 @@
+import json
+import mmap
+import os
+import socket
+import struct
+import threading
+import zlib
+
+"""
+    Module with the local archive of the raw match payloads, so they can be read again without spending API requests.
+    The payloads are compressed one by one and appended to segment files, rotated once they reach the segment size.
+    Each segment has an index file with the match_id, offset and length of each payload, loaded into memory on startup.
+    Every process appends to its own segments, named by the writer, and reads the segments of every writer of the folder.
+    The segments are read through memory maps, so a lookup is a dict access and a slice of the page cache.
+
+    Each record of a segment is a header with the length of the match_id and of the payload, followed by both of them.
+    The index is written after the segment, so a crash can only lose index lines, which are recovered from the segment.
+"""
+
+# Folder of the archive.
+archive_dir = os.getenv("ARCHIVE_DIR", "archive")
+
+# Disables the archive, every match is fetched from the API.
+archive_enabled = os.getenv("ARCHIVE", "1") == "1"
+
+# Size in bytes that closes a segment, the next payloads go to a new one.
+archive_segment_size = int(os.getenv("ARCHIVE_SEGMENT_SIZE", 256 * 1024 * 1024))
+
+# Compression level of the payloads, from 1 (faster) to 9 (smaller).
+archive_compression = int(os.getenv("ARCHIVE_COMPRESSION", 6))
+
+# Name of the segments written by the process, set by the launcher for each worker.
+archive_writer = os.getenv("ARCHIVE_WRITER", f"{socket.gethostname()}-0")
+
+# Header of each record, the length of the match_id and the length of the compressed payload.
+record_header = struct.Struct("<HI")
+
+
+class Archive:
+    """
+    Append-only archive of raw payloads keyed by match_id, safe to use from many threads.
+
+    Args:
+        directory (string): Folder of the segments, created when needed.
+        writer (string, optional): Name of the segments written by this instance, only one instance may use it at a time.
+        segment_size (int, optional): Size in bytes that closes a segment.
+        compression (int, optional): zlib compression level of the payloads.
+        read_only (bool, optional): Only reads the segments, without recovering or opening any of them for appending.
+    """
+
+    def __init__(
+        self,
+        directory,
+        writer=None,
+        segment_size=archive_segment_size,
+        compression=archive_compression,
+        read_only=False,
+    ):
+        self.directory = directory
+        self.writer = writer if writer is not None else archive_writer
+        self.read_only = read_only
+        self.segment_size = segment_size
+        self.compression = compression
+        self.lock = threading.Lock()
+        # Match_id => (segment, offset, length) of the compressed payload, the segment being (writer, number).
+        self.index = {}
+        # Memory maps of the segments, remapped when the active one grows past its map.
+        self.maps = {}
+        self.segment = None
+        self.segment_file = None
+        self.index_file = None
+        os.makedirs(directory, exist_ok=True)
+        self.load()
+
+    # Paths of the files of a segment.
+    def segment_path(self, segment):
+        return os.path.join(
+            self.directory, f"segment-{segment[0]}-{segment[1]:06d}.dat"
+        )
+
+    def index_path(self, segment):
+        return os.path.join(
+            self.directory, f"segment-{segment[0]}-{segment[1]:06d}.idx"
+        )
+
+    # Function to load the indexes of every segment.
+    def load(self):
+        """
+        Reads the index of every segment. The segments of this writer also recover the records written after
+        the last index line and truncate a record left incomplete by a crash, and the last one is opened for appending.
+        """
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith("segment-") and name.endswith(".dat"):
+                writer, number = name[8:-4].rsplit("-", 1)
+                segments.append((writer, int(number)))
+        segments.sort()
+        own = [segment for segment in segments if segment[0] == self.writer]
+        for segment in segments:
+            self.load_segment(segment, recover=segment in own and not self.read_only)
+        if not self.read_only:
+            self.open_segment(own[-1] if own else (self.writer, 1))
+
+    def load_segment(self, segment, recover):
+        size = os.path.getsize(self.segment_path(segment))
+        end = 0
+        if os.path.exists(self.index_path(segment)):
+            with open(self.index_path(segment), "r") as index_file:
+                for line in index_file:
+                    parts = line.rstrip("\n").split("\t")
+                    # A partial line is left by a crash while writing it.
+                    if len(parts) != 3 or not parts[2].isdigit():
+                        continue
+                    offset, length = int(parts[1]), int(parts[2])
+                    if offset + length > size:
+                        continue
+                    self.index[parts[0]] = (segment, offset, length)
+                    end = max(end, offset + length)
+        # The segments of other writers may be being written right now.
+        if not recover:
+            return
+
+        recovered = []
+        with open(self.segment_path(segment), "r+b") as segment_file:
+            segment_file.seek(end)
+            while end + record_header.size <= size:
+                id_length, length = record_header.unpack(
+                    segment_file.read(record_header.size)
+                )
+                offset = end + record_header.size + id_length
+                if offset + length > size:
+                    break
+                match_id = segment_file.read(id_length).decode()
+                segment_file.seek(length, os.SEEK_CUR)
+                recovered.append((match_id, offset, length))
+                end = offset + length
+            if end < size:
+                print(
+                    f"Truncating a incomplete record of the archive segment {segment}."
+                )
+                segment_file.truncate(end)
+        if recovered:
+            # The recovered lines can't be appended to a partial line.
+            if os.path.exists(self.index_path(segment)):
+                with open(self.index_path(segment), "rb+") as index_file:
+                    index_file.seek(0, os.SEEK_END)
+                    if index_file.tell() > 0:
+                        index_file.seek(-1, os.SEEK_END)
+                        if index_file.read(1) != b"\n":
+                            index_file.write(b"\n")
+            with open(self.index_path(segment), "a") as index_file:
+                for match_id, offset, length in recovered:
+                    self.index[match_id] = (segment, offset, length)
+                    index_file.write(f"{match_id}\t{offset}\t{length}\n")
+
+    # Open a segment for appending.
+    def open_segment(self, segment):
+        if self.segment_file is not None:
+            self.segment_file.close()
+            self.index_file.close()
+        self.segment = segment
+        self.segment_file = open(self.segment_path(segment), "ab")
+        self.index_file = open(self.index_path(segment), "a")
+
+    # Check if a match is on the archive.
+    def __contains__(self, match_id):
+        return match_id in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    # Function to store a payload.
+    def put(self, match_id, raw):
+        """
+        Compresses the payload and appends it to the active segment, does nothing if the match is already archived.
+
+        Args:
+            match_id (string): The ID of the match.
+            raw (bytes): The body of the match-v5 response.
+        """
+        if self.read_only:
+            raise ValueError("The archive was opened as read only.")
+        if match_id in self.index:
+            return
+        data = zlib.compress(raw, self.compression)
+        key = match_id.encode()
+        with self.lock:
+            if match_id in self.index:
+                return
+            if self.segment_file.tell() >= self.segment_size:
+                self.open_segment((self.writer, self.segment[1] + 1))
+            offset = self.segment_file.tell() + record_header.size + len(key)
+            self.segment_file.write(record_header.pack(len(key), len(data)) + key)
+            self.segment_file.write(data)
+            # Flushed so the memory map of the segment sees the record.
+            self.segment_file.flush()
+            self.index_file.write(f"{match_id}\t{offset}\t{len(data)}\n")
+            self.index_file.flush()
+            self.index[match_id] = (self.segment, offset, len(data))
+
+    # Function to read the compressed bytes of a record.
+    def read(self, segment, offset, length):
+        with self.lock:
+            segment_map = self.maps.get(segment)
+            if segment_map is None or offset + length > len(segment_map):
+                if segment_map is not None:
+                    segment_map.close()
+                with open(self.segment_path(segment), "rb") as segment_file:
+                    segment_map = mmap.mmap(
+                        segment_file.fileno(), 0, access=mmap.ACCESS_READ
+                    )
+                self.maps[segment] = segment_map
+            return segment_map[offset : offset + length]
+
+    # Function to get the raw payload of a match.
+    def get_raw(self, match_id):
+        """
+        Args:
+            match_id (string): The ID of the match.
+
+        Returns:
+            bytes: The body of the match-v5 response, None if the match isn't archived.
+        """
+        location = self.index.get(match_id)
+        if location is None:
+            return None
+        return zlib.decompress(self.read(*location))
+
+    # Function to get the payload of a match.
+    def get(self, match_id):
+        """
+        Args:
+            match_id (string): The ID of the match.
+
+        Returns:
+            Dict: The match-v5 payload, None if the match isn't archived.
+        """
+        raw = self.get_raw(match_id)
+        return json.loads(raw) if raw is not None else None
+
+    # Function to get the compressed payload of a match, to be decompressed by another process.
+    def get_compressed(self, match_id):
+        location = self.index.get(match_id)
+        return self.read(*location) if location is not None else None
+
+    # Function to list the archived matches in the order of the files.
+    def ordered(self):
+        """
+        Returns:
+            List[string]: The match_id of every archived match, segment by segment and in the order they were written, so reading them is sequential.
+        """
+        return sorted(self.index, key=self.index.__getitem__)
+
+    # Generator of every archived payload.
+    def scan(self, after=None):
+        """
+        Yields the archived matches in the order they were written, segment by segment, which reads the files sequentially.
+
+        Args:
+            after (string, optional): Match_id of the last match already handled, the scan starts after it.
+
+        Yields:
+            Tuple[string, bytes]: The match_id and the raw payload.
+        """
+        match_ids = self.ordered()
+        start = 0
+        if after is not None and after in self.index:
+            start = match_ids.index(after) + 1
+        for match_id in match_ids[start:]:
+            yield match_id, zlib.decompress(self.read(*self.index[match_id]))
+
+    # Function to close the files of the archive.
+    def close(self):
+        with self.lock:
+            for segment_map in self.maps.values():
+                segment_map.close()
+            self.maps.clear()
+            if self.segment_file is not None:
+                self.segment_file.close()
+                self.index_file.close()
+                self.segment_file = None
+
+
+# Archive of the process, opened on the first use.
+archive = None
+archive_lock = threading.Lock()
+
+
+# Function to get the archive of the process.
+def get_archive():
+    """
+    Returns:
+        Archive: The archive on the ARCHIVE_DIR folder, None if the archive is disabled.
+    """
+    global archive
+    if not archive_enabled:
+        return None
+    with archive_lock:
+        if archive is None:
+            archive = Archive(archive_dir, archive_writer)
+        return archive
+
+
+# Function to close the archive of the process.
+def close_archive():
+    global archive
+    with archive_lock:
+        if archive is not None:
+            archive.close()
+            archive = None
@@ -0,0 +1,255 @@
+import argparse
+import json
+import os
+import resource
+import signal
+import subprocess
+import sys
+import time
+from datetime import datetime
+from benchmarks import mock_riot
+from db_operations import *
+
+"""
+    End-to-end benchmark of the crawl, running main.py against the mock API of the mock_riot module.
+    Uses the database of the enviroment, so it should point to a database used only for tests, and the tables must be
+    empty or emptied with --reset so every run crawls the same matches. The archive is disabled, so every match is requested.
+
+    The crawl runs until it wrote every match of the mock, the duration passed or no match was written for the idle time.
+    The results are appended to benchmarks/results/crawl.jsonl with the commit, and the previous runs with the same
+    arguments are printed for comparison:
+        - matches/sec, the matches written divided by the time from the start of main.py to the stop;
+        - API calls per match, every response of the mock including the 429;
+        - DB queries per match, from the Questions status of the server, so other clients of the server are counted too;
+        - peak RSS of the crawler process, the largest of the processes when running many workers.
+
+    Usage:
+        python -m benchmarks.bench_crawl --players 2000 --matches 5000 --latency 0.05 --reset
+"""
+
+# Folder of the stored results.
+results_dir = os.path.join(os.path.dirname(__file__), "results")
+
+# Tables emptied by --reset, children before parents.
+tables = [
+    "tb_player_stats",
+    "tb_match_timeline",
+    "tb_champion_stats",
+    "tb_lease",
+    "tb_pending_match",
+    "tb_match_info",
+    "tb_player_info",
+]
+
+
+# Function to empty the tables of the crawl.
+def reset_tables():
+    connection = get_connection()
+    cursor = connection.cursor()
+    try:
+        # The foreign keys block the truncation, the setting only applies to this connection.
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+        for table in tables:
+            cursor.execute(f"TRUNCATE TABLE {table}")
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+    finally:
+        cursor.close()
+        connection.close()
+
+
+# Function to get the amount of statements received by the server.
+def get_questions():
+    return int(execute_query("SHOW GLOBAL STATUS LIKE 'Questions'")[0][1])
+
+
+# Function to get the commit being measured.
+def get_commit():
+    """
+    Returns:
+        string: The short hash of HEAD, with -dirty when the tree has changes.
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# Function to run the crawl until it stops writing matches.
+def run_crawl(server, args, total):
+    """
+    Starts main.py pointed to the mock server and stops it with a interrupt, as a user would.
+
+    Args:
+        server (MockServer): The running mock server.
+        args (Namespace): The arguments of the benchmark.
+        total (int): Amount of matches of the mock.
+
+    Returns:
+        Tuple[int, float]: The matches written when the stop was sent, and the seconds from the start to the stop.
+    """
+    env = dict(
+        os.environ,
+        API_BASE_URL=server.url,
+        API_KEY="benchmark",
+        ARCHIVE="0",
+        PLATFORMS="br1",
+        METRICS_PORT="0",
+        FETCH_TIMELINES="1" if args.timelines else "0",
+    )
+    os.makedirs(results_dir, exist_ok=True)
+    log = open(os.path.join(results_dir, "crawl-last.log"), "w")
+    started = time.monotonic()
+    # On its own session, so the interrupt reaches every worker of the launcher.
+    process = subprocess.Popen(
+        [sys.executable, "main.py", "--workers", str(args.workers)],
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+        start_new_session=True,
+    )
+    written = 0
+    last_progress = started
+    try:
+        while process.poll() is None:
+            time.sleep(1)
+            now = time.monotonic()
+            count = count_matches()
+            if count > written:
+                written, last_progress = count, now
+            if (
+                written >= total
+                or now - started >= args.duration
+                or now - last_progress >= args.idle
+            ):
+                break
+        stopped = time.monotonic()
+    finally:
+        if process.poll() is None:
+            os.killpg(process.pid, signal.SIGINT)
+        process.wait()
+        log.close()
+    if process.returncode not in (0, -signal.SIGINT):
+        print(f"The crawl exited with code {process.returncode}, see crawl-last.log.")
+    # The last matches written after the last poll count for the rate too.
+    written = max(written, count_matches())
+    return written, stopped - started
+
+
+# Function to store the results of a run and print the previous runs with the same arguments.
+def store_results(result):
+    path = os.path.join(results_dir, "crawl.jsonl")
+    previous = []
+    if os.path.exists(path):
+        with open(path, "r") as results_file:
+            for line in results_file:
+                entry = json.loads(line)
+                if entry["config"] == result["config"]:
+                    previous.append(entry)
+    with open(path, "a") as results_file:
+        results_file.write(json.dumps(result) + "\n")
+
+    print(
+        f"{'commit':>16} {'date':>19} {'matches/s':>10} {'calls/match':>12} {'queries/match':>14} {'peak RSS':>10}"
+    )
+    for entry in previous[-5:] + [result]:
+        print(
+            f"{entry['commit']:>16} {entry['date'][:19]:>19} {entry['matches_per_second']:>10.1f} "
+            f"{entry['api_calls_per_match']:>12.2f} {entry['db_queries_per_match']:>14.1f} {entry['peak_rss_mib']:>8.0f}Mi"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="End-to-end benchmark of the crawl against the mock API."
+    )
+    mock_riot.add_arguments(parser)
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Amount of crawler processes."
+    )
+    parser.add_argument(
+        "--duration", type=float, default=300, help="Maximum seconds of the crawl."
+    )
+    parser.add_argument(
+        "--idle",
+        type=float,
+        default=30,
+        help="Stops after these seconds without new matches.",
+    )
+    parser.add_argument(
+        "--timelines", action="store_true", help="Also fetch the timelines."
+    )
+    parser.add_argument(
+        "--reset",
+        action="store_true",
+        help="Empty the tables before the run, only on a database used for tests.",
+    )
+    args = parser.parse_args()
+
+    connect_mysql()
+    try:
+        create_tables()
+        if args.reset:
+            reset_tables()
+        elif count_matches() > 0:
+            print(
+                "The tables aren't empty, run with --reset on a database used only for tests."
+            )
+            return
+
+        server = mock_riot.from_arguments(args).start()
+        total = len(server.world.matches)
+        print(
+            f"Crawling {total} matches of {len(server.world.players)} players from {server.url}."
+        )
+        questions = get_questions()
+        try:
+            written, elapsed = run_crawl(server, args, total)
+        finally:
+            server.stop()
+        # The polls of the benchmark are one query each.
+        queries = get_questions() - questions - int(elapsed)
+        calls = sum(server.requests.values())
+    finally:
+        close_mysql()
+
+    peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    config = {
+        name: value
+        for name, value in vars(args).items()
+        if name not in ("reset", "port", "duration", "idle")
+    }
+    result = {
+        "commit": get_commit(),
+        "date": datetime.now().isoformat(),
+        "config": config,
+        "matches": written,
+        "seconds": elapsed,
+        "matches_per_second": written / max(elapsed, 1e-9),
+        "api_calls": calls,
+        "api_calls_per_match": calls / max(written, 1),
+        "rate_limited": sum(
+            count for (_, status), count in server.requests.items() if status == 429
+        ),
+        "db_queries": queries,
+        "db_queries_per_match": queries / max(written, 1),
+        "peak_rss_mib": peak_rss,
+    }
+    print(
+        f"Wrote {written} of {total} matches in {elapsed:.1f}s, {result['rate_limited']} responses were 429."
+    )
+    store_results(result)
+
+
+if __name__ == "__main__":
+    main()
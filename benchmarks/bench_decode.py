@@ -0,0 +1,81 @@
+import argparse
+import json
+import random
+import time
+import tracemalloc
+from benchmarks.synthetic import make_match, make_players
+from data_treatment import *
+from match_schema import decode_match, msgspec
+
+"""
+    Microbenchmark of the selective decoding of the match payloads against the full decoding by the json module.
+    The synthetic payloads only have the fields read by the project, so extra fields are added to each participant
+    to get closer to the size of a real response.
+
+    Usage:
+        python -m benchmarks.bench_decode --matches 2000 --extra-fields 120
+"""
+
+
+# Function to decode the payloads into dicts and extract the rows with the original functions.
+def decode_full(payloads):
+    for raw in payloads:
+        data = json.loads(raw)
+        get_match_info(data)
+        get_player_info(data)
+        get_player_stats(data)
+
+
+# Function to decode only the fields used into records and extract the rows.
+def decode_selective(payloads):
+    for raw in payloads:
+        get_match_rows(decode_match(raw))
+
+
+# Function to get the peak memory used to decode a single payload.
+def peak_memory(decode, raw):
+    tracemalloc.start()
+    decode([raw])
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark of the selective decoding of the match payloads."
+    )
+    parser.add_argument("--matches", type=int, default=2000)
+    parser.add_argument("--extra-fields", type=int, default=120)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    players = make_players(1000)
+    payloads = []
+    for index in range(args.matches):
+        data = make_match(f"BR1_{index}", rng.sample(players, 10), rng)
+        for participant in data["info"]["participants"]:
+            for field in range(args.extra_fields):
+                participant[f"unusedField{field}"] = rng.randint(0, 10000)
+        payloads.append(json.dumps(data).encode())
+    size = sum(len(raw) for raw in payloads) / len(payloads)
+    print(
+        f"Average payload of {size / 1024:.1f} KiB, msgspec {'installed' if msgspec else 'not installed'}."
+    )
+
+    for name, decode in (("full", decode_full), ("selective", decode_selective)):
+        # Best of the runs, to leave out the warm up.
+        elapsed = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            decode(payloads)
+            elapsed = min(elapsed, time.perf_counter() - start)
+        peak = peak_memory(decode, payloads[0])
+        print(
+            f"{name:>10}: {args.matches} matches in {elapsed:.3f}s ({args.matches / elapsed:.0f} matches/s), peak of {peak / 1024:.0f} KiB per match"
+        )
+
+
+if __name__ == "__main__":
+    main()
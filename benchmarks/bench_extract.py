@@ -0,0 +1,67 @@
+import argparse
+import random
+import time
+import pandas as pd
+from benchmarks.synthetic import make_match, make_players
+from data_treatment import get_player_stats, get_stats_columns
+
+"""
+    Microbenchmark of the columnar extraction of the stats against the per-match functions.
+    Doesn't use the database, the payloads are synthetic.
+
+    Usage:
+        python -m benchmarks.bench_extract --matches 5000
+"""
+
+
+# Function to extract the stats one match at a time, building a DataFrame per match as insert_player_stats does.
+def extract_per_match(matches):
+    for data in matches:
+        pd.DataFrame(get_player_stats(data))
+
+
+# Function to extract the stats one match at a time, only building the dicts.
+def extract_dicts(matches):
+    for data in matches:
+        get_player_stats(data)
+
+
+# Function to extract the stats of the batches as columns.
+def extract_columns(matches, batch_size):
+    for start in range(0, len(matches), batch_size):
+        get_stats_columns(matches[start : start + batch_size])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark of the columnar stats extraction."
+    )
+    parser.add_argument("--matches", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    players = make_players(1000)
+    matches = [
+        make_match(f"BR1_{index}", rng.sample(players, 10), rng)
+        for index in range(args.matches)
+    ]
+    for name, extract in (
+        ("per-match dataframe", extract_per_match),
+        ("per-match dicts", extract_dicts),
+        ("columnar", lambda m: extract_columns(m, args.batch_size)),
+    ):
+        # Best of the runs, to leave out the warm up.
+        elapsed = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            extract(matches)
+            elapsed = min(elapsed, time.perf_counter() - start)
+        print(
+            f"{name:>20}: {args.matches} matches in {elapsed:.3f}s ({args.matches / elapsed:.0f} matches/s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
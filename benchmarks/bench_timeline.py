@@ -0,0 +1,66 @@
+import argparse
+import json
+import random
+import time
+import numpy as np
+from benchmarks.synthetic import make_players, make_timeline
+from timeline import (
+    get_timeline_row,
+    msgspec,
+    parse_timeline,
+    timeline_series,
+    unpack_timeline,
+)
+
+"""
+    Benchmark of the parsing and storage of the timelines, without database.
+    Compares the size of the packed blob with the raw payload and with a row per participant and minute.
+
+    Usage:
+        python -m benchmarks.bench_timeline --matches 200
+"""
+
+# Estimated size of a row per participant and minute on InnoDB, with the ids, the minute, the series and the row overhead.
+row_size = 4 + 4 + 1 + 2 + 4 * len(timeline_series) + 20
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark of the timeline parsing and storage."
+    )
+    parser.add_argument("--matches", type=int, default=200)
+    parser.add_argument("--minutes", type=int, default=30)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    players = make_players(10)
+    payloads = [
+        json.dumps(make_timeline(f"BR1_{index}", players, args.minutes, rng)).encode()
+        for index in range(args.matches)
+    ]
+
+    start = time.perf_counter()
+    parsed = [parse_timeline(raw) for raw in payloads]
+    parse_time = time.perf_counter() - start
+    start = time.perf_counter()
+    rows = [get_timeline_row(values) for values in parsed]
+    pack_time = time.perf_counter() - start
+    start = time.perf_counter()
+    unpacked = [unpack_timeline(row["data"]) for row in rows]
+    unpack_time = time.perf_counter() - start
+    assert all(np.array_equal(a, b) for a, b in zip(parsed, unpacked))
+
+    raw_size = sum(len(raw) for raw in payloads) / args.matches
+    blob_size = sum(len(row["data"]) for row in rows) / args.matches
+    values = parsed[0].shape[0] * parsed[0].shape[1]
+    print(f"msgspec {'installed' if msgspec else 'not installed'}.")
+    print(
+        f"parse: {args.matches / parse_time:.0f} matches/s, pack: {args.matches / pack_time:.0f} matches/s, unpack: {args.matches / unpack_time:.0f} matches/s"
+    )
+    print(
+        f"per match: raw {raw_size / 1024:.1f} KiB, packed blob {blob_size / 1024:.2f} KiB, rows ~{values * row_size / 1024:.1f} KiB"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import random
+import time
+import uuid
+from benchmarks.synthetic import make_match, make_players, make_rating
+from data_treatment import *
+from db_operations import *
+from writer import MatchWriter, parsed_match
+
+"""
+    Benchmark of the batched writer against the per-match insertion.
+    Writes synthetic matches to the database of the enviroment, so it should point to a database used only for tests.
+
+    Usage:
+        python -m benchmarks.bench_writer --matches 500
+"""
+
+
+# Function to parse the synthetic matches as the crawler does.
+def parse_matches(count, players, rng):
+    """
+    Args:
+        count (int): Amount of matches.
+        players (List[Dict]): Pool of players the participants are taken from.
+        rng (Random): Random generator.
+
+    Returns:
+        List[Dict]: The parsed matches, every player treated as new.
+    """
+    # Unique prefix so the benchmark can run many times on the same database.
+    prefix = uuid.uuid4().hex[:8]
+    matches = []
+    for index in range(count):
+        participants = rng.sample(players, 10)
+        data = make_match(f"BR1_{prefix}{index:08d}", participants, rng)
+        p_info = get_player_info(data)
+        for player, participant in zip(p_info, participants):
+            player.update(get_player_rating(make_rating(participant, rng)))
+        matches.append(
+            parsed_match(get_match_info(data), p_info, get_player_stats(data), [])
+        )
+    return matches
+
+
+# Function to write the matches with the original functions, one transaction per insertion.
+def write_per_match(matches):
+    for match in matches:
+        insert_match_info(match["match_info"])
+        insert_player_info(match["player_info"])
+        insert_player_stats(match["player_stats"])
+
+
+# Function to write the matches with the batched writer.
+def write_batched(matches, batch_size):
+    writer = MatchWriter(batch_size=batch_size).start()
+    futures = [writer.submit(match) for match in matches]
+    writer.stop()
+    for future in futures:
+        future.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the batched writer.")
+    parser.add_argument("--matches", type=int, default=500)
+    parser.add_argument("--players", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=50)
+    args = parser.parse_args()
+
+    connect_mysql()
+    create_tables()
+    rng = random.Random(42)
+    # Different players for each run, so both paths insert the same amount of new players.
+    players = make_players(args.players, seed=rng.randint(0, 2**32))
+    try:
+        for name, write in (
+            ("per-match", write_per_match),
+            ("batched", lambda m: write_batched(m, args.batch_size)),
+        ):
+            matches = parse_matches(args.matches, players, rng)
+            start = time.perf_counter()
+            write(matches)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{name:>10}: {args.matches} matches in {elapsed:.2f}s ({args.matches / elapsed:.1f} matches/s)"
+            )
+            # The second path finds the players inserted by the first one, use new ones.
+            players = make_players(args.players, seed=rng.randint(0, 2**32))
+    finally:
+        close_mysql()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,423 @@
+import argparse
+import asyncio
+import bisect
+import glob
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from aiohttp import web
+from benchmarks.synthetic import (
+    make_match,
+    make_players,
+    make_rating,
+    make_timeline,
+)
+from rate_limiter import get_endpoint
+
+"""
+    Mock of the RIOT API, serving the match-v5, league-v4 and summoner-v4 endpoints used by the crawler.
+    The matches are synthetic, generated on the first request of each one, or recorded match-v5 payloads loaded from a
+    folder of JSON files. The route (br1, americas, ...) is the first segment of the path, so the crawler points to it
+    with API_BASE_URL=http://127.0.0.1:port.
+
+    Every response waits for the configured latency and carries the rate limit headers of the app and method limits,
+    which are enforced per route like the real API. A fraction of the requests can fail with 429 on purpose.
+
+    Usage:
+        python -m benchmarks.mock_riot --players 2000 --matches 5000 --latency 0.05 --error-rate 0.01
+"""
+
+# Patterns of the endpoints, matched against the path after the route.
+routes = [
+    ("match_ids", re.compile(r"^/lol/match/v5/matches/by-puuid/([^/]+)/ids$")),
+    ("timeline", re.compile(r"^/lol/match/v5/matches/([^/]+)/timeline$")),
+    ("match", re.compile(r"^/lol/match/v5/matches/([^/]+)$")),
+    ("summoner_by_puuid", re.compile(r"^/lol/summoner/v4/summoners/by-puuid/([^/]+)$")),
+    ("summoner", re.compile(r"^/lol/summoner/v4/summoners/([^/]+)$")),
+    (
+        "entries_by_summoner",
+        re.compile(r"^/lol/league/v4/entries/by-summoner/([^/]+)$"),
+    ),
+    ("entries", re.compile(r"^/lol/league/v4/entries/([^/]+)/([^/]+)/([^/]+)$")),
+    ("apex", re.compile(r"^/lol/league/v4/([a-z]+)leagues/by-queue/([^/]+)$")),
+]
+
+# Amount of entries of each page of the league entries.
+page_size = 205
+
+
+class World:
+    """
+    Players and matches served by the mock, the same ones for the same arguments.
+
+    Args:
+        players (int): Amount of synthetic players.
+        matches (int): Amount of synthetic matches, each one with 10 of the players.
+        platform (string, optional): Platform of the players and matches. Defaults to br1.
+        days (int, optional): The matches start during the last days. Defaults to 14.
+        seed (int, optional): Seed of the generator. Defaults to 0.
+        fixtures (string, optional): Folder of recorded match-v5 payloads, served along with the synthetic ones.
+    """
+
+    def __init__(
+        self, players, matches, platform="br1", days=14, seed=0, fixtures=None
+    ):
+        self.seed = seed
+        self.players = make_players(players, platform, seed) if players else []
+        rng = random.Random(seed)
+        now = int(time.time() * 1000)
+        # Match_id => (start in milliseconds, participants) of the synthetic matches.
+        self.matches = {}
+        for index in range(matches if self.players else 0):
+            match_id = f"{platform.upper()}_{seed:02d}{index:08d}"
+            start = now - rng.randint(0, days * 24 * 3600 * 1000)
+            self.matches[match_id] = (start, rng.sample(self.players, 10))
+        # Match_id => raw payload of the recorded matches, and the cache of the generated ones.
+        self.payloads = {}
+        self.timelines = {}
+        if fixtures:
+            self.load_fixtures(fixtures, platform)
+
+        self.by_puuid = {player["puuid"]: player for player in self.players}
+        self.by_summoner = {player["summonerId"]: player for player in self.players}
+        # Puuid => starts and ids of the matches of the player, sorted by the start.
+        self.history = {}
+        for match_id, (start, participants) in self.matches.items():
+            for player in participants:
+                self.history.setdefault(player["puuid"], []).append((start, match_id))
+        for history in self.history.values():
+            history.sort()
+        self.ratings = {
+            player["puuid"]: make_rating(player, random.Random(player["puuid"]))
+            for player in self.players
+        }
+
+    # Function to load the recorded match payloads.
+    def load_fixtures(self, folder, platform):
+        known = {player["puuid"] for player in self.players}
+        for path in sorted(glob.glob(f"{folder}/*.json")):
+            with open(path, "rb") as fixture:
+                raw = fixture.read()
+            data = json.loads(raw)
+            participants = []
+            for participant in data["info"]["participants"]:
+                player = {
+                    "puuid": participant["puuid"],
+                    "summonerId": participant.get("summonerId", participant["puuid"]),
+                    "riotIdGameName": participant.get("riotIdGameName", ""),
+                    "riotIdTagline": participant.get("riotIdTagline", ""),
+                    "platform": platform,
+                }
+                participants.append(player)
+                if player["puuid"] not in known:
+                    known.add(player["puuid"])
+                    self.players.append(player)
+            match_id = data["metadata"]["matchId"]
+            self.matches[match_id] = (data["info"]["gameCreation"], participants)
+            self.payloads[match_id] = raw
+
+    # Function to get the payload of a match.
+    def match(self, match_id):
+        raw = self.payloads.get(match_id)
+        if raw is None and match_id in self.matches:
+            start, participants = self.matches[match_id]
+            rng = random.Random(f"{self.seed}-{match_id}")
+            raw = json.dumps(make_match(match_id, participants, rng, start)).encode()
+            self.payloads[match_id] = raw
+        return raw
+
+    # Function to get the payload of the timeline of a match.
+    def timeline(self, match_id):
+        raw = self.timelines.get(match_id)
+        if raw is None and match_id in self.matches:
+            _, participants = self.matches[match_id]
+            rng = random.Random(f"{self.seed}-{match_id}-timeline")
+            raw = json.dumps(make_timeline(match_id, participants, rng=rng)).encode()
+            self.timelines[match_id] = raw
+        return raw
+
+    # Function to get the ids of the matches of a player, newest first, as the by-puuid endpoint.
+    def match_ids(self, puuid, start_time, end_time, start, count):
+        history = self.history.get(puuid, [])
+        low = bisect.bisect_left(history, (start_time * 1000,))
+        high = (
+            bisect.bisect_right(history, (end_time * 1000 + 999, "\uffff"))
+            if end_time is not None
+            else len(history)
+        )
+        selected = [match_id for _, match_id in reversed(history[low:high])]
+        return selected[start : start + count]
+
+    # Function to get the summoner of a player.
+    def summoner(self, player):
+        rng = random.Random(player["summonerId"])
+        return {
+            "id": player["summonerId"],
+            "puuid": player["puuid"],
+            "profileIconId": rng.randint(1, 6000),
+            "revisionDate": int(time.time() * 1000),
+            "summonerLevel": rng.randint(30, 800),
+        }
+
+    # Function to get the league entries of a tier and division.
+    def entries(self, tier, division, page):
+        players = [
+            rating
+            for rating in self.ratings.values()
+            if rating["tier"] == tier and rating["rank"] == division
+        ]
+        return players[(page - 1) * page_size : page * page_size]
+
+    # Function to get the league of a apex tier, the first 300 players are the challenger league and the other tiers are empty.
+    def apex(self, tier):
+        if tier != "challenger":
+            return {"tier": tier.upper(), "entries": []}
+        entries = []
+        for rating in list(self.ratings.values())[:300]:
+            entry = dict(rating)
+            entry.pop("queueType")
+            entry.pop("tier")
+            entries.append(entry)
+        return {"tier": "CHALLENGER", "queue": "RANKED_SOLO_5x5", "entries": entries}
+
+
+class Limit:
+    """
+    Sliding windows of a rate limit, such as 500:10,30000:600.
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.windows = [
+            (int(count), int(seconds), deque())
+            for count, seconds in (part.split(":") for part in spec.split(","))
+        ]
+
+    # Count the request, returns the seconds to wait if it goes over any window.
+    def hit(self, now):
+        retry_after = 0
+        for count, seconds, times in self.windows:
+            while times and times[0] <= now - seconds:
+                times.popleft()
+            if len(times) >= count:
+                retry_after = max(retry_after, times[0] + seconds - now)
+        if retry_after == 0:
+            for _, _, times in self.windows:
+                times.append(now)
+        return retry_after
+
+    # Counts of the windows, in the format of the count headers.
+    def counts(self):
+        return ",".join(f"{len(times)}:{seconds}" for _, seconds, times in self.windows)
+
+
+class MockServer:
+    """
+    HTTP server of the mock API, running on its own event loop thread.
+
+    Args:
+        world (World): The players and matches served.
+        port (int, optional): Port on localhost. Defaults to 8181.
+        latency (float, optional): Seconds each response waits. Defaults to 0.05.
+        jitter (float, optional): Maximum random seconds added to the latency. Defaults to 0.02.
+        error_rate (float, optional): Fraction of the requests answered with 429. Defaults to 0.
+        app_limit (string, optional): App rate limit of each route. Defaults to 500:10,30000:600.
+        method_limit (string, optional): Method rate limit of each endpoint of each route. Defaults to 2000:10.
+    """
+
+    def __init__(
+        self,
+        world,
+        port=8181,
+        latency=0.05,
+        jitter=0.02,
+        error_rate=0.0,
+        app_limit="500:10,30000:600",
+        method_limit="2000:10",
+    ):
+        self.world = world
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.app_limit = app_limit
+        self.method_limit = method_limit
+        self.limits = {}
+        self.requests = Counter()
+        self.rng = random.Random(0)
+        self.loop = None
+        self.runner = None
+        self.ready = threading.Event()
+
+    # Function to get the limit of a key, created on the first use.
+    def limit(self, key, spec):
+        limit = self.limits.get(key)
+        if limit is None:
+            limit = self.limits[key] = Limit(spec)
+        return limit
+
+    # Function to get the amount of requests of each endpoint and status.
+    def stats(self):
+        return {
+            f"{name} {status}": count for (name, status), count in self.requests.items()
+        }
+
+    # Handler of every request.
+    async def handle(self, request):
+        if request.path == "/_stats":
+            return web.json_response(self.stats())
+        host, endpoint = get_endpoint(f"http://mock{request.path}")
+        route = host.split("/", 1)[1]
+        await asyncio.sleep(self.latency + self.rng.random() * self.jitter)
+
+        now = time.monotonic()
+        app = self.limit(route, self.app_limit)
+        method = self.limit((route, endpoint), self.method_limit)
+        retry_after = app.hit(now)
+        limit_type = "application"
+        if retry_after == 0:
+            retry_after = method.hit(now)
+            limit_type = "method"
+        headers = {
+            "X-App-Rate-Limit": app.spec,
+            "X-App-Rate-Limit-Count": app.counts(),
+            "X-Method-Rate-Limit": method.spec,
+            "X-Method-Rate-Limit-Count": method.counts(),
+        }
+        if retry_after == 0 and self.rng.random() < self.error_rate:
+            retry_after = 1
+            limit_type = "service"
+        if retry_after > 0:
+            headers["Retry-After"] = str(max(1, int(retry_after + 0.999)))
+            headers["X-Rate-Limit-Type"] = limit_type
+            return self.respond(endpoint, 429, None, headers)
+
+        path = request.path[len(route) + 1 :]
+        for name, pattern in routes:
+            found = pattern.match(path)
+            if found:
+                body = self.answer(name, found.groups(), request.query)
+                if body is None:
+                    return self.respond(endpoint, 404, None, headers)
+                return self.respond(endpoint, 200, body, headers)
+        return self.respond(endpoint, 404, None, headers)
+
+    # Function to build a response and count it.
+    def respond(self, endpoint, status, body, headers):
+        self.requests[(endpoint, status)] += 1
+        if body is None:
+            body = json.dumps({"status": {"status_code": status}}).encode()
+        elif not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        return web.Response(
+            body=body, status=status, headers=headers, content_type="application/json"
+        )
+
+    # Function to get the body of a endpoint, None when it's not found.
+    def answer(self, name, groups, query):
+        world = self.world
+        if name == "match_ids":
+            end_time = query.get("endTime")
+            return world.match_ids(
+                groups[0],
+                int(query.get("startTime", 0)),
+                int(end_time) if end_time is not None else None,
+                int(query.get("start", 0)),
+                int(query.get("count", 20)),
+            )
+        if name == "match":
+            return world.match(groups[0])
+        if name == "timeline":
+            return world.timeline(groups[0])
+        if name in ("summoner", "summoner_by_puuid"):
+            players = world.by_summoner if name == "summoner" else world.by_puuid
+            player = players.get(groups[0])
+            return world.summoner(player) if player is not None else None
+        if name == "entries_by_summoner":
+            player = world.by_summoner.get(groups[0])
+            return [world.ratings[player["puuid"]]] if player is not None else []
+        if name == "entries":
+            return world.entries(groups[1], groups[2], int(query.get("page", 1)))
+        if name == "apex":
+            return world.apex(groups[0])
+        return None
+
+    # Coroutine to start the server on the running loop.
+    async def serve(self):
+        app = web.Application()
+        app.router.add_route("GET", "/{tail:.*}", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", self.port).start()
+
+    # Start the server on a daemon thread.
+    def start(self):
+        def run():
+            self.loop = asyncio.new_event_loop()
+            self.loop.run_until_complete(self.serve())
+            self.ready.set()
+            self.loop.run_forever()
+
+        threading.Thread(target=run, name="mock-riot", daemon=True).start()
+        self.ready.wait()
+        return self
+
+    # Stop the server and its thread.
+    def stop(self):
+        if self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+
+# Function to add the arguments of the mock server to a parser.
+def add_arguments(parser):
+    parser.add_argument("--players", type=int, default=2000)
+    parser.add_argument("--matches", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--fixtures", help="Folder of recorded match-v5 payloads, as JSON files."
+    )
+    parser.add_argument("--port", type=int, default=8181)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Fraction of 429 responses."
+    )
+    parser.add_argument("--app-limit", default="500:10,30000:600")
+    parser.add_argument("--method-limit", default="2000:10")
+
+
+# Function to build the server of the parsed arguments.
+def from_arguments(args):
+    world = World(
+        args.players, args.matches, "br1", args.days, args.seed, args.fixtures
+    )
+    return MockServer(
+        world,
+        args.port,
+        args.latency,
+        args.jitter,
+        args.error_rate,
+        args.app_limit,
+        args.method_limit,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock of the RIOT API.")
+    add_arguments(parser)
+    server = from_arguments(parser.parse_args()).start()
+    print(f"Serving the mock API on {server.url}, use API_BASE_URL={server.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
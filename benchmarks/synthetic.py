@@ -0,0 +1,209 @@
+import random
+import string
+import time
+
+"""
+    Generator of synthetic match-v5 payloads, with every field read by the data_treatment module.
+    Used by the benchmarks so they don't need a API key or recorded fixtures.
+"""
+
+positions = ["TOP", "JUNGLE", "MIDDLE", "BOTTOM", "UTILITY"]
+tiers = ["IRON", "BRONZE", "SILVER", "GOLD", "PLATINUM", "EMERALD", "DIAMOND"]
+divisions = ["I", "II", "III", "IV"]
+
+
+# Function to generate a pool of players.
+def make_players(count, platform="br1", seed=0):
+    """
+    Args:
+        count (int): Amount of players.
+        platform (string, optional): Platform of the players. Defaults to br1.
+        seed (int, optional): Seed of the generator. Defaults to 0.
+
+    Returns:
+        List[Dict]: Players with the puuid, summoner id and name.
+    """
+    rng = random.Random(seed)
+    players = []
+    for _ in range(count):
+        players.append(
+            {
+                "puuid": "".join(rng.choices(string.ascii_letters, k=78)),
+                "summonerId": "".join(rng.choices(string.ascii_letters, k=47)),
+                "riotIdGameName": "".join(rng.choices(string.ascii_letters, k=10)),
+                "riotIdTagline": platform.upper()[:3],
+                "platform": platform,
+            }
+        )
+    return players
+
+
+# Function to generate a match payload.
+def make_match(match_id, players, rng=random, game_creation=None):
+    """
+    Args:
+        match_id (string): Id of the match, prefixed by the platform.
+        players (List[Dict]): The 10 participants, as returned by make_players.
+        rng (Random, optional): Random generator. Defaults to the random module.
+        game_creation (int, optional): Start of the match in milliseconds. Defaults to now.
+
+    Returns:
+        Dict: The match payload.
+    """
+    duration = rng.randint(900, 2400)
+    surrender = rng.random() < 0.2
+    blue_win = rng.random() < 0.5
+    participants = []
+    for index, player in enumerate(players):
+        kills, deaths, assists = (
+            rng.randint(0, 15),
+            rng.randint(0, 12),
+            rng.randint(0, 20),
+        )
+        gold = rng.randint(5000, 18000)
+        participants.append(
+            {
+                "puuid": player["puuid"],
+                "summonerId": player["summonerId"],
+                "riotIdGameName": player["riotIdGameName"],
+                "riotIdTagline": player["riotIdTagline"],
+                "profileIcon": rng.randint(1, 6000),
+                "summonerLevel": rng.randint(30, 800),
+                "championId": rng.randint(1, 950),
+                "kills": kills,
+                "deaths": deaths,
+                "assists": assists,
+                "goldEarned": gold,
+                "goldSpent": gold - rng.randint(0, 1000),
+                "totalDamageDealtToChampions": rng.randint(3000, 60000),
+                "neutralMinionsKilled": rng.randint(0, 200),
+                "totalMinionsKilled": rng.randint(0, 300),
+                "visionScore": rng.randint(0, 120),
+                "wardsPlaced": rng.randint(0, 60),
+                "wardsKilled": rng.randint(0, 20),
+                "individualPosition": positions[index % 5],
+                "teamId": 100 if index < 5 else 200,
+                "win": blue_win == (index < 5),
+                "gameEndedInSurrender": surrender,
+                "gameEndedInEarlySurrender": False,
+                "challenges": {
+                    "kda": (kills + assists) / max(1, deaths),
+                    "goldPerMinute": gold / (duration / 60),
+                    "damagePerMinute": rng.uniform(200, 1500),
+                    "visionScorePerMinute": rng.uniform(0.1, 3.5),
+                    "controlWardsPlaced": rng.randint(0, 10),
+                },
+            }
+        )
+    return {
+        "metadata": {
+            "matchId": match_id,
+            "participants": [p["puuid"] for p in players],
+        },
+        "info": {
+            "gameCreation": game_creation or int(time.time() * 1000),
+            "gameDuration": duration,
+            "platformId": match_id.split("_")[0],
+            "queueId": 420,
+            "participants": participants,
+            "teams": [
+                {"teamId": 100, "win": blue_win},
+                {"teamId": 200, "win": not blue_win},
+            ],
+        },
+    }
+
+
+# Function to generate a rating, as returned by the league-v4 entries.
+def make_rating(player, rng=random):
+    """
+    Args:
+        player (Dict): The player, as returned by make_players.
+        rng (Random, optional): Random generator. Defaults to the random module.
+
+    Returns:
+        Dict: The league entry of the soloq.
+    """
+    return {
+        "queueType": "RANKED_SOLO_5x5",
+        "summonerId": player["summonerId"],
+        "puuid": player["puuid"],
+        "tier": rng.choice(tiers),
+        "rank": rng.choice(divisions),
+        "leaguePoints": rng.randint(0, 99),
+        "wins": rng.randint(10, 300),
+        "losses": rng.randint(10, 300),
+    }
+
+
+# Function to generate a timeline payload.
+def make_timeline(match_id, players, minutes=30, rng=random, events_per_frame=30):
+    """
+    Args:
+        match_id (string): Id of the match, prefixed by the platform.
+        players (List[Dict]): The 10 participants, as returned by make_players.
+        minutes (int, optional): Duration of the match. Defaults to 30.
+        rng (Random, optional): Random generator. Defaults to the random module.
+        events_per_frame (int, optional): Amount of events of each frame, not stored but part of the payload. Defaults to 30.
+
+    Returns:
+        Dict: The timeline payload.
+    """
+    state = [{"gold": 500, "xp": 0, "minions": 0, "jungle": 0} for _ in players]
+    frames = []
+    for minute in range(minutes + 1):
+        participant_frames = {}
+        for index, player in enumerate(state):
+            if minute > 0:
+                player["gold"] += rng.randint(200, 600)
+                player["xp"] += rng.randint(200, 700)
+                player["minions"] += rng.randint(0, 10)
+                player["jungle"] += rng.randint(0, 2)
+            participant_frames[str(index + 1)] = {
+                "participantId": index + 1,
+                "totalGold": player["gold"],
+                "currentGold": rng.randint(0, 1500),
+                "goldPerSecond": 0,
+                "xp": player["xp"],
+                "level": min(18, 1 + player["xp"] // 1000),
+                "minionsKilled": player["minions"],
+                "jungleMinionsKilled": player["jungle"],
+                "timeEnemySpentControlled": rng.randint(0, 50000),
+                "position": {"x": rng.randint(0, 14800), "y": rng.randint(0, 14800)},
+                "championStats": {
+                    f"stat{stat}": rng.randint(0, 5000) for stat in range(25)
+                },
+                "damageStats": {
+                    f"damage{stat}": rng.randint(0, 50000) for stat in range(12)
+                },
+            }
+        events = [
+            {
+                "type": rng.choice(["ITEM_PURCHASED", "SKILL_LEVEL_UP", "WARD_PLACED"]),
+                "timestamp": minute * 60000 + rng.randint(0, 59999),
+                "participantId": rng.randint(1, 10),
+                "itemId": rng.randint(1000, 7000),
+            }
+            for _ in range(events_per_frame)
+        ]
+        frames.append(
+            {
+                "timestamp": minute * 60000,
+                "participantFrames": participant_frames,
+                "events": events,
+            }
+        )
+    return {
+        "metadata": {
+            "matchId": match_id,
+            "participants": [p["puuid"] for p in players],
+        },
+        "info": {
+            "frameInterval": 60000,
+            "frames": frames,
+            "participants": [
+                {"participantId": index + 1, "puuid": p["puuid"]}
+                for index, p in enumerate(players)
+            ],
+        },
+    }
@@ -0,0 +1,211 @@
+import asyncio
+import os
+import metrics
+
+"""
+    Module with the adaptive concurrency of the crawler, following an AIMD (additive increase, multiplicative decrease)
+    controller as the one of TCP congestion control.
+    The requests of the fetch stage and the blocking database calls each run inside an AdaptiveLimit, a semaphore whose
+    size can change while it's used. Every CONCURRENCY_INTERVAL seconds the controller reads the metrics of the last
+    interval: the fetch limit is cut on any 429 or 5xx response or when the pool wait rises, and grows by one while
+    the latency stays healthy and every slot was used. The database limit is cut when the latency of the queries or
+    the pool wait rises, and grows by one while both stay healthy and every slot was used.
+    The pool wait is only the wait for a connection of the pool, the wait for a slot of the database limit is left out
+    since it's caused by the limit itself.
+    The current and target concurrency of each limit are served on the metrics, to watch them converge.
+"""
+
+# Seconds between the adjustments of the limits.
+concurrency_interval = float(os.getenv("CONCURRENCY_INTERVAL", 5))
+
+# Initial amount of requests of the fetch stage running at the same time, bounded by FETCH_WORKERS.
+concurrency_initial = int(os.getenv("CONCURRENCY_INITIAL", 8))
+
+# Minimum amount of slots of each limit.
+concurrency_min = int(os.getenv("CONCURRENCY_MIN", 1))
+
+# Slots added after a healthy interval.
+concurrency_increase = float(os.getenv("CONCURRENCY_INCREASE", 1))
+
+# Factor applied to the slots after a unhealthy interval.
+concurrency_decrease = float(os.getenv("CONCURRENCY_DECREASE", 0.5))
+
+# How many times the baseline latency can be reached before the interval is unhealthy.
+concurrency_latency_tolerance = float(os.getenv("CONCURRENCY_LATENCY_TOLERANCE", 2))
+
+# Average seconds of pool wait below which the pool wait isn't considered rising, no matter the baseline.
+concurrency_pool_wait = float(os.getenv("CONCURRENCY_POOL_WAIT", 0.01))
+
+
+class AdaptiveLimit:
+    """
+    Semaphore whose amount of slots can be resized while it's used, used as a async context manager.
+    Shrinking it doesn't interrupt the holders, the new ones only enter once the holders are below the new size.
+
+    Args:
+        name (string): Name of the limit on the metrics.
+        limit (int): Initial amount of slots.
+        minimum (int): Minimum amount of slots.
+        maximum (int): Maximum amount of slots.
+    """
+
+    def __init__(self, name, limit, minimum, maximum):
+        self.name = name
+        self.minimum = max(1, min(minimum, maximum))
+        self.maximum = maximum
+        # The target is kept as a float, so the fractions of the decreases aren't lost.
+        self.target = float(min(max(limit, self.minimum), self.maximum))
+        self.active = 0
+        # Largest amount of holders since the last adjustment, to know if the limit was reached.
+        self.peak = 0
+        self.condition = asyncio.Condition()
+
+    # Amount of slots currently allowed.
+    @property
+    def limit(self):
+        return int(self.target)
+
+    async def __aenter__(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    async def __aexit__(self, *exc):
+        async with self.condition:
+            self.active -= 1
+            self.condition.notify()
+
+    # Coroutine to change the amount of slots, waking the waiters when it grows.
+    async def resize(self, target):
+        async with self.condition:
+            self.target = float(min(max(target, self.minimum), self.maximum))
+            self.condition.notify_all()
+
+    # Coroutine to add slots after a healthy interval, only when every slot was used.
+    async def increase(self):
+        if self.peak >= self.limit:
+            await self.resize(self.target + concurrency_increase)
+
+    # Coroutine to cut the slots after a unhealthy interval.
+    async def decrease(self):
+        await self.resize(self.target * concurrency_decrease)
+
+    # Values of the concurrency gauge.
+    def values(self):
+        return {
+            (self.name, "current"): self.active,
+            (self.name, "target"): self.limit,
+        }
+
+
+class Baseline:
+    """
+    Usual value of a average, following the drops right away and the rises slowly.
+    A value above the tolerance times the baseline, and above the floor, is rising.
+
+    Args:
+        floor (float, optional): Value that is never considered rising.
+    """
+
+    def __init__(self, floor=0.0):
+        self.floor = floor
+        self.value = None
+
+    # Function to add the average of a interval.
+    def rising(self, average):
+        """
+        Returns:
+            bool: True if the average is above the tolerance, in which case the baseline doesn't move.
+        """
+        if self.value is None:
+            self.value = average
+            return False
+        if average > max(self.value * concurrency_latency_tolerance, self.floor):
+            return True
+        self.value = min(average, self.value + (average - self.value) * 0.1)
+        return False
+
+
+class Controller:
+    """
+    AIMD controller of the limits of the fetch stage and of the database calls, adjusted from the metrics.
+
+    Args:
+        fetch_limit (AdaptiveLimit): Limit of the requests of the fetch stage.
+        db_limit (AdaptiveLimit): Limit of the blocking database calls.
+    """
+
+    def __init__(self, fetch_limit, db_limit):
+        self.fetch_limit = fetch_limit
+        self.db_limit = db_limit
+        self.api_latency = Baseline()
+        self.db_latency = Baseline()
+        self.pool_wait = Baseline(concurrency_pool_wait)
+        self.last = self.snapshot()
+
+    # Totals of the metrics used by the controller.
+    def snapshot(self):
+        return {
+            "throttled": metrics.api_requests.total_where(
+                lambda labels: int(labels[1]) == 429 or int(labels[1]) >= 500
+            ),
+            "api": metrics.api_latency.totals(),
+            "db": metrics.db_latency.totals(),
+            "pool": metrics.db_pool_wait.totals(),
+        }
+
+    # Average of the observations between two totals of a histogram, None without observations.
+    @staticmethod
+    def average(current, last):
+        count = current[1] - last[1]
+        return (current[0] - last[0]) / count if count else None
+
+    # Coroutine to adjust the limits from the metrics of the last interval.
+    async def adjust(self):
+        current = self.snapshot()
+        last, self.last = self.last, current
+        api = self.average(current["api"], last["api"])
+        db = self.average(current["db"], last["db"])
+        pool = self.average(current["pool"], last["pool"])
+        throttled = current["throttled"] > last["throttled"]
+        api_rising = api is not None and self.api_latency.rising(api)
+        db_rising = db is not None and self.db_latency.rising(db)
+        pool_rising = pool is not None and self.pool_wait.rising(pool)
+
+        if throttled or pool_rising:
+            await self.fetch_limit.decrease()
+        elif api is not None and not api_rising:
+            await self.fetch_limit.increase()
+
+        if db_rising or pool_rising:
+            await self.db_limit.decrease()
+        elif db is not None:
+            await self.db_limit.increase()
+
+        for limit in (self.fetch_limit, self.db_limit):
+            limit.peak = limit.active
+
+    # Coroutine that adjusts the limits periodically, until cancelled.
+    async def run(self, interval=None):
+        """
+        Args:
+            interval (float, optional): Seconds between the adjustments. Defaults to CONCURRENCY_INTERVAL.
+        """
+        interval = concurrency_interval if interval is None else interval
+        if interval <= 0:
+            return
+        metrics.concurrency.track(self.values)
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    await self.adjust()
+                except Exception as e:
+                    print("Error adjusting the concurrency: ", e)
+        finally:
+            metrics.concurrency.untrack(self.values)
+
+    # Values of the concurrency gauge.
+    def values(self):
+        return {**self.fetch_limit.values(), **self.db_limit.values()}
@@ -0,0 +1,624 @@
+import asyncio
+import os
+from data_treatment import *
+from db_operations import *
+from fetch import *
+from datetime import datetime, timedelta
+import leases
+import pending
+import metrics
+import time
+from archive import close_archive, get_archive
+from frontier import Frontier
+from match_schema import decode_match
+from timeline import fetch_timelines, get_timeline_row, parse_timeline
+from match_filter import KnownMatches, use_bloom_filter
+from pipeline import Pipeline, Stage
+from concurrency import AdaptiveLimit, Controller, concurrency_initial, concurrency_min
+from concurrent.futures import ThreadPoolExecutor
+from ratings import RatingService, rated_on_db, rating_ttl
+from writer import MatchWriter, parsed_match
+from routing import get_platforms, group_by_region
+
+# Amount of workers of each stage of the pipeline of a region, the requests of the fetch workers being limited by the concurrency controller.
+discovery_workers = int(os.getenv("DISCOVERY_WORKERS", 4))
+fetch_workers = int(os.getenv("FETCH_WORKERS", 50))
+transform_workers = int(os.getenv("TRANSFORM_WORKERS", 1))
+rating_workers = int(os.getenv("RATING_WORKERS", 20))
+write_workers = int(os.getenv("WRITE_WORKERS", 1))
+
+# Days of each window of the match list of a backfill, the windows being fetched in parallel.
+match_list_window_days = int(os.getenv("MATCH_LIST_WINDOW_DAYS", 30))
+
+# Amount of windows of a backfill fetched at the same time.
+match_list_parallelism = int(os.getenv("MATCH_LIST_PARALLELISM", 4))
+
+# Maximum amount of items waiting on each stage of the pipeline.
+stage_queue_size = int(os.getenv("STAGE_QUEUE_SIZE", 100))
+
+# Enables the bulk refresh of the ratings of every player of the crawled platforms, once every rating TTL.
+rating_bulk_refresh = os.getenv("RATING_BULK_REFRESH", "0") == "1"
+
+# Limits the blocking database calls running at the same time, up to the size of the connection pool.
+db_slots = None
+
+# Limits the requests of the fetch stages running at the same time, shared by every region.
+fetch_slots = None
+
+# Matches already inserted or being inserted by the process, shared by every region.
+known_matches = KnownMatches()
+
+# Writer of the parsed matches, started by the crawl.
+writer = None
+
+# Ratings of the players, shared by every region.
+ratings = RatingService()
+
+
+# Function to run a blocking database operation without blocking the event loop.
+async def run_db(function, *args):
+    """
+    Runs a function from the db_operations module on a thread, waiting for a free connection of the pool first.
+
+    Args:
+        function (function): The database function to run.
+        *args: Arguments passed to the function.
+
+    Returns:
+        Any: The value returned by the function.
+    """
+    started = time.perf_counter()
+    async with db_slots:
+        metrics.db_slot_wait.observe(time.perf_counter() - started)
+        return await asyncio.to_thread(function, *args)
+
+
+class PlayerProgress:
+    """
+    Player whose match list is being processed, keeping track of the matches that didn't reach the end of the pipeline.
+    """
+
+    def __init__(
+        self, puuid, platform, since, last_match_id=None, backfill=False, seed=False
+    ):
+        self.puuid = puuid
+        self.platform = platform
+        # Start of the match list, the high-water mark of the player or the default fetch date for a backfill.
+        self.since = since
+        # Newest match of the last completed match list of the player, where the match list stops.
+        self.last_match_id = last_match_id
+        # Newest match of the current match list, the next high-water mark.
+        self.newest = None
+        self.backfill = backfill
+        # Seed players don't come from the frontier, their last_fetch is updated on their own.
+        self.seed = seed
+        self.pending = 0
+        self.listed = False
+        # Matches that failed, and matches waiting for their next attempt on the pending queue.
+        self.failed = 0
+        self.waiting = 0
+        # Matches leased for the player, released once they reach the end of the pipeline.
+        self.matches = []
+        # Matches seen on the match list, new matches found and calls made, used to schedule the player.
+        self.seen = 0
+        self.found = 0
+        self.calls = 0
+
+
+class MatchTask:
+    """
+    Match flowing through the pipeline, filled by each stage.
+    """
+
+    __slots__ = (
+        "match_id",
+        "player",
+        "data",
+        "timeline",
+        "info",
+        "players",
+        "stats",
+        "parsed",
+    )
+
+    def __init__(self, match_id, player):
+        self.match_id = match_id
+        self.player = player
+        self.data = None
+        self.timeline = None
+        self.info = None
+        self.players = None
+        self.stats = None
+        self.parsed = None
+
+
+# Coroutine to get the new matches of a window of the match list of a player.
+async def fetch_match_pages(puuid, start_date, end_date, platform, stop_at, claimed):
+    """
+    Pages the match list from the newest match, 100 ids at a time, keeping the ids that aren't known.
+
+    Args:
+        puuid (string): The player whose matches will be fetched.
+        start_date (datetime): Only matches after it are returned.
+        end_date (datetime): Only matches before it are returned, None for no limit.
+        platform (string): Platform of the player.
+        stop_at (string): Match where the match list stops, the older ones being listed before. None to list them all.
+        claimed (List[string]): Receives the ids claimed as known, so they can be discarded if the match list fails.
+
+    Returns:
+        Tuple[List[string], int, int, string]: The ids of the new matches found, the amount of ids listed, the amount of calls and the newest id listed, None if empty.
+    """
+    # The count keeps track of the current depth of the match list.
+    match_list = []
+    count = 0
+    calls = 0
+    newest = None
+    while True:
+        matches = await fetch_matches_async(
+            puuid, count, start_date, platform, end_date
+        )
+        calls += 1
+        metrics.list_calls.inc()
+        # A partial match list would let the last_fetch skip the matches of the missing pages.
+        if matches is None:
+            raise Exception("Could not fetch the match list")
+        if count == 0 and matches:
+            newest = matches[0]
+        # The matches from the one where it stops were listed by the last match list of the player.
+        reached = stop_at is not None and stop_at in matches
+        listed = len(matches)
+        if reached:
+            matches = matches[: matches.index(stop_at)]
+        new_matches = await run_db(known_matches.filter_new, matches)
+        metrics.new_matches_listed.inc(len(new_matches))
+        claimed.extend(new_matches)
+        match_list.extend(new_matches)
+        # If the retrieved matches has 100 matches, then we go to the next iteration to get the remaining.
+        if listed < 100 or reached:
+            break
+        count += 100
+    return match_list, count + len(matches), calls, newest
+
+
+# Coroutine to get the new matches of a player.
+async def fetch_match_list(puuid, since, platform, last_match_id=None, backfill=False):
+    """
+    Gets the match list of the player since the given date, dropping the matches already known.
+    A backfill is split into windows of MATCH_LIST_WINDOW_DAYS, the newest ones first, with MATCH_LIST_PARALLELISM windows
+    fetched at the same time. Otherwise the match list starts at the high-water mark of the player and stops on the
+    page with the newest match of its last completed match list. The matches known from the match lists of other
+    players don't stop it, since they can be claimed by matches still being fetched.
+
+    Args:
+        puuid (string): The player whose matches will be fetched.
+        since (datetime): Only matches after it are returned.
+        platform (string): Platform of the player.
+        last_match_id (string, optional): Newest match of the last completed match list of the player. Defaults to None.
+        backfill (bool, optional): The player was never fetched and its whole match list is needed. Defaults to False.
+
+    Returns:
+        Tuple[List[string], int, int, string]: The ids of the new matches found, claimed as known, the amount of ids listed, the amount of calls and the newest id listed.
+    """
+    claimed = []
+    now = datetime.now()
+    window = timedelta(days=match_list_window_days)
+    try:
+        if not backfill or now - since <= window:
+            return await fetch_match_pages(
+                puuid, since, None, platform, last_match_id, claimed
+            )
+        windows = []
+        end = now
+        while end > since:
+            windows.append((max(since, end - window), end))
+            end -= window
+        match_list = []
+        seen = calls = 0
+        newest = None
+        for index in range(0, len(windows), match_list_parallelism):
+            results = await asyncio.gather(
+                *(
+                    fetch_match_pages(
+                        puuid, start, end, platform, last_match_id, claimed
+                    )
+                    for start, end in windows[index : index + match_list_parallelism]
+                ),
+                return_exceptions=True,
+            )
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+                match_list.extend(result[0])
+                seen += result[1]
+                calls += result[2]
+                # The windows are sorted from the newest.
+                newest = newest or result[3]
+        return match_list, seen, calls, newest
+    except BaseException:
+        # The matches of a failed match list are listed again with the player.
+        for match in claimed:
+            known_matches.discard(match)
+        raise
+
+
+class RegionCrawler:
+    """
+    Crawler of a single region, made of a pipeline with the following stages:
+    discovery (player => new match ids), fetch (match id => payload), transform (payload => rows),
+    rating (rows => rows with the ratings of the players) and write (rows => writer).
+
+    Every request of the region goes to its own hosts, so each region runs with an independent rate limit budget.
+
+    Args:
+        region (string): The regional cluster being crawled.
+        platforms (List[string]): The platforms of the region that are crawled.
+    """
+
+    def __init__(self, region, platforms):
+        self.region = region
+        self.platforms = platforms
+        # Players to fetch, read from the database in batches.
+        self.frontier = Frontier(platforms)
+        # Updates of the last_fetch that didn't finish yet.
+        self.updates = set()
+        self.pipeline = Pipeline(
+            [
+                Stage("discovery", self.discover, discovery_workers, discovery_workers),
+                Stage("fetch", self.fetch, fetch_workers, stage_queue_size),
+                Stage("transform", self.transform, transform_workers, stage_queue_size),
+                Stage("rating", self.rate, rating_workers, stage_queue_size),
+                Stage("write", self.write, write_workers, stage_queue_size),
+            ],
+            self.on_error,
+        )
+
+    # Coroutine that feeds the pipeline with the players to fetch.
+    async def feed(self):
+        """
+        Infinite loop that gets the next player of the region and puts it on the pipeline, waiting while the discovery stage is full.
+        The platforms without players start from the top one of their soloq, only used until the players of their matches are inserted.
+        """
+        seeds = []
+        fetch_date = await run_db(get_default_fetch_date)
+        for platform in self.platforms:
+            if await run_db(empty_db, platform):
+                seeds.append(
+                    (await fetch_top_challenger_async(platform), platform, fetch_date)
+                )
+
+        # Infinite loop to get the data.
+        while True:
+            progress = None
+            # Try to get the next player from the frontier.
+            try:
+                if seeds:
+                    seed = seeds.pop()
+                    # Another process could be starting from the same player.
+                    if await run_db(leases.claim, "player", [seed[0]]):
+                        progress = PlayerProgress(*seed, backfill=True, seed=True)
+                    else:
+                        continue
+                else:
+                    player = await self.frontier.next(run_db)
+                    if player is not None:
+                        progress = PlayerProgress(*player)
+            except Exception as e:
+                print(f"Error getting next player of {self.region}:", e)
+            if progress is None:
+                print(f"No players to fetch on {self.region}, waiting...")
+                await asyncio.sleep(10)
+                continue
+            await self.pipeline.put(progress)
+
+    # Discovery stage, emits the matches of a player that aren't on the database.
+    async def discover(self, progress, emit):
+        # A player with pending matches resumes from the queue instead of listing its matches again.
+        match_list, waiting = await run_db(pending.resume, progress.puuid)
+        if match_list or waiting:
+            # Matches inserted through the match list of another player leave the queue.
+            existing = await run_db(get_existing_matches, match_list)
+            await run_db(pending.drop, list(existing))
+            match_list = [match for match in match_list if match not in existing]
+            match_list = await run_db(known_matches.filter_new, match_list)
+        else:
+            # The matches already inserted are dropped while listing.
+            match_list, progress.seen, progress.calls, progress.newest = (
+                await fetch_match_list(
+                    progress.puuid,
+                    progress.since,
+                    progress.platform,
+                    progress.last_match_id,
+                    progress.backfill,
+                )
+            )
+            progress.found = len(match_list)
+            # The match list is stored before any match is fetched, so a crash doesn't lose it.
+            match_list, waiting = await run_db(
+                pending.enqueue, progress.puuid, progress.platform, match_list
+            )
+        progress.waiting = len(waiting)
+        # Matches leased by other processes are fetched by them.
+        leased = await run_db(leases.claim, "match", match_list)
+        for match in set(match_list).difference(leased):
+            known_matches.discard(match)
+        match_list = progress.matches = leased
+        progress.pending = len(match_list)
+        for match in match_list:
+            await emit(MatchTask(match, progress))
+        progress.listed = True
+        self.check_player(progress)
+
+    # Fetch stage, gets the payload of the match, and of its timeline when enabled.
+    async def fetch(self, task, emit):
+        async with fetch_slots:
+            if fetch_timelines:
+                task.data, task.timeline = await asyncio.gather(
+                    fetch_match_raw_async(task.match_id),
+                    fetch_timeline_raw_async(task.match_id),
+                )
+            else:
+                task.data = await fetch_match_raw_async(task.match_id)
+        if task.data is None:
+            raise Exception("Could not fetch the match data")
+        await emit(task)
+
+    # Transform stage, decodes the fields used from the payload and extracts the rows.
+    async def transform(self, task, emit):
+        with metrics.parse_latency.time():
+            task.info, task.players, task.stats = get_match_rows(
+                decode_match(task.data)
+            )
+            # A match without timeline is still stored.
+            if task.timeline is not None:
+                try:
+                    task.timeline = get_timeline_row(parse_timeline(task.timeline))
+                except Exception as e:
+                    metrics.errors.inc(1, "timeline", type(e).__name__)
+                    print(f"Error parsing the timeline of {task.match_id}: ", e)
+                    task.timeline = None
+        # The payload isn't needed anymore, release it before waiting on the next queue.
+        task.data = None
+        await emit(task)
+
+    # Rating stage, gets the rating of the players that weren't rated in the rating TTL.
+    async def rate(self, task, emit):
+        players = task.players
+        # Usually answered by the id cache, otherwise a single query.
+        existing = await run_db(resolve_player_ids, [p["puuid"] for p in players])
+        # Players on the database that weren't rated by the process, checked with a single query.
+        unknown = [
+            p
+            for p in players
+            if p["puuid"] in existing and not ratings.is_fresh(p["summoner_id"])
+        ]
+        if unknown:
+            last_ratings = await run_db(get_last_ratings, [p["puuid"] for p in unknown])
+            for player in unknown:
+                last_rating = last_ratings.get(player["puuid"])
+                if last_rating is not None:
+                    ratings.put(
+                        player["summoner_id"], rated_on_db, last_rating.timestamp()
+                    )
+
+        # The new players always need a rating, the ones on the database only when it's outdated.
+        to_rate = [
+            p
+            for p in players
+            if p["puuid"] not in existing or not ratings.is_fresh(p["summoner_id"])
+        ]
+        fetched = await asyncio.gather(
+            *(ratings.get(p["summoner_id"], p["platform"]) for p in to_rate)
+        )
+
+        new_p_info = []
+        rating_updates = []
+        for player, p_rating in zip(to_rate, fetched):
+            if player["puuid"] in existing:
+                # Unranked players keep the last rating they had.
+                if p_rating is not None:
+                    rating_updates.append((p_rating, player["puuid"]))
+                continue
+            if p_rating is not None:
+                player.update(p_rating)
+            new_p_info.append(player)
+        task.parsed = parsed_match(
+            task.info, new_p_info, task.stats, rating_updates, task.timeline
+        )
+        await emit(task)
+
+    # Write stage, hands the match to the writer.
+    async def write(self, task, emit):
+        # Submitting blocks while the writer queue is full, so it runs on a thread.
+        written = await asyncio.to_thread(writer.submit, task.parsed)
+        loop = asyncio.get_running_loop()
+        written.add_done_callback(
+            lambda future: loop.call_soon_threadsafe(self.written, task, future)
+        )
+
+    # Called on the event loop once the batch of the match is committed or failed.
+    def written(self, task, future):
+        # The errors of the writes are counted by the writer.
+        if future.exception() is not None:
+            known_matches.discard(task.match_id)
+            print(
+                "Error getting data from the match:",
+                task.match_id,
+                " with error: ",
+                future.exception(),
+            )
+            self.record_failure(task, future.exception())
+        else:
+            print("Finished data fetching from the match:", task.match_id)
+        task.player.pending -= 1
+        self.check_player(task.player)
+
+    # Called when a handler raises, the item is dropped.
+    def on_error(self, stage, item, e):
+        metrics.errors.inc(1, stage.name, type(e).__name__)
+        if isinstance(item, PlayerProgress):
+            print(f"Error getting the match list of {item.puuid}: ", e)
+            self.frontier.release(item.puuid)
+            return
+        known_matches.discard(item.match_id)
+        print("Error getting data from the match:", item.match_id, " with error: ", e)
+        self.record_failure(item, e)
+        item.player.pending -= 1
+        self.check_player(item.player)
+
+    # Count the failed attempt of a match on the pending queue, the player is only completed once the match is inserted.
+    def record_failure(self, task, e):
+        task.player.failed += 1
+        update = asyncio.create_task(self.fail_match(task.match_id, e))
+        self.updates.add(update)
+        update.add_done_callback(self.updates.discard)
+
+    # Coroutine to store the failed attempt of a match.
+    async def fail_match(self, match_id, e):
+        try:
+            await run_db(pending.fail, match_id, e)
+        except Exception as error:
+            print(f"Error storing the failed attempt of {match_id}: ", error)
+
+    # Update the last_fetch of the player once every match reached the end of the pipeline.
+    def check_player(self, progress):
+        if not progress.listed or progress.pending > 0:
+            return
+        update = asyncio.create_task(self.finish_player(progress))
+        self.updates.add(update)
+        update.add_done_callback(self.updates.discard)
+
+    # Coroutine to update the last_fetch of a finished player, together with the other completed ones.
+    async def finish_player(self, progress):
+        try:
+            await run_db(leases.release, "match", progress.matches)
+            # The last_fetch stays until every match is inserted, the player is resumed from the pending queue.
+            if progress.failed or progress.waiting:
+                if progress.seed:
+                    await run_db(leases.release, "player", [progress.puuid])
+                else:
+                    self.frontier.release(progress.puuid)
+            elif progress.seed:
+                await run_db(update_fetch_date, progress.puuid, progress.newest)
+                await run_db(leases.release, "player", [progress.puuid])
+            elif self.frontier.complete(
+                progress.puuid,
+                progress.seen,
+                progress.found,
+                progress.calls,
+                progress.newest,
+            ):
+                await run_db(self.frontier.flush)
+        except Exception as e:
+            print(f"Error updating the fetch date of {progress.puuid}: ", e)
+
+    # Coroutine that refreshes the ratings of the platforms from the league entries.
+    async def refresh_ratings(self):
+        while True:
+            for platform in self.platforms:
+                try:
+                    await ratings.refresh_platform(platform, run_db)
+                except Exception as e:
+                    print(f"Error refreshing the ratings of {platform}: ", e)
+            await asyncio.sleep(rating_ttl)
+
+    # Amount of items waiting on each stage, for the queue depth metric.
+    def depths(self):
+        return {
+            (self.region, stage): depth
+            for stage, depth in self.pipeline.depths().items()
+        }
+
+    # Coroutine to run the crawler until it's cancelled.
+    async def run(self):
+        self.pipeline.start()
+        if rating_bulk_refresh:
+            refresh = asyncio.create_task(self.refresh_ratings())
+            try:
+                await self.feed()
+            finally:
+                refresh.cancel()
+        else:
+            await self.feed()
+
+    # Coroutine to stop the crawler.
+    async def stop(self):
+        """
+        Stops getting new players and drains the pipeline, so the matches already in flight are handed to the writer.
+        The players waiting for discovery are dropped, they will be the next ones on the following run.
+        """
+        for progress in await self.pipeline.drain(drop_first=True):
+            self.frontier.release(progress.puuid)
+
+    # Coroutine to wait for the last_fetch updates, after the writer is stopped.
+    async def wait_updates(self):
+        await asyncio.gather(*self.updates, return_exceptions=True)
+        # Update the players completed since the last flush.
+        try:
+            await run_db(self.frontier.flush)
+        except Exception as e:
+            print(f"Error updating the fetch dates of {self.region}: ", e)
+
+
+# Main crawl loop.
+async def crawl(platforms=None):
+    """
+    Runs one crawler per regional cluster of the platforms, all of them on the same event loop.
+    The throughput grows with the amount of regions, since the API limits are per host.
+    When cancelled, the matches in flight are written before returning.
+
+    Args:
+        platforms (List[string], optional): The platforms to crawl. Defaults to the PLATFORMS on the enviroment.
+    """
+    global db_slots, fetch_slots, writer
+    # One connection of the pool is kept for the writer, the pool being the maximum of the database limit.
+    # It starts from half of the pool, so the controller can raise it while the queries stay fast.
+    db_slots = AdaptiveLimit(
+        "db", (pool_size - 1) // 2, concurrency_min, max(1, pool_size - 1)
+    )
+    fetch_slots = AdaptiveLimit(
+        "fetch", concurrency_initial, concurrency_min, fetch_workers
+    )
+    # The threads of the database calls are bounded by the database limit, with a few more for the archive and DNS.
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=pool_size + 4)
+    )
+    if platforms is None:
+        platforms = get_platforms()
+
+    writer = MatchWriter().start()
+    crawlers = [
+        RegionCrawler(region, group)
+        for region, group in group_by_region(platforms).items()
+    ]
+    keep_alive = asyncio.create_task(leases.keep_alive(run_db))
+    # The queue of the writer is shared by every region.
+    writer_depth = lambda: {("all", "writer"): writer.queue.qsize()}
+    for depth in [writer_depth] + [crawler.depths for crawler in crawlers]:
+        metrics.queue_depth.track(depth)
+    report = asyncio.create_task(metrics.report())
+    controller = asyncio.create_task(Controller(fetch_slots, db_slots).run())
+    try:
+        if use_bloom_filter:
+            await run_db(known_matches.warm)
+        # Loading the index of the archive reads every segment index, so it's done before the crawl starts.
+        await asyncio.to_thread(get_archive)
+        await asyncio.gather(*(crawler.run() for crawler in crawlers))
+    finally:
+        # Drain the matches in flight and write them before leaving.
+        for crawler in crawlers:
+            await crawler.stop()
+        await asyncio.to_thread(writer.stop)
+        for crawler in crawlers:
+            await crawler.wait_updates()
+        keep_alive.cancel()
+        report.cancel()
+        controller.cancel()
+        for depth in [writer_depth] + [crawler.depths for crawler in crawlers]:
+            metrics.queue_depth.untrack(depth)
+        # The players left on the frontiers can be taken by the other processes.
+        try:
+            await run_db(leases.release_all)
+        except Exception as e:
+            print("Error releasing the leases: ", e)
+        await close_session()
+        close_archive()
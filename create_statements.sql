@@ -5,6 +5,8 @@ CREATE TABLE IF NOT EXISTS tb_player_info (
     id INT PRIMARY KEY AUTO_INCREMENT,
     /*Unique identifier for the player (Globally).*/
     puuid CHAR(78) UNIQUE NOT NULL,
+    /*Platform of the account (br1, na1, euw1, ...), used to route the requests of the player.*/
+    platform VARCHAR(4) NOT NULL DEFAULT 'br1',
     /*Unique identifier for the account (Locally)*/
     summoner_id VARCHAR(63),
     /*Name of the player inGame. Being inserted on the name at the time.*/
@@ -34,7 +36,21 @@ CREATE TABLE IF NOT EXISTS tb_player_info (
     /*Last time the data of the player was fetched, used to mantain the fetch up to date.*/
     last_fetch TIMESTAMP DEFAULT "2024-03-06 00:00:00",
     /*Last day the rating of the player was fetched, blocks multiple API calls that are unecessary.*/
-    last_rating TIMESTAMP DEFAULT "2024-03-06 00:00:00"
+    last_rating TIMESTAMP DEFAULT "2024-03-06 00:00:00",
+    /*Next time the player is due to be fetched, set by the adaptive schedule of the crawler.*/
+    next_fetch TIMESTAMP DEFAULT "2024-03-06 00:00:00",
+    /*Average of the matches played per day, observed on the match lists of the player.*/
+    match_rate FLOAT,
+    /*Average of the new matches found per call to the match list of the player.*/
+    list_yield FLOAT,
+    /*Newest match of the last match list of the player that was completed, where its next match list stops.*/
+    last_match_id VARCHAR(20),
+    /*Used by the bulk rating refresh, whose league entries may only carry the summoner id.*/
+    INDEX idx_summoner_id (summoner_id),
+    /*Used by the crawl frontier, which reads the players of a platform in last_fetch order.*/
+    INDEX idx_platform_last_fetch (platform, last_fetch),
+    /*Used by the crawl frontier, which reads the players of a platform that are due in next_fetch order.*/
+    INDEX idx_platform_next_fetch (platform, next_fetch)
 );
 
 /*Create statement for storing the match information.*/
@@ -52,7 +68,9 @@ create table IF NOT EXISTS tb_match_info(
     /*Match resulted on surrender.*/
     match_surrender boolean,
     /*Match resulted on remake. Preferably not use remaked matches when analysing the data.*/
-    match_remake boolean
+    match_remake boolean,
+    /*Used by the reads of a range of dates.*/
+    INDEX idx_match_start (match_start)
 );
 
 /*Create statement for storing the individual perfomance of each player in a given match.*/
@@ -102,5 +120,92 @@ create table IF NOT EXISTS tb_player_stats (
     FOREIGN KEY (match_id) references tb_match_info(id),
     /*Unique composite key to avoid the same player being added twich from a match he already played.*/
     /*This should not happen normally.*/
-    UNIQUE KEY (player_id, match_id)
-);
\ No newline at end of file
+    UNIQUE KEY (player_id, match_id),
+    /*Used by the reads of the stats of a champion.*/
+    INDEX idx_champion_position (champion_id, individual_position)
+);
+/*Create statement for the leases of the work shared by many crawler processes.*/
+/*A row is held by a single process until it's released or expires, so two processes never fetch the same player or match.*/
+CREATE TABLE IF NOT EXISTS tb_lease (
+    /*Kind of the work, such as player or match.*/
+    kind VARCHAR(8) NOT NULL,
+    /*Natural key of the work, the puuid of the player or the id of the match.*/
+    lease_key VARCHAR(78) NOT NULL,
+    /*Process holding the lease, as host:pid.*/
+    owner VARCHAR(100) NOT NULL,
+    /*After this time the lease can be taken by another process.*/
+    expires_at DATETIME NOT NULL,
+    PRIMARY KEY (kind, lease_key),
+    INDEX idx_owner (owner),
+    INDEX idx_expires_at (expires_at)
+);
+
+/*Create statement for storing the timeline of the matches, a single row per match.*/
+/*Keyed by the original ID of the match without a foreign key, so the rows stay valid when the match tables are swapped by a reprocess.*/
+CREATE TABLE IF NOT EXISTS tb_match_timeline (
+    /*Original ID of the match.*/
+    match_id VARCHAR(20) PRIMARY KEY,
+    /*Amount of participants and of frames (minutes) of the timeline.*/
+    participants TINYINT UNSIGNED,
+    frames SMALLINT UNSIGNED,
+    /*Gold, xp, cs and position of each participant by minute, packed by the timeline module. Read with its accessor functions.*/
+    data MEDIUMBLOB
+);
+
+/*Create statement for the aggregated stats of each champion, position, tier and day, kept up to date as the matches are inserted.*/
+/*The sums are stored instead of the averages, so each batch of matches is added without reading the stats again.*/
+CREATE TABLE IF NOT EXISTS tb_champion_stats (
+    /*Day of the start of the matches.*/
+    day DATE NOT NULL,
+    champion_id SMALLINT UNSIGNED NOT NULL,
+    position ENUM(
+        'TOP',
+        'JUNGLE',
+        'MIDDLE',
+        'BOTTOM',
+        'UTILITY',
+        'Invalid'
+    ) NOT NULL,
+    /*Tier of the player when the match was inserted, UNRANKED for players without rating. A rebuild of the aggregates uses the current tier of the players instead, moving the past days to it.*/
+    tier ENUM(
+        'IRON',
+        'BRONZE',
+        'SILVER',
+        'GOLD',
+        'PLATINUM',
+        'EMERALD',
+        'DIAMOND',
+        'MASTER',
+        'GRANDMASTER',
+        'CHALLENGER',
+        'UNRANKED'
+    ) NOT NULL,
+    games INT UNSIGNED NOT NULL,
+    wins INT UNSIGNED NOT NULL,
+    kills INT UNSIGNED NOT NULL,
+    deaths INT UNSIGNED NOT NULL,
+    assists INT UNSIGNED NOT NULL,
+    /*Sums of the per game values, divided by the games to get the averages.*/
+    kda_sum DOUBLE NOT NULL,
+    gold_per_minute_sum DOUBLE NOT NULL,
+    cs_per_min_sum DOUBLE NOT NULL,
+    PRIMARY KEY (day, champion_id, position, tier),
+    INDEX idx_champion (champion_id, position, tier, day)
+);
+
+/*Create statement for the queue of the matches found on the match list of a player and not inserted yet.*/
+/*A row is deleted on the same transaction that inserts its match, so a crash never loses a discovered match.*/
+CREATE TABLE IF NOT EXISTS tb_pending_match (
+    /*Original ID of the match.*/
+    match_id VARCHAR(20) PRIMARY KEY,
+    /*Player whose match list had the match, its last_fetch only moves once the match is inserted.*/
+    puuid CHAR(78) NOT NULL,
+    platform VARCHAR(4) NOT NULL,
+    /*Failed attempts to fetch and insert the match, given up once it reaches PENDING_MAX_ATTEMPTS.*/
+    attempts TINYINT UNSIGNED NOT NULL DEFAULT 0,
+    /*The match isn't tried again before this time, growing exponentially with the attempts.*/
+    next_attempt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error VARCHAR(255),
+    discovered_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_puuid (puuid)
+);
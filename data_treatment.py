@@ -1,4 +1,58 @@
 import datetime
+import numpy as np
+from match_schema import no_challenges
+
+# Stats read straight from each participant by get_stats_columns, as (column, field, dtype).
+stats_fields = [
+    ("champion_id", "championId", np.uint16),
+    ("kills", "kills", np.uint16),
+    ("deaths", "deaths", np.uint16),
+    ("assists", "assists", np.uint16),
+    ("gold_earned", "goldEarned", np.int32),
+    ("gold_spent", "goldSpent", np.int32),
+    ("total_damage_dealt_to_champions", "totalDamageDealtToChampions", np.int32),
+    ("neutral_minions_killed", "neutralMinionsKilled", np.uint16),
+    ("total_minions_killed", "totalMinionsKilled", np.uint16),
+    ("vision_score", "visionScore", np.uint16),
+    ("wards_placed", "wardsPlaced", np.uint16),
+    ("wards_killed", "wardsKilled", np.uint16),
+]
+
+# Stats read from the challenges of each participant, missing on some matches such as remakes.
+challenge_fields = [
+    ("kda", "kda", np.float64),
+    ("gold_per_minute", "goldPerMinute", np.float64),
+    ("damage_per_minute", "damagePerMinute", np.float64),
+    ("vision_score_per_min", "visionScorePerMinute", np.float64),
+    ("control_wards_placed", "controlWardsPlaced", np.uint16),
+]
+
+# Order of the columns of tb_player_stats, the same of get_player_stats.
+stats_columns = [
+    "player_id",
+    "match_id",
+    "champion_id",
+    "kills",
+    "deaths",
+    "assists",
+    "kda",
+    "gold_earned",
+    "gold_spent",
+    "gold_per_minute",
+    "damage_per_minute",
+    "total_damage_dealt_to_champions",
+    "neutral_minions_killed",
+    "total_minions_killed",
+    "total_cs",
+    "cs_per_min",
+    "vision_score",
+    "vision_score_per_min",
+    "control_wards_placed",
+    "wards_placed",
+    "wards_killed",
+    "individual_position",
+    "team",
+]
 
 
 # Get very simple match info and let it structured to insert directly into the database.
@@ -46,6 +100,8 @@ def get_player_info(data):
             "tag_line": participant["riotIdTagline"],
             "profile_icon_id": participant["profileIcon"],
             "summoner_level": participant["summonerLevel"],
+            # Platform where the match was played, the same of the player account.
+            "platform": data["info"]["platformId"].lower(),
         }
         player_array.append(player_info)
     return player_array
@@ -117,10 +173,14 @@ def get_player_stats(data):
             )  # Calculation between the total minions and neutral minions killed.
             + int(participant["neutralMinionsKilled"]),
             "cs_per_min": (
-                int(participant["totalMinionsKilled"])
-                + int(participant["neutralMinionsKilled"])
-            )
-            / (int(data["info"]["gameDuration"]) / 60),
+                (
+                    int(participant["totalMinionsKilled"])
+                    + int(participant["neutralMinionsKilled"])
+                )
+                / (int(data["info"]["gameDuration"]) / 60)
+                if data["info"]["gameDuration"]
+                else None
+            ),
             # Vision stats.
             "vision_score": participant["visionScore"],
             "vision_score_per_min": participant["challenges"]["visionScorePerMinute"],
@@ -134,3 +194,154 @@ def get_player_stats(data):
         }
         player_array.append(player_stats)
     return player_array
+
+
+# Get the stats of every player of many matches at once, as columns.
+def get_stats_columns(matches):
+    """
+    Batch version of get_player_stats, filling one array per column for the participants of every match instead of a dict per participant.
+    The derived columns (total_cs, cs_per_min and team) are computed over the whole arrays.
+    Missing challenges, as on the remakes, and the cs_per_min of the matches without duration are masked so they are stored as NULL like on get_match_rows.
+
+    Args:
+        matches (List[dict]): The payloads of the matches.
+
+    Returns:
+        Dict: The values of each column of tb_player_stats, in the order of the table. The puuid, match_id and position columns are lists, the others are NumPy arrays.
+    """
+    participants = [p for data in matches for p in data["info"]["participants"]]
+    count = len(participants)
+    sizes = [len(data["info"]["participants"]) for data in matches]
+    columns = {
+        "player_id": [p["puuid"] for p in participants],
+        "match_id": [
+            data["metadata"]["matchId"]
+            for data, size in zip(matches, sizes)
+            for _ in range(size)
+        ],
+        "individual_position": [p["individualPosition"] for p in participants],
+    }
+    for column, field, dtype in stats_fields:
+        columns[column] = np.fromiter((p[field] for p in participants), dtype, count)
+    challenges = [p.get("challenges", {}) for p in participants]
+    for column, field, dtype in challenge_fields:
+        columns[column] = np.ma.masked_array(
+            np.fromiter((c.get(field, 0) for c in challenges), dtype, count),
+            mask=np.fromiter((field not in c for c in challenges), bool, count),
+        )
+
+    # Duration of the match of each participant, in minutes.
+    minutes = np.repeat(
+        np.fromiter(
+            (data["info"]["gameDuration"] for data in matches), np.float64, len(matches)
+        )
+        / 60,
+        sizes,
+    )
+    total_cs = columns["total_minions_killed"].astype(np.int32) + columns[
+        "neutral_minions_killed"
+    ].astype(np.int32)
+    columns["total_cs"] = total_cs
+    columns["cs_per_min"] = np.ma.masked_array(
+        np.divide(total_cs, minutes, out=np.zeros(count), where=minutes > 0),
+        mask=minutes <= 0,
+    )
+    # Blue team is stored as 0 and red as 1 on the Database.
+    columns["team"] = (
+        np.fromiter((p["teamId"] for p in participants), np.int16, count) == 200
+    )
+    return {column: columns[column] for column in stats_columns}
+
+
+# Get the rows of the match, the players and the stats from a decoded match.
+def get_match_rows(match):
+    """
+    Version of get_match_info, get_player_info and get_player_stats for the records of decode_match, with the same results.
+    The fields missing on the payload are stored as NULL.
+
+    Args:
+        match (Match): The match, as returned by decode_match.
+
+    Returns:
+        Tuple[Dict, List[Dict], List[Dict]]: The match info, the player info and the player stats.
+    """
+    info = match.info
+    match_id = match.metadata.match_id
+    participants = info.participants
+    first = participants[0] if participants else None
+    match_info = {
+        "match_id": [match_id],
+        "match_start": [
+            (
+                datetime.datetime.fromtimestamp(info.game_creation / 1000)
+                if info.game_creation is not None
+                else None
+            )
+        ],
+        "match_duration": [info.game_duration],
+        "match_winner": [info.teams[0].win if info.teams else None],
+        "match_surrender": [first.game_ended_in_surrender if first else None],
+        "match_remake": [first.game_ended_in_early_surrender if first else None],
+    }
+
+    platform = info.platform_id.lower()
+    minutes = info.game_duration / 60 if info.game_duration else None
+    player_info = []
+    player_stats = []
+    for participant in participants:
+        player_info.append(
+            {
+                "puuid": participant.puuid,
+                "summoner_id": participant.summoner_id,
+                "game_name": participant.riot_id_game_name,
+                "tag_line": participant.riot_id_tagline,
+                "profile_icon_id": participant.profile_icon,
+                "summoner_level": participant.summoner_level,
+                "platform": platform,
+            }
+        )
+        challenges = participant.challenges or no_challenges
+        total_cs = None
+        if (
+            participant.total_minions_killed is not None
+            and participant.neutral_minions_killed is not None
+        ):
+            total_cs = (
+                participant.total_minions_killed + participant.neutral_minions_killed
+            )
+        player_stats.append(
+            {
+                "player_id": participant.puuid,
+                "match_id": match_id,
+                "champion_id": participant.champion_id,
+                "kills": participant.kills,
+                "deaths": participant.deaths,
+                "assists": participant.assists,
+                "kda": challenges.kda,
+                "gold_earned": participant.gold_earned,
+                "gold_spent": participant.gold_spent,
+                "gold_per_minute": challenges.gold_per_minute,
+                "damage_per_minute": challenges.damage_per_minute,
+                "total_damage_dealt_to_champions": participant.total_damage_dealt_to_champions,
+                "neutral_minions_killed": participant.neutral_minions_killed,
+                "total_minions_killed": participant.total_minions_killed,
+                "total_cs": total_cs,
+                "cs_per_min": (
+                    total_cs / minutes
+                    if total_cs is not None and minutes is not None
+                    else None
+                ),
+                "vision_score": participant.vision_score,
+                "vision_score_per_min": challenges.vision_score_per_minute,
+                "control_wards_placed": challenges.control_wards_placed,
+                "wards_placed": participant.wards_placed,
+                "wards_killed": participant.wards_killed,
+                "individual_position": participant.individual_position,
+                "team": (
+                    participant.team_id == 200
+                    if participant.team_id is not None
+                    else None
+                ),
+            }
+        )
+    return match_info, player_info, player_stats
@@ -2,21 +2,54 @@ import mysql.connector
 import os
 import pandas as pd
 import sqlalchemy
+import threading
+import time
 
+from collections import OrderedDict
 from datetime import datetime
 from dotenv import load_dotenv
 from mysql.connector import Error
 from mysql.connector import pooling
+from metrics import db_latency, db_pool_wait, timed
 
 # Load the dotenv configuration for the database connection.
 load_dotenv("credentials.env")
 # Creates a empty connection.
 pool = None
+# Amount of connections kept by the pool.
+pool_size = int(os.getenv("DB_POOL_SIZE", 5))
+
+# Amount of ids kept by each of the id caches.
+id_cache_size = int(os.getenv("ID_CACHE_SIZE", 100000))
 
 # Connection string for the sqlalchemy.
 connection_string = f"mysql+mysqlconnector://{os.getenv('DB_USERNAME')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}/{os.getenv('DB_DATABASE')}"
 engine = sqlalchemy.create_engine(connection_string)
 
+# Columns added to the tables after their first version, as (table, column, definition).
+# Must be kept in sync with the create_statements.sql file.
+added_columns = [
+    ("tb_player_info", "platform", "VARCHAR(4) NOT NULL DEFAULT 'br1' AFTER puuid"),
+    (
+        "tb_player_info",
+        "next_fetch",
+        "TIMESTAMP DEFAULT '2024-03-06 00:00:00' AFTER last_rating",
+    ),
+    ("tb_player_info", "match_rate", "FLOAT AFTER next_fetch"),
+    ("tb_player_info", "list_yield", "FLOAT AFTER match_rate"),
+    ("tb_player_info", "last_match_id", "VARCHAR(20) AFTER list_yield"),
+]
+
+# Indexes added to the tables after their first version, as (table, index, columns).
+# Must be kept in sync with the create_statements.sql file.
+added_indexes = [
+    ("tb_player_info", "idx_summoner_id", "summoner_id"),
+    ("tb_player_info", "idx_platform_last_fetch", "platform, last_fetch"),
+    ("tb_player_info", "idx_platform_next_fetch", "platform, next_fetch"),
+    ("tb_match_info", "idx_match_start", "match_start"),
+    ("tb_player_stats", "idx_champion_position", "champion_id, individual_position"),
+]
+
 """
     Module with the operations needed to insert, fetch and update data from the database.
     Most of the operations have the following pattern:
@@ -31,6 +64,50 @@ engine = sqlalchemy.create_engine(connection_string)
 """
 
 
+class IdCache:
+    """
+    Bounded LRU cache mapping the natural keys (puuid, match_id) to the int ids of the tables.
+    The ids never change once inserted, so the entries don't need to expire.
+    """
+
+    def __init__(self, size):
+        self.lock = threading.Lock()
+        self.size = size
+        self.ids = OrderedDict()
+
+    # Get the ids that are cached, returning them along the missing keys.
+    def get_many(self, keys):
+        found = {}
+        missing = []
+        with self.lock:
+            for key in keys:
+                if key in self.ids:
+                    self.ids.move_to_end(key)
+                    found[key] = self.ids[key]
+                else:
+                    missing.append(key)
+        return found, missing
+
+    # Cache the ids, dropping the least recently used ones when full.
+    def put_many(self, ids):
+        with self.lock:
+            for key, value in ids.items():
+                self.ids[key] = value
+                self.ids.move_to_end(key)
+            while len(self.ids) > self.size:
+                self.ids.popitem(last=False)
+
+    # Drop every cached id.
+    def clear(self):
+        with self.lock:
+            self.ids.clear()
+
+
+# Caches of the ids of the players and matches, filled on insertion and on lookups.
+player_id_cache = IdCache(id_cache_size)
+match_id_cache = IdCache(id_cache_size)
+
+
 # Connect to the mysql database.
 def connect_mysql():
     """
@@ -40,7 +117,7 @@ def connect_mysql():
     try:
         pool = pooling.MySQLConnectionPool(
             pool_name="pool",
-            pool_size=5,
+            pool_size=pool_size,
             host=os.getenv("DB_HOST"),
             user=os.getenv("DB_USERNAME"),
             password=os.getenv("DB_PASSWORD"),
@@ -50,6 +127,24 @@ def connect_mysql():
         raise err
 
 
+# Decorator of the functions that go to the database, observing their latency by name.
+# Only the top-level functions are decorated, the helpers that run inside them would be counted twice on the totals.
+timed_query = timed(db_latency)
+
+
+# Get a connection of the pool.
+def get_connection():
+    """
+    Returns:
+        PooledMySQLConnection: A connection of the pool, the time taken to get it is observed as the pool wait.
+    """
+    started = time.perf_counter()
+    try:
+        return pool.get_connection()
+    finally:
+        db_pool_wait.observe(time.perf_counter() - started)
+
+
 # Function to close the mysql connection.
 def close_mysql():
     """
@@ -78,7 +173,7 @@ def execute_query(query, params=None):
     global pool
     try:
         # Get a connection from the pool
-        connection = pool.get_connection()
+        connection = get_connection()
 
         # Create a cursor
         cursor = connection.cursor()
@@ -100,11 +195,69 @@ def execute_query(query, params=None):
         raise e
 
 
+# Stream the results of a query in batches.
+def stream_query(query, params=None, batch_size=10000):
+    """
+    Execute a query with a unbuffered cursor, so the rows are read from the server as they are consumed instead of all at once.
+    The connection is held until the generator is exhausted or closed.
+
+    Args:
+        query (string): String containing the query to execute.
+        params (tuples, optional): Values passed to the database alongside the SQL query. Defaults to None.
+        batch_size (int, optional): Amount of rows of each batch. Defaults to 10000.
+
+    Yields:
+        List[tuples]: The next batch of rows.
+    """
+    connection = get_connection()
+    cursor = connection.cursor(buffered=False)
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        # Rows that weren't read must be consumed before the connection goes back to the pool.
+        if connection.unread_result:
+            connection.consume_results()
+        cursor.close()
+        connection.close()
+
+
+# Execute a insert on the database.
+def execute_insert(query, params):
+    """
+    Execute a insert statement and return the id generated for the row.
+
+    Args:
+        query (string): String containing the insert statement.
+        params (tuples): The values of the row.
+
+    Returns:
+        int: The auto increment id of the inserted row.
+    """
+    try:
+        connection = get_connection()
+        cursor = connection.cursor()
+        cursor.execute(query, params)
+        row_id = cursor.lastrowid
+        connection.commit()
+        cursor.close()
+        connection.close()
+        return row_id
+    except Exception as e:
+        raise e
+
+
 # Create the tables if they don't exist.
+@timed_query
 def create_tables():
     """
     Function to create the tables if they don't exist already.
     Split the statements, remove any trailing whitespaces to avoid a wrong ; and execute the queries.
+    Afterwards, add the columns created after the first version of the tables to databases that already exist.
     """
     with open("create_statements.sql", "r") as sql_file:
         sql = sql_file.read()
@@ -113,11 +266,66 @@ def create_tables():
             for statement in statements:
                 if statement.strip():
                     execute_query(statement)
+            migrate_tables()
         except Exception as e:
             raise e
 
 
+# Function to add the new columns to tables created by older versions.
+def migrate_tables():
+    """
+    Verify each column of the added_columns list and each index of the added_indexes list against the information_schema and add the missing ones.
+    Needed since the CREATE TABLE IF NOT EXISTS statements don't change tables that already exist.
+    """
+    sql = """SELECT column_name FROM information_schema.columns WHERE table_schema = %s AND table_name = %s"""
+    index_sql = """SELECT DISTINCT index_name FROM information_schema.statistics WHERE table_schema = %s AND table_name = %s"""
+    try:
+        for table, column, definition in added_columns:
+            columns = execute_query(sql, (os.getenv("DB_DATABASE"), table))
+            if column not in [row[0] for row in columns]:
+                execute_query(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        for table, index, columns in added_indexes:
+            indexes = execute_query(index_sql, (os.getenv("DB_DATABASE"), table))
+            if index not in [row[0] for row in indexes]:
+                execute_query(f"ALTER TABLE {table} ADD INDEX {index} ({columns})")
+        migrate_timelines()
+    except Exception as e:
+        raise e
+
+
+# Function to key the timelines of older versions by the original id of the match.
+def migrate_timelines():
+    """
+    The first version of tb_match_timeline was keyed by the int id of tb_match_info, with a foreign key that a swap of the
+    match tables moves to tb_match_info_old. The foreign key is dropped and each id is replaced by the match_id of the
+    table the foreign key pointed to, the rows whose match isn't there are deleted.
+    """
+    type_sql = """SELECT data_type FROM information_schema.columns WHERE table_schema = %s AND table_name = 'tb_match_timeline' AND column_name = 'match_id'"""
+    key_sql = """SELECT constraint_name, referenced_table_name FROM information_schema.referential_constraints
+        WHERE constraint_schema = %s AND table_name = 'tb_match_timeline'"""
+    try:
+        data_type = execute_query(type_sql, (os.getenv("DB_DATABASE"),))
+        if not data_type or data_type[0][0].lower() != "int":
+            return
+        match_table = "tb_match_info"
+        for name, referenced in execute_query(key_sql, (os.getenv("DB_DATABASE"),)):
+            execute_query(f"ALTER TABLE tb_match_timeline DROP FOREIGN KEY {name}")
+            match_table = referenced
+        execute_query(
+            "ALTER TABLE tb_match_timeline MODIFY match_id VARCHAR(20) NOT NULL"
+        )
+        execute_query(
+            f"""UPDATE tb_match_timeline t JOIN {match_table} m ON m.id = CAST(t.match_id AS UNSIGNED) SET t.match_id = m.match_id"""
+        )
+        execute_query(
+            """DELETE FROM tb_match_timeline WHERE match_id REGEXP '^[0-9]+$'"""
+        )
+    except Exception as e:
+        raise e
+
+
 # Get the next avaible puuid for fetching.
+@timed_query
 def get_next_puuid():
     """
     Selects the first puuid when sorting by ascending fetch date and ascending id, getting the oldest puuid that wasn't fetched lately.
@@ -133,7 +341,37 @@ def get_next_puuid():
         raise e
 
 
+# Get a batch of players of a platform, in the fetch order.
+@timed_query
+def lease_players(platform, after, limit):
+    """
+    Selects the next players of a platform that are due, when sorting by ascending next fetch date and ascending id, starting after the given position.
+    Uses the (platform, next_fetch) index, so only the returned rows are read no matter how many players there are.
+
+    Args:
+        platform (string): The platform of the players.
+        after (Tuple): The next_fetch and id of the last player of the previous batch, None to start from the first one.
+        limit (int): The maximum amount of players.
+
+    Returns:
+        List[Tuple]: The id, puuid, platform, next_fetch, last_fetch, match_rate, list_yield, tier, league_points, last_match_id and the start of the last match of each player.
+    """
+    sql = """SELECT p.id, p.puuid, p.platform, p.next_fetch, p.last_fetch, p.match_rate, p.list_yield, p.tier, p.league_points,
+        p.last_match_id, m.match_start FROM tb_player_info p LEFT JOIN tb_match_info m ON m.match_id = p.last_match_id
+        WHERE p.platform = %s AND p.next_fetch <= NOW()"""
+    params = (platform,)
+    if after is not None:
+        sql += """ AND (p.next_fetch > %s OR (p.next_fetch = %s AND p.id > %s))"""
+        params += (after[0], after[0], after[1])
+    sql += """ ORDER BY p.next_fetch ASC, p.id ASC LIMIT %s"""
+    try:
+        return execute_query(sql, params + (limit,))
+    except Exception as e:
+        raise e
+
+
 # Verify if a match is on the database by checking the count of match_id on the database.
+@timed_query
 def is_match_on_db(match_id):
     """
     Args:
@@ -157,7 +395,60 @@ def is_match_on_db(match_id):
         raise e
 
 
+# Get the matches of a list that are already on the database.
+@timed_query
+def get_existing_matches(match_ids, table="tb_match_info"):
+    """
+    Checks many matches with a single query, instead of one is_match_on_db call for each.
+
+    Args:
+        match_ids (List[string]): The ids of the matches to check against the database.
+        table (string, optional): The table of the matches, such as a shadow table. Defaults to tb_match_info.
+
+    Returns:
+        Set[string]: The ids that are already on the database.
+    """
+    if not match_ids:
+        return set()
+    placeholders = ", ".join(["%s"] * len(match_ids))
+    sql = f"""SELECT match_id FROM {table} WHERE match_id IN ({placeholders})"""
+    try:
+        matches = execute_query(sql, tuple(match_ids))
+        return {row[0] for row in matches}
+    except Exception as e:
+        raise e
+
+
+# Stream every match id on the database.
+def stream_match_ids(batch_size=100000):
+    """
+    Args:
+        batch_size (int, optional): Amount of ids of each batch. Defaults to 100000.
+
+    Yields:
+        List[tuples]: The next batch of ids, each inside a tuple.
+    """
+    sql = """SELECT match_id FROM tb_match_info"""
+    yield from stream_query(sql, batch_size=batch_size)
+
+
+# Function to count the matches on the database.
+@timed_query
+def count_matches():
+    """
+    Returns:
+        int: The amount of matches on the database.
+    """
+    sql = """SELECT COUNT(*) FROM tb_match_info"""
+    try:
+        count = execute_query(sql)
+        return count[0][0]
+    except Exception as e:
+        raise e
+
+
 # Verify if a player is already on the database before.
+@timed_query
 def is_player_on_db(puuid):
     """
     Args:
@@ -181,6 +472,65 @@ def is_player_on_db(puuid):
         raise e
 
 
+# Resolve natural keys into the int ids of a table.
+def resolve_ids(cache, table, column, keys, cursor=None):
+    """
+    Get the ids from the cache, looking up all the missing ones with a single query and caching them.
+    When a cursor is given, the lookup runs on its transaction and the ids are not cached, since they could be rolled back.
+
+    Args:
+        cache (IdCache): The cache of the table.
+        table (string): The table that holds the ids.
+        column (string): The column with the natural keys.
+        keys (List[string]): The keys to resolve.
+        cursor (MySQLCursor, optional): Cursor of a open transaction. Defaults to None.
+
+    Returns:
+        Dict: The id of each key found. Keys that aren't on the database are left out.
+    """
+    found, missing = cache.get_many(dict.fromkeys(keys))
+    if missing:
+        placeholders = ", ".join(["%s"] * len(missing))
+        sql = f"""SELECT {column}, id FROM {table} WHERE {column} IN ({placeholders})"""
+        # Only the lookups that reach the database are timed, the cache hits aren't queries.
+        try:
+            with db_latency.time("resolve_ids"):
+                if cursor is None:
+                    resolved = dict(execute_query(sql, tuple(missing)))
+                    cache.put_many(resolved)
+                else:
+                    cursor.execute(sql, tuple(missing))
+                    resolved = dict(cursor.fetchall())
+        except Exception as e:
+            raise e
+        found.update(resolved)
+    return found
+
+
+# Get the ids of many players based on their puuid.
+def resolve_player_ids(puuids):
+    """
+    Args:
+        puuids (List[string]): The puuids of the players.
+
+    Returns:
+        Dict: The id of each puuid found on the database.
+    """
+    return resolve_ids(player_id_cache, "tb_player_info", "puuid", puuids)
+
+
+# Get the ids of many matches based on their match_id.
+def resolve_match_ids(match_ids):
+    """
+    Args:
+        match_ids (List[string]): The ids of the matches, as given by the API.
+
+    Returns:
+        Dict: The int id of each match found on the database.
+    """
+    return resolve_ids(match_id_cache, "tb_match_info", "match_id", match_ids)
+
+
 # Get the id of the player based on the puuid.
 def get_player_id(puuid):
     """
@@ -190,10 +540,8 @@ def get_player_id(puuid):
     Returns:
         Integer: The int id of the player on the players table.
     """
-    sql = """SELECT id FROM tb_player_info WHERE puuid = %s"""
     try:
-        player_id = execute_query(sql, (puuid,))
-        return player_id[0][0]
+        return resolve_player_ids([puuid])[puuid]
     except Exception as e:
         raise e
 
@@ -207,15 +555,14 @@ def get_match_id(match_id):
     Returns:
         Integer: The int id of the match on the matches table.
     """
-    sql = """SELECT id FROM tb_match_info where match_id = %s"""
     try:
-        match = execute_query(sql, (match_id,))
-        return match[0][0]
+        return resolve_match_ids([match_id])[match_id]
     except Exception as e:
         raise e
 
 
 # Get the date of the last fetch on a given player.
+@timed_query
 def get_last_fetch(puuid):
     """
     Function used for mantaining the control flow of the fetching process, so no player can have it's data fetched until all others players before him have it's data fetched.
@@ -232,31 +579,284 @@ def get_last_fetch(puuid):
 
 
 # Function to update the last_fetch date for a given player.
-def update_fetch_date(puuid):
+@timed_query
+def update_fetch_date(puuid, last_match_id=None):
     """
     Update the last_fetch date for a given player after all his data was fetched.
+    The last_match_id is kept when None is given.
     """
-    sql = """UPDATE tb_player_info SET last_fetch = NOW() WHERE puuid = %s"""
+    sql = """UPDATE tb_player_info SET last_fetch = NOW(), last_match_id = COALESCE(%s, last_match_id) WHERE puuid = %s"""
     try:
-        execute_query(sql, (puuid,))
+        execute_query(sql, (last_match_id, puuid))
+    except Exception as e:
+        raise e
+
+
+# Function to update the last_fetch and the schedule of many players at once.
+@timed_query
+def update_schedules(schedules):
+    """
+    Function to update the fetch date, the next fetch date, the observed rates and the newest match of the players whose data was all fetched, with executemany on a single transaction.
+    The next fetch is set from the clock of the database, as the last_fetch. The last_match_id is kept when None is given.
+
+    Args:
+        schedules (List[Tuple]): The int id, seconds until the next fetch, match rate, list yield and newest match listed of each player.
+    """
+    if not schedules:
+        return
+    sql = """UPDATE tb_player_info SET last_fetch = NOW(), next_fetch = NOW() + INTERVAL %s SECOND, match_rate = %s, list_yield = %s,
+        last_match_id = COALESCE(%s, last_match_id) WHERE id = %s"""
+    connection = get_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.executemany(
+            sql,
+            [
+                (int(interval), match_rate, list_yield, last_match_id, player_id)
+                for player_id, interval, match_rate, list_yield, last_match_id in schedules
+            ],
+        )
+        connection.commit()
+    except Exception as e:
+        connection.rollback()
+        raise e
+    finally:
+        cursor.close()
+        connection.close()
+
+
+# Function to add the matches of a player to the pending queue.
+@timed_query
+def enqueue_matches(puuid, platform, match_ids, max_attempts):
+    """
+    Inserts the matches that aren't on the queue yet, keeping the rows of the ones already there, and reads their state back.
+    The given up matches are taken by the player and their attempts reset, so a match shared with a player whose
+    attempts ran out is tried again for this one.
+
+    Args:
+        puuid (string): The player whose match list had the matches.
+        platform (string): Platform of the player.
+        match_ids (List[string]): The ids of the matches, as given by the API.
+        max_attempts (int): Attempts after which a match is given up.
+
+    Returns:
+        Tuple[List[string], List[string]]: The matches that can be fetched now, and the ones waiting for their next attempt. The given up ones are left out.
+    """
+    if not match_ids:
+        return [], []
+    # The assignments run in order, so the attempts are reset after the others read them.
+    insert_sql = """INSERT INTO tb_pending_match (match_id, puuid, platform) VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE puuid = IF(attempts >= %s, VALUES(puuid), puuid), platform = IF(attempts >= %s, VALUES(platform), platform),
+        next_attempt = IF(attempts >= %s, NOW(), next_attempt), attempts = IF(attempts >= %s, 0, attempts)"""
+    placeholders = ", ".join(["%s"] * len(match_ids))
+    select_sql = f"""SELECT match_id, next_attempt <= NOW() FROM tb_pending_match WHERE match_id IN ({placeholders}) AND attempts < %s"""
+    connection = get_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.executemany(
+            insert_sql,
+            [
+                (match_id, puuid, platform) + (max_attempts,) * 4
+                for match_id in match_ids
+            ],
+        )
+        cursor.execute(select_sql, tuple(match_ids) + (max_attempts,))
+        state = dict(cursor.fetchall())
+        connection.commit()
+    except Exception as e:
+        connection.rollback()
+        raise e
+    finally:
+        cursor.close()
+        connection.close()
+    due = [match_id for match_id in match_ids if state.get(match_id)]
+    waiting = [
+        match_id for match_id in match_ids if match_id in state and not state[match_id]
+    ]
+    return due, waiting
+
+
+# Function to get the pending matches of a player.
+@timed_query
+def get_pending_matches(puuid, max_attempts):
+    """
+    Args:
+        puuid (string): The player.
+        max_attempts (int): Attempts after which a match is given up.
+
+    Returns:
+        Tuple[List[string], List[string]]: The matches that can be fetched now, and the ones waiting for their next attempt. The given up ones are left out.
+    """
+    sql = """SELECT match_id, next_attempt <= NOW() FROM tb_pending_match WHERE puuid = %s AND attempts < %s ORDER BY discovered_at"""
+    try:
+        rows = execute_query(sql, (puuid, max_attempts))
+    except Exception as e:
+        raise e
+    return [row[0] for row in rows if row[1]], [row[0] for row in rows if not row[1]]
+
+
+# Function to record a failed attempt of a pending match.
+@timed_query
+def fail_pending_match(match_id, error, backoff, max_backoff):
+    """
+    Counts the attempt and postpones the next one by the backoff doubled for each previous attempt.
+
+    Args:
+        match_id (string): The ID of the match.
+        error (string): Description of the error.
+        backoff (int): Seconds before the second attempt.
+        max_backoff (int): Maximum seconds between two attempts.
+    """
+    sql = """UPDATE tb_pending_match SET next_attempt = NOW() + INTERVAL LEAST(%s * POW(2, attempts), %s) SECOND,
+        attempts = attempts + 1, last_error = %s WHERE match_id = %s"""
+    try:
+        execute_query(sql, (backoff, max_backoff, error[:255], match_id))
+    except Exception as e:
+        raise e
+
+
+# Function to remove matches from the pending queue.
+@timed_query
+def dequeue_matches(match_ids):
+    """
+    Args:
+        match_ids (List[string]): The ids of the matches, such as the ones found already inserted.
+    """
+    if not match_ids:
+        return
+    placeholders = ", ".join(["%s"] * len(match_ids))
+    sql = f"""DELETE FROM tb_pending_match WHERE match_id IN ({placeholders})"""
+    try:
+        execute_query(sql, tuple(match_ids))
+    except Exception as e:
+        raise e
+
+
+# Function to take the leases of many keys at once.
+@timed_query
+def claim_leases(kind, keys, owner, ttl):
+    """
+    Takes the lease of every key that isn't leased or whose lease expired, renewing the ones already held by the owner.
+    The expiration uses the clock of the database, so the hosts don't need synchronized clocks.
+
+    Args:
+        kind (string): Kind of the work, such as player or match.
+        keys (List[string]): The keys to lease.
+        owner (string): The process taking the leases.
+        ttl (int): Seconds until the leases expire.
+
+    Returns:
+        Set[string]: The keys leased by the owner.
+    """
+    if not keys:
+        return set()
+    # The owner is assigned first, so the expiration is only moved when the lease was taken or already held.
+    sql = """INSERT INTO tb_lease (kind, lease_key, owner, expires_at) VALUES (%s, %s, %s, NOW() + INTERVAL %s SECOND)
+        ON DUPLICATE KEY UPDATE owner = IF(expires_at < NOW() OR owner = VALUES(owner), VALUES(owner), owner),
+        expires_at = IF(owner = VALUES(owner), VALUES(expires_at), expires_at)"""
+    placeholders = ", ".join(["%s"] * len(keys))
+    select_sql = f"""SELECT lease_key FROM tb_lease WHERE kind = %s AND owner = %s AND lease_key IN ({placeholders})"""
+    connection = get_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.executemany(sql, [(kind, key, owner, ttl) for key in keys])
+        cursor.execute(select_sql, (kind, owner) + tuple(keys))
+        leased = {row[0] for row in cursor.fetchall()}
+        connection.commit()
+        return leased
+    except Exception as e:
+        connection.rollback()
+        raise e
+    finally:
+        cursor.close()
+        connection.close()
+
+
+# Function to give back the leases of many keys at once.
+@timed_query
+def release_leases(kind, keys, owner):
+    """
+    Deletes the leases of the keys held by the owner, so other processes can take them right away.
+
+    Args:
+        kind (string): Kind of the work, such as player or match.
+        keys (List[string]): The keys to release.
+        owner (string): The process holding the leases.
+    """
+    if not keys:
+        return
+    placeholders = ", ".join(["%s"] * len(keys))
+    sql = f"""DELETE FROM tb_lease WHERE kind = %s AND owner = %s AND lease_key IN ({placeholders})"""
+    try:
+        execute_query(sql, (kind, owner) + tuple(keys))
+    except Exception as e:
+        raise e
+
+
+# Function to extend every lease of a owner.
+@timed_query
+def renew_leases(owner, ttl):
+    """
+    Moves the expiration of every lease held by the owner and deletes the leases of every owner that expired.
+
+    Args:
+        owner (string): The process holding the leases.
+        ttl (int): Seconds until the leases expire.
+    """
+    sql = """UPDATE tb_lease SET expires_at = NOW() + INTERVAL %s SECOND WHERE owner = %s"""
+    expired_sql = """DELETE FROM tb_lease WHERE expires_at < NOW()"""
+    try:
+        execute_query(sql, (ttl, owner))
+        execute_query(expired_sql)
+    except Exception as e:
+        raise e
+
+
+# Function to give back every lease of a owner.
+@timed_query
+def release_all_leases(owner):
+    """
+    Deletes every lease held by the owner, used when the process stops.
+    """
+    sql = """DELETE FROM tb_lease WHERE owner = %s"""
+    try:
+        execute_query(sql, (owner,))
+    except Exception as e:
+        raise e
+
+
+# Function to count the leases that didn't expire, held by running crawlers.
+def count_live_leases():
+    sql = """SELECT COUNT(*) FROM tb_lease WHERE expires_at > NOW()"""
+    try:
+        return execute_query(sql)[0][0]
     except Exception as e:
         raise e
 
 
 # Function to insert a match into the database.
+@timed_query
 def insert_match_info(match_info):
     """
-    Function that creates a pandas dataframe from a dictionary and insert it into the database with the sqlalchemy.
+    Function that inserts the match row and caches the id generated for it, so the stats don't need to look it up.
 
     Args:
         match_info (DICT): Dictionary carrying information about the match, pre formatted.
 
     Raises:
-        Exception: Any exception caught during the dataframe creation or the sql insertion.
+        Exception: Any exception caught during the sql insertion.
+
+    Returns:
+        int: The int id of the match.
     """
+    columns = ", ".join(match_info)
+    placeholders = ", ".join(["%s"] * len(match_info))
+    sql = f"""INSERT INTO tb_match_info ({columns}) VALUES ({placeholders})"""
     try:
-        df = pd.DataFrame(match_info)
-        df.to_sql("tb_match_info", con=engine, if_exists="append", index=False)
+        row = tuple(values[0] for values in match_info.values())
+        match_id = execute_insert(sql, row)
+        match_id_cache.put_many({match_info["match_id"][0]: match_id})
+        return match_id
     except Exception as e:
         raise e
 
@@ -265,8 +865,8 @@ def insert_match_info(match_info):
 def insert_player_info(player_info):
     """
     Function to insert a player into the database.
-    Creates a mask by applying the is_player_on_db function, then proceeds to copy the data that didn't match the mask into a new filtered dataframe.
-    Inserts the filtered dataframe into the database with the sqlalchemy.
+    Resolves the ids of all the players at once, then proceeds to copy the players without a id into a new filtered dataframe.
+    Inserts the filtered dataframe into the database with the sqlalchemy and resolves the ids of the new players, leaving them cached for the stats.
 
     Args:
         player_info (DICT): Dictionary carrying information about the player, pre formatted.
@@ -277,11 +877,13 @@ def insert_player_info(player_info):
     try:
         df = pd.DataFrame(player_info)
         if not df.empty:
-            mask = df["puuid"].apply(is_player_on_db)
+            existing = resolve_player_ids(df["puuid"].tolist())
+            mask = df["puuid"].isin(existing)
             filtered = df[~mask].copy()
             filtered.to_sql(
                 "tb_player_info", con=engine, if_exists="append", index=False
             )
+            resolve_player_ids(filtered["puuid"].tolist())
     except Exception as e:
         print(e)
         raise e
@@ -291,7 +893,8 @@ def insert_player_info(player_info):
 def insert_player_stats(player_stats):
     """
     Function to insert the player stats into the database.
-    Get the integers player id and the match id from the database before doing the insertion by applying the function to the columns.
+    Get the integers player id and the match id before doing the insertion by mapping the columns with the resolved ids.
+    The ids are usually cached by the insertion of the match and players, otherwise they are fetched with a single query for each table.
     Insert the data into the database with the sqlalchemy.
 
     Args:
@@ -302,18 +905,351 @@ def insert_player_stats(player_stats):
     """
     try:
         df = pd.DataFrame(player_stats)
-        # Apply to the dataframe the function to get the int IDs assigned for the PUUID and MatchID.
-        df["player_id"] = df["player_id"].apply(get_player_id)
-        df["match_id"] = df["match_id"].apply(get_match_id)
+        # Map the dataframe with the int IDs assigned for the PUUID and MatchID.
+        player_ids = resolve_player_ids(df["player_id"].tolist())
+        match_ids = resolve_match_ids(df["match_id"].tolist())
+        missing = set(df["player_id"]) - set(player_ids) | set(df["match_id"]) - set(
+            match_ids
+        )
+        if missing:
+            raise Exception(f"Ids not found on the database: {missing}")
+        df["player_id"] = df["player_id"].map(player_ids)
+        df["match_id"] = df["match_id"].map(match_ids)
         df.to_sql("tb_player_stats", con=engine, if_exists="append", index=False)
     except Exception as e:
         raise e
 
 
+# Function to insert rows with a multi-row statement.
+def insert_rows(cursor, table, rows):
+    """
+    Insert a list of dictionaries with executemany, which sends a single multi-row INSERT for each set of columns.
+    Rows that already exist are left untouched, so writing the same match twice is harmless.
+
+    Args:
+        cursor (MySQLCursor): Cursor of the transaction.
+        table (string): The table to insert into.
+        rows (List[Dict]): The rows, with the column names as keys.
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(row), []).append(tuple(row.values()))
+    for columns, values in groups.items():
+        placeholders = ", ".join(["%s"] * len(columns))
+        sql = f"""INSERT INTO {table} ({", ".join(columns)}) VALUES ({placeholders}) ON DUPLICATE KEY UPDATE id = id"""
+        cursor.executemany(sql, values)
+
+
+# Function to insert many rows given as columns.
+def insert_columns(cursor, table, columns):
+    """
+    Insert the rows of a columnar batch with executemany, without building a dictionary for each row.
+    Rows that already exist are left untouched, as on insert_rows.
+
+    Args:
+        cursor (MySQLCursor): Cursor of the transaction.
+        table (string): The table to insert into.
+        columns (Dict): The values of each column, as lists or NumPy arrays of the same length. The masked values of masked arrays are stored as NULL.
+    """
+    # NumPy scalars aren't accepted by the connector, the arrays are converted to lists of Python values, None for the masked ones.
+    values = [
+        column.tolist() if hasattr(column, "tolist") else column
+        for column in columns.values()
+    ]
+    placeholders = ", ".join(["%s"] * len(columns))
+    sql = f"""INSERT INTO {table} ({", ".join(columns)}) VALUES ({placeholders}) ON DUPLICATE KEY UPDATE id = id"""
+    cursor.executemany(sql, list(zip(*values)))
+
+
+# Statement that adds the stats of the selected matches to tb_champion_stats, completed by a WHERE on the matches.
+aggregate_sql = """INSERT INTO tb_champion_stats (day, champion_id, position, tier, games, wins, kills, deaths, assists, kda_sum, gold_per_minute_sum, cs_per_min_sum)
+    SELECT DATE(m.match_start), s.champion_id, s.individual_position, COALESCE(p.tier, 'UNRANKED'),
+        COUNT(*), SUM(s.team <> m.match_winner), SUM(s.kills), SUM(s.deaths), SUM(s.assists),
+        SUM(COALESCE(s.kda, 0)), SUM(COALESCE(s.gold_per_minute, 0)), SUM(COALESCE(s.cs_per_min, 0))
+    FROM tb_player_stats s
+    JOIN tb_match_info m ON m.id = s.match_id
+    JOIN tb_player_info p ON p.id = s.player_id
+    WHERE NOT COALESCE(m.match_remake, FALSE) AND s.champion_id IS NOT NULL AND s.individual_position IS NOT NULL AND {where}
+    GROUP BY 1, 2, 3, 4
+    ON DUPLICATE KEY UPDATE games = games + VALUES(games), wins = wins + VALUES(wins), kills = kills + VALUES(kills),
+        deaths = deaths + VALUES(deaths), assists = assists + VALUES(assists), kda_sum = kda_sum + VALUES(kda_sum),
+        gold_per_minute_sum = gold_per_minute_sum + VALUES(gold_per_minute_sum), cs_per_min_sum = cs_per_min_sum + VALUES(cs_per_min_sum)"""
+
+
+# Function to add the stats of new matches to the aggregates.
+def update_aggregates(cursor, match_ids):
+    """
+    Adds the stats of the matches to tb_champion_stats with a single statement, on the transaction that inserted them.
+    Each match must only be added once, so only the matches that weren't on the database before the transaction should be given.
+    The remakes are left out.
+
+    Args:
+        cursor (MySQLCursor): Cursor of the transaction.
+        match_ids (List[int]): The int ids of the new matches.
+    """
+    if not match_ids:
+        return
+    placeholders = ", ".join(["%s"] * len(match_ids))
+    cursor.execute(
+        aggregate_sql.format(where=f"m.id IN ({placeholders})"), tuple(match_ids)
+    )
+
+
+# Function to rebuild the aggregates from every match.
+@timed_query
+def rebuild_aggregates():
+    """
+    Recomputes tb_champion_stats from tb_player_stats on a single transaction, so the aggregates are never seen half built.
+    Needed after changing the stats of matches already inserted, such as after swapping the reprocessed tables.
+    The tier of each player is read from tb_player_info, so every past day is bucketed by the current tier of the
+    players instead of the tier they had when the match was inserted.
+    """
+    connection = get_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""DELETE FROM tb_champion_stats""")
+        cursor.execute(aggregate_sql.format(where="TRUE"))
+        connection.commit()
+    except Exception as e:
+        connection.rollback()
+        raise e
+    finally:
+        cursor.close()
+        connection.close()
+
+
+# Function to write a batch of matches in a single transaction.
+@timed_query
+def insert_matches(
+    matches,
+    match_table="tb_match_info",
+    stats_table="tb_player_stats",
+    stats_columns=None,
+):
+    """
+    Function to insert many parsed matches at once, with the players, the rating updates, the matches and the stats on the same transaction.
+    Either every row of the batch is written or none is, so a match is never left without its stats.
+
+    Args:
+        matches (List[Dict]): Parsed matches, each with the following keys:
+            match_info (Dict): Information about the match, as returned by get_match_info.
+            player_info (List[Dict]): Players to insert, with their rating.
+            player_stats (List[Dict]): Stats of each player, as returned by get_player_stats.
+            rating_updates (List[Tuple]): Rating and puuid of the players already on the database.
+            timeline (Dict, optional): Row of the timeline, as returned by get_timeline_row.
+        match_table (string, optional): The table of the matches, such as a shadow table. Defaults to tb_match_info.
+        stats_table (string, optional): The table of the stats, such as a shadow table. Defaults to tb_player_stats.
+        stats_columns (Dict, optional): The stats of every match as columns, as returned by get_stats_columns, used instead of the player_stats of each match.
+
+    Raises:
+        Exception: Any exception raised by the mysql, after rolling back the transaction.
+
+    Returns:
+        Dict: The int id of each match.
+    """
+    rating_sql = """UPDATE tb_player_info SET tier = %s, division = %s, league_points = %s, wins = %s, losses = %s, last_rating = CURDATE() WHERE puuid = %s"""
+    timeline_sql = """INSERT INTO tb_match_timeline (match_id, participants, frames, data) VALUES (%s, %s, %s, %s) ON DUPLICATE KEY UPDATE match_id = match_id"""
+    # The ids of other match tables don't match the cached ones.
+    match_cache = match_id_cache if match_table == "tb_match_info" else IdCache(0)
+    connection = get_connection()
+    cursor = connection.cursor()
+    try:
+        # The same new player can show up on more than one match of the batch.
+        players = {}
+        for match in matches:
+            for player in match["player_info"]:
+                players[player["puuid"]] = player
+        insert_rows(cursor, "tb_player_info", list(players.values()))
+
+        ratings = [
+            (
+                rating["tier"],
+                rating["division"],
+                rating["league_points"],
+                rating["wins"],
+                rating["losses"],
+                puuid,
+            )
+            for match in matches
+            for rating, puuid in match["rating_updates"]
+        ]
+        if ratings:
+            cursor.executemany(rating_sql, ratings)
+
+        match_rows = [
+            {column: values[0] for column, values in match["match_info"].items()}
+            for match in matches
+        ]
+        # Matches already on the database aren't added to the aggregates again, the cached ids are all committed.
+        existing = set(
+            resolve_ids(
+                match_cache,
+                match_table,
+                "match_id",
+                [row["match_id"] for row in match_rows],
+                cursor,
+            )
+        )
+        insert_rows(cursor, match_table, match_rows)
+
+        # Swap the natural keys of the stats for the ids, looking up the missing ones inside the transaction.
+        if stats_columns is not None:
+            stats = []
+            puuids = stats_columns["player_id"]
+        else:
+            stats = [row for match in matches for row in match["player_stats"]]
+            puuids = [row["player_id"] for row in stats]
+        match_ids = resolve_ids(
+            match_cache,
+            match_table,
+            "match_id",
+            [row["match_id"] for row in match_rows],
+            cursor,
+        )
+        player_ids = resolve_ids(
+            player_id_cache,
+            "tb_player_info",
+            "puuid",
+            puuids,
+            cursor,
+        )
+        stat_rows = [
+            dict(
+                row,
+                player_id=player_ids[row["player_id"]],
+                match_id=match_ids[row["match_id"]],
+            )
+            for row in stats
+        ]
+        insert_rows(cursor, stats_table, stat_rows)
+        timelines = [
+            (
+                row["match_id"],
+                timeline["participants"],
+                timeline["frames"],
+                timeline["data"],
+            )
+            for row, timeline in zip(match_rows, (m.get("timeline") for m in matches))
+            if timeline is not None
+        ]
+        if timelines:
+            cursor.executemany(timeline_sql, timelines)
+        if stats_columns is not None:
+            columns = dict(
+                stats_columns,
+                player_id=[player_ids[puuid] for puuid in puuids],
+                match_id=[match_ids[m] for m in stats_columns["match_id"]],
+            )
+            insert_columns(cursor, stats_table, columns)
+        # The aggregates and the pending queue are only kept for the live tables, the shadow ones are aggregated by the rebuild after the swap.
+        if match_table == "tb_match_info":
+            # The matches leave the pending queue on the transaction that inserts them.
+            placeholders = ", ".join(["%s"] * len(match_rows))
+            cursor.execute(
+                f"""DELETE FROM tb_pending_match WHERE match_id IN ({placeholders})""",
+                tuple(row["match_id"] for row in match_rows),
+            )
+            update_aggregates(
+                cursor,
+                [
+                    match_ids[row["match_id"]]
+                    for row in match_rows
+                    if row["match_id"] not in existing
+                ],
+            )
+        connection.commit()
+    except Exception as e:
+        connection.rollback()
+        raise e
+    finally:
+        cursor.close()
+        connection.close()
+
+    # Only cache the ids once they are committed.
+    match_cache.put_many(match_ids)
+    player_id_cache.put_many(player_ids)
+    return match_ids
+
+
+# Function to get the packed timelines of many matches.
+@timed_query
+def get_timeline_blobs(match_ids):
+    """
+    Args:
+        match_ids (List[string]): The ids of the matches, as given by the API.
+
+    Returns:
+        Dict: The packed data of the timeline of each match that has one.
+    """
+    if not match_ids:
+        return {}
+    placeholders = ", ".join(["%s"] * len(match_ids))
+    sql = f"""SELECT match_id, data FROM tb_match_timeline WHERE match_id IN ({placeholders})"""
+    try:
+        return {row[0]: bytes(row[1]) for row in execute_query(sql, tuple(match_ids))}
+    except Exception as e:
+        raise e
+
+
+# Function to create the shadow tables of the matches and stats.
+@timed_query
+def create_shadow_tables(suffix):
+    """
+    Creates empty copies of tb_match_info and tb_player_stats, named with the suffix, to be filled without touching the live tables.
+    The copies keep the columns and indexes, but not the foreign keys.
+
+    Args:
+        suffix (string): Suffix of the shadow tables, such as _shadow.
+
+    Returns:
+        Tuple[string, string]: The names of the match and stats shadow tables.
+    """
+    match_table, stats_table = f"tb_match_info{suffix}", f"tb_player_stats{suffix}"
+    try:
+        execute_query(f"CREATE TABLE IF NOT EXISTS {match_table} LIKE tb_match_info")
+        execute_query(f"CREATE TABLE IF NOT EXISTS {stats_table} LIKE tb_player_stats")
+    except Exception as e:
+        raise e
+    return match_table, stats_table
+
+
+# Function to replace the live tables by the shadow tables.
+@timed_query
+def swap_shadow_tables(suffix):
+    """
+    Renames the shadow tables to the live names in a single atomic statement, keeping the live tables with the _old suffix.
+    Fails if the _old tables exist, so a previous swap is never overwritten.
+    Every crawler must be stopped first: the matches they write after the archive was read would be left on the _old
+    tables, and their cached ids and known matches belong to the old tables. The crawlers hold leases while running, so
+    the swap is refused while any lease is live.
+
+    Args:
+        suffix (string): Suffix of the shadow tables, such as _shadow.
+
+    Raises:
+        Exception: If a crawler holds a lease.
+    """
+    live = count_live_leases()
+    if live:
+        raise Exception(
+            f"{live} leases are held by running crawlers, stop every crawler before the swap"
+        )
+    sql = f"""RENAME TABLE tb_match_info TO tb_match_info_old, tb_match_info{suffix} TO tb_match_info,
+        tb_player_stats TO tb_player_stats_old, tb_player_stats{suffix} TO tb_player_stats"""
+    try:
+        execute_query(sql)
+    except Exception as e:
+        raise e
+    # The cached ids belong to the old table.
+    match_id_cache.clear()
+
+
 # Function to select all the data.
+@timed_query
 def get_all_stats():
     """
     Select all the data from the player_stats table.
+    Loads the whole table at once, stream_stats reads it in chunks with only the needed columns and rows.
     """
     sql = """SELECT * FROM tb_player_stats"""
     try:
@@ -324,9 +1260,11 @@ def get_all_stats():
 
 
 # Function to select all the data.
+@timed_query
 def get_all_players():
     """
     Select all the data from the player_info table.
+    Loads the whole table at once, stream_players reads it in chunks with only the needed columns and rows.
     """
     sql = """SELECT * FROM tb_player_info"""
     try:
@@ -337,9 +1275,11 @@ def get_all_players():
 
 
 # Function to select all the data.
+@timed_query
 def get_all_matches():
     """
     Select all the data from the match_info table.
+    Loads the whole table at once, stream_matches reads it in chunks with only the needed columns and rows.
     """
     sql = """SELECT * FROM tb_match_info"""
     try:
@@ -349,7 +1289,406 @@ def get_all_matches():
         raise e
 
 
+# Columns that can be read by the streaming queries, by the alias of their table.
+# The match_id and player_id of the stats are the ids, the natural keys are read as match_key and puuid.
+stream_columns = {
+    "s": (
+        "id",
+        "player_id",
+        "match_id",
+        "champion_id",
+        "kills",
+        "deaths",
+        "assists",
+        "kda",
+        "gold_earned",
+        "gold_spent",
+        "gold_per_minute",
+        "damage_per_minute",
+        "total_damage_dealt_to_champions",
+        "neutral_minions_killed",
+        "total_minions_killed",
+        "total_cs",
+        "cs_per_min",
+        "vision_score",
+        "vision_score_per_min",
+        "control_wards_placed",
+        "wards_placed",
+        "wards_killed",
+        "individual_position",
+        "team",
+    ),
+    "m": (
+        "id",
+        "match_id",
+        "match_start",
+        "match_duration",
+        "match_winner",
+        "match_surrender",
+        "match_remake",
+    ),
+    "p": (
+        "id",
+        "puuid",
+        "platform",
+        "summoner_id",
+        "game_name",
+        "tag_line",
+        "summoner_level",
+        "profile_icon_id",
+        "tier",
+        "division",
+        "league_points",
+        "wins",
+        "losses",
+        "last_fetch",
+        "last_rating",
+    ),
+}
+
+# Joins of the tables read along with tb_player_stats.
+stream_joins = {
+    "m": "JOIN tb_match_info m ON m.id = s.match_id",
+    "p": "JOIN tb_player_info p ON p.id = s.player_id",
+}
+
+# Columns of the joined tables whose names are used by tb_player_stats, read with another name.
+stream_renamed = {"match_key": ("m", "match_id"), "puuid": ("p", "puuid")}
+
+
+# Function to get the select expression of a column.
+def stream_column(base, column):
+    """
+    Finds the table of a column, looking on the base table first and then on the tables that can be joined to it.
+
+    Args:
+        base (string): Alias of the table being read, s, m or p.
+        column (string): Name of the column, or match_key and puuid for the natural keys when reading the stats.
+
+    Raises:
+        ValueError: If no table has the column.
+
+    Returns:
+        Tuple[string, string]: The alias of the table of the column and the select expression.
+    """
+    if base == "s" and column in stream_renamed:
+        alias, name = stream_renamed[column]
+        return alias, f"{alias}.{name} AS {column}"
+    if column in stream_columns[base]:
+        return base, f"{base}.{column}"
+    if base == "s":
+        for alias in ("m", "p"):
+            if column in stream_columns[alias]:
+                return alias, f"{alias}.{column}"
+    raise ValueError(f"Unknown column for the query: {column}")
+
+
+# Function to build the query of a streamed read.
+def build_stream_query(
+    base,
+    columns=None,
+    start_date=None,
+    end_date=None,
+    tier=None,
+    champion_id=None,
+    position=None,
+    platform=None,
+    exclude_remakes=False,
+):
+    """
+    Builds the SELECT of the projected columns with every filter as a WHERE condition, joining only the tables that are needed.
+    The filters that don't apply to the table being read, such as the champion on the matches, raise a error instead of being ignored.
+
+    Args:
+        base (string): Alias of the table being read, s (tb_player_stats), m (tb_match_info) or p (tb_player_info).
+        columns (List[string], optional): Columns to read. Defaults to every column of the table.
+        start_date (datetime, optional): Only the matches that started on or after it.
+        end_date (datetime, optional): Only the matches that started before it.
+        tier (string or List[string], optional): Only the players of the tiers, the current tier of the player.
+        champion_id (int or List[int], optional): Only the stats of the champions.
+        position (string or List[string], optional): Only the stats of the positions.
+        platform (string, optional): Only the players of the platform.
+        exclude_remakes (bool, optional): Leave out the remakes. Defaults to False.
+
+    Raises:
+        ValueError: If a column or filter doesn't apply to the table.
+
+    Returns:
+        Tuple[string, tuple, List[string]]: The query, its parameters and the names of the columns.
+    """
+    columns = list(columns) if columns else list(stream_columns[base])
+    aliases = {base}
+    expressions = []
+    for column in columns:
+        alias, expression = stream_column(base, column)
+        aliases.add(alias)
+        expressions.append(expression)
+
+    conditions = []
+    params = []
+
+    # Add a condition on a column of a table, which must be the base table or joined to it.
+    def add(alias, condition, values):
+        if alias != base and base != "s":
+            raise ValueError(
+                f"The filter on {alias}.{condition.split()[0]} doesn't apply to the table."
+            )
+        aliases.add(alias)
+        conditions.append(f"{alias}.{condition}")
+        params.extend(values)
+
+    # Add a condition on one value or on a list of values.
+    def add_in(alias, column, value):
+        values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+        add(alias, f"{column} IN ({', '.join(['%s'] * len(values))})", values)
+
+    if start_date is not None:
+        add("m", "match_start >= %s", [start_date])
+    if end_date is not None:
+        add("m", "match_start < %s", [end_date])
+    if exclude_remakes:
+        add("m", "match_remake IS NOT TRUE", [])
+    if tier is not None:
+        add_in("p", "tier", tier)
+    if platform is not None:
+        add_in("p", "platform", platform)
+    if champion_id is not None:
+        add_in("s", "champion_id", champion_id)
+    if position is not None:
+        add_in("s", "individual_position", position)
+
+    tables = {"s": "tb_player_stats s", "m": "tb_match_info m", "p": "tb_player_info p"}
+    sql = f"""SELECT {', '.join(expressions)} FROM {tables[base]}"""
+    for alias in ("m", "p"):
+        if alias != base and alias in aliases:
+            sql += f" {stream_joins[alias]}"
+    if conditions:
+        sql += f" WHERE {' AND '.join(conditions)}"
+    return sql, tuple(params), columns
+
+
+# Generator of the DataFrames of a query, read in chunks.
+def stream_frames(sql, params, columns, chunk_size, index_col="id"):
+    """
+    Reads the query through a unbuffered cursor, so only a chunk of rows is on memory at a time.
+    The connection is held until the generator is exhausted or closed.
+
+    Yields:
+        DataFrame: The next chunk of rows, indexed by the index_col when it was read.
+    """
+    for rows in stream_query(sql, params, batch_size=chunk_size):
+        df = pd.DataFrame.from_records(rows, columns=columns)
+        if index_col in columns:
+            df = df.set_index(index_col)
+        yield df
+
+
+# Generator of the stats, filtered and projected on the database.
+def stream_stats(
+    columns=None,
+    start_date=None,
+    end_date=None,
+    tier=None,
+    champion_id=None,
+    position=None,
+    exclude_remakes=True,
+    chunk_size=100000,
+):
+    """
+    Reads tb_player_stats in chunks, joined to the matches and players only when a column or filter needs them.
+    The memory used depends on the chunk size only, not on the size of the table.
+
+    Args:
+        columns (List[string], optional): Columns of the stats, of the match (match_start, match_remake, ...) or of the player (tier, platform, ...), with match_key and puuid for the natural keys. Defaults to every column of the stats.
+        start_date (datetime, optional): Only the matches that started on or after it.
+        end_date (datetime, optional): Only the matches that started before it.
+        tier (string or List[string], optional): Only the players of the tiers, the current tier of the player.
+        champion_id (int or List[int], optional): Only the stats of the champions.
+        position (string or List[string], optional): Only the stats of the positions.
+        exclude_remakes (bool, optional): Leave out the remakes. Defaults to True.
+        chunk_size (int, optional): Amount of rows of each DataFrame. Defaults to 100000.
+
+    Yields:
+        DataFrame: The next chunk of stats, indexed by the id when it was read.
+    """
+    sql, params, names = build_stream_query(
+        "s",
+        columns,
+        start_date=start_date,
+        end_date=end_date,
+        tier=tier,
+        champion_id=champion_id,
+        position=position,
+        exclude_remakes=exclude_remakes,
+    )
+    yield from stream_frames(sql, params, names, chunk_size)
+
+
+# Generator of the matches, filtered and projected on the database.
+def stream_matches(
+    columns=None,
+    start_date=None,
+    end_date=None,
+    exclude_remakes=True,
+    chunk_size=100000,
+):
+    """
+    Args:
+        columns (List[string], optional): Columns of tb_match_info. Defaults to every column.
+        start_date (datetime, optional): Only the matches that started on or after it.
+        end_date (datetime, optional): Only the matches that started before it.
+        exclude_remakes (bool, optional): Leave out the remakes. Defaults to True.
+        chunk_size (int, optional): Amount of rows of each DataFrame. Defaults to 100000.
+
+    Yields:
+        DataFrame: The next chunk of matches, indexed by the id when it was read.
+    """
+    sql, params, names = build_stream_query(
+        "m",
+        columns,
+        start_date=start_date,
+        end_date=end_date,
+        exclude_remakes=exclude_remakes,
+    )
+    yield from stream_frames(sql, params, names, chunk_size)
+
+
+# Generator of the players, filtered and projected on the database.
+def stream_players(columns=None, tier=None, platform=None, chunk_size=100000):
+    """
+    Args:
+        columns (List[string], optional): Columns of tb_player_info. Defaults to every column.
+        tier (string or List[string], optional): Only the players of the tiers.
+        platform (string, optional): Only the players of the platform.
+        chunk_size (int, optional): Amount of rows of each DataFrame. Defaults to 100000.
+
+    Yields:
+        DataFrame: The next chunk of players, indexed by the id when it was read.
+    """
+    sql, params, names = build_stream_query("p", columns, tier=tier, platform=platform)
+    yield from stream_frames(sql, params, names, chunk_size)
+
+
+# Function to get the id of the last match inserted.
+@timed_query
+def get_max_match_id():
+    """
+    Returns:
+        int: The largest id of tb_match_info, 0 if it's empty.
+    """
+    sql = """SELECT COALESCE(MAX(id), 0) FROM tb_match_info"""
+    try:
+        return execute_query(sql)[0][0]
+    except Exception as e:
+        raise e
+
+
+# Function to read the matches of a range of ids, with the day of the match.
+@timed_query
+def get_matches_between(after, upto):
+    """
+    Args:
+        after (int): Id of the last match already read, left out.
+        upto (int): Id of the last match to read.
+
+    Returns:
+        DataFrame: The matches, with the match_id as given by the API and a day column with the date of the start.
+    """
+    columns = [name for name in stream_columns["m"] if name != "id"]
+    sql = f"""SELECT {', '.join(columns)}, DATE(match_start) FROM tb_match_info WHERE id > %s AND id <= %s ORDER BY id"""
+    try:
+        return pd.DataFrame.from_records(
+            execute_query(sql, (after, upto)), columns=columns + ["day"]
+        )
+    except Exception as e:
+        raise e
+
+
+# Function to read the stats of a range of matches, with the ids resolved.
+@timed_query
+def get_stats_between(after, upto):
+    """
+    Args:
+        after (int): Id of the last match already read, left out.
+        upto (int): Id of the last match to read.
+
+    Returns:
+        DataFrame: The stats of the matches, with the match_id and puuid instead of the ids and a day column with the date of the start of the match.
+    """
+    columns = [
+        name
+        for name in stream_columns["s"]
+        if name not in ("id", "player_id", "match_id")
+    ]
+    sql = f"""SELECT m.match_id, p.puuid, {', '.join('s.' + name for name in columns)}, DATE(m.match_start)
+        FROM tb_player_stats s
+        JOIN tb_match_info m ON m.id = s.match_id
+        JOIN tb_player_info p ON p.id = s.player_id
+        WHERE s.match_id > %s AND s.match_id <= %s"""
+    try:
+        return pd.DataFrame.from_records(
+            execute_query(sql, (after, upto)),
+            columns=["match_id", "puuid"] + columns + ["day"],
+        )
+    except Exception as e:
+        raise e
+
+
+# Function to read the aggregated stats of the champions.
+@timed_query
+def get_champion_stats(
+    champion_id=None, position=None, tier=None, start_date=None, end_date=None
+):
+    """
+    Reads tb_champion_stats, summing the days of the range, instead of aggregating tb_player_stats.
+
+    Args:
+        champion_id (int, optional): Only the given champion. Defaults to every champion.
+        position (string, optional): Only the given position. Defaults to every position.
+        tier (string, optional): Only the given tier, UNRANKED for players without rating. Defaults to every tier.
+        start_date (date, optional): First day of the range. Defaults to the first day.
+        end_date (date, optional): Last day of the range. Defaults to the last day.
+
+    Returns:
+        DataFrame: The games, win_rate, kda, gold_per_minute and cs_per_min of each champion, position and tier.
+    """
+    filters = []
+    params = []
+    for column, value, operator in (
+        ("champion_id", champion_id, "="),
+        ("position", position, "="),
+        ("tier", tier, "="),
+        ("day", start_date, ">="),
+        ("day", end_date, "<="),
+    ):
+        if value is not None:
+            filters.append(f"{column} {operator} %s")
+            params.append(value)
+    where = f"WHERE {' AND '.join(filters)}" if filters else ""
+    sql = f"""SELECT champion_id, position, tier, SUM(games) AS games, SUM(wins) / SUM(games) AS win_rate,
+        SUM(kda_sum) / SUM(games) AS kda, SUM(gold_per_minute_sum) / SUM(games) AS gold_per_minute,
+        SUM(cs_per_min_sum) / SUM(games) AS cs_per_min
+        FROM tb_champion_stats {where} GROUP BY champion_id, position, tier"""
+    try:
+        return pd.DataFrame(
+            execute_query(sql, tuple(params)),
+            columns=[
+                "champion_id",
+                "position",
+                "tier",
+                "games",
+                "win_rate",
+                "kda",
+                "gold_per_minute",
+                "cs_per_min",
+            ],
+        )
+    except Exception as e:
+        raise e
+
+
 # Function to get the default value for the last fetch column.
+@timed_query
 def get_default_fetch_date():
     """
     Function to get the default value for the last fetch column.
@@ -369,16 +1708,23 @@ def get_default_fetch_date():
 
 
 # Function to verify if the database is empty or not.
-def empty_db():
+@timed_query
+def empty_db(platform=None):
     """
     Function that gets the count of player on the database.
 
+    Args:
+        platform (string, optional): Only count the players of this platform. Defaults to None, counting every player.
+
     Returns:
         bool: If the database is empty, returns true, otherwise returns false.
     """
     sql = """SELECT count(*) FROM tb_player_info"""
     try:
-        count = execute_query(sql)
+        if platform is None:
+            count = execute_query(sql)
+        else:
+            count = execute_query(sql + " WHERE platform = %s", (platform,))
         if count[0][0] == 0:
             return True
         else:
@@ -388,6 +1734,7 @@ def empty_db():
 
 
 # Function to verify if the last time a player was rated was today.
+@timed_query
 def last_rating_today(puuid):
     """
     Function that selects the last time a player was rated and compares it against the current day.
@@ -401,7 +1748,7 @@ def last_rating_today(puuid):
         last_rating = execute_query(sql, (puuid,))
         last_rating = last_rating[0][0]
         if last_rating is not None:
-            if last_rating.date() == datetime.now().date:
+            if last_rating.date() == datetime.now().date():
                 return True
             else:
                 return False
@@ -409,7 +1756,71 @@ def last_rating_today(puuid):
         raise e
 
 
+# Function to get the last time many players were rated.
+@timed_query
+def get_last_ratings(puuids):
+    """
+    Function that selects the last time each player was rated, with a single query.
+
+    Args:
+        puuids (List[string]): The puuids of the players.
+
+    Returns:
+        Dict: The last_rating of each puuid found on the database.
+    """
+    if not puuids:
+        return {}
+    placeholders = ", ".join(["%s"] * len(puuids))
+    sql = f"""SELECT puuid, last_rating FROM tb_player_info WHERE puuid IN ({placeholders})"""
+    try:
+        return dict(execute_query(sql, tuple(puuids)))
+    except Exception as e:
+        raise e
+
+
+# Function to update the rating of many players at once.
+@timed_query
+def update_ratings(ratings):
+    """
+    Function to update the rating and the rating date of many players with executemany, on a single transaction.
+    Players that aren't on the database are ignored.
+
+    Args:
+        ratings (List[Tuple]): The rating dict, puuid and summoner id of each player. When the puuid is None, the player is found by the summoner id.
+    """
+    columns = """tier = %s, division = %s, league_points = %s, wins = %s, losses = %s, last_rating = CURDATE()"""
+    by_column = {"puuid": [], "summoner_id": []}
+    for rating, puuid, summoner_id in ratings:
+        values = (
+            rating["tier"],
+            rating["division"],
+            rating["league_points"],
+            rating["wins"],
+            rating["losses"],
+        )
+        if puuid is not None:
+            by_column["puuid"].append(values + (puuid,))
+        else:
+            by_column["summoner_id"].append(values + (summoner_id,))
+    connection = get_connection()
+    cursor = connection.cursor()
+    try:
+        for column, rows in by_column.items():
+            if rows:
+                cursor.executemany(
+                    f"""UPDATE tb_player_info SET {columns} WHERE {column} = %s""", rows
+                )
+        connection.commit()
+    except Exception as e:
+        connection.rollback()
+        raise e
+    finally:
+        cursor.close()
+        connection.close()
+
+
 # Function to update the last time a player rating was updated.
+@timed_query
 def update_rating_date(puuid):
     """
     Update the last time a player rating was updated, setting it as today.
@@ -423,6 +1834,7 @@ def update_rating_date(puuid):
 
 
 # Function to update the player rating.
+@timed_query
 def update_rating(rating, puuid):
     """
     Function to update the player rating of a given player.
@@ -0,0 +1,216 @@
+import json
+import os
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from db_operations import (
+    get_matches_between,
+    get_max_match_id,
+    get_stats_between,
+    stream_players,
+)
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+"""
+    Module with the export of the tables to Parquet datasets, read by the analysis tools instead of the database.
+    The matches and stats are partitioned by the day of the start of the match, as day=YYYY-MM-DD folders, and carry the
+    match_id and puuid instead of the ids of the database. The players are a single snapshot, replaced on every run, since
+    their ratings change.
+
+    Each run only exports the matches inserted after the watermark, the id of the last match exported, read in ranges of
+    ids so only a chunk is on memory at a time. The files of a chunk are written by a pool of threads, and the watermark
+    moves once every chunk before it is written.
+    The ids aren't committed in order, a transaction of another process can commit a lower id after a export passed
+    it, so every run also exports again the last EXPORT_RESCAN ids before the watermark. The chunks are aligned to
+    multiples of the chunk size and a file is named by the range of its chunk, so a chunk exported again replaces its
+    own files instead of duplicating them. The chunk size is kept on the watermark, so the chunks stay aligned.
+    The ids change when the reprocessed tables replace the live ones, so the swap resets the export.
+"""
+
+# Folder of the datasets.
+export_dir = os.getenv("EXPORT_DIR", "export")
+
+# Amount of matches of each chunk, by their ids.
+export_chunk_size = int(os.getenv("EXPORT_CHUNK_SIZE", 20000))
+
+# Amount of threads writing the files.
+export_workers = int(os.getenv("EXPORT_WORKERS", 4))
+
+# Amount of ids before the watermark exported again on every run, to get the matches committed after a export passed them.
+export_rescan = int(os.getenv("EXPORT_RESCAN", 20000))
+
+# Compression of the Parquet files.
+export_compression = os.getenv("EXPORT_COMPRESSION", "zstd")
+
+
+# Function to read the watermark of the export.
+def read_watermark(directory):
+    """
+    Returns:
+        Tuple[int, int]: The id of the last match exported, 0 before the first run, and the chunk size of the export, None before the first run.
+    """
+    path = os.path.join(directory, "_watermark.json")
+    if not os.path.exists(path):
+        return 0, None
+    with open(path, "r") as watermark_file:
+        watermark = json.load(watermark_file)
+    return watermark["match_id"], watermark.get("chunk_size")
+
+
+# Function to store the watermark of the export.
+def write_watermark(directory, match_id, chunk_size):
+    # Written to a temporary file and renamed, so a crash never leaves a partial watermark.
+    path = os.path.join(directory, "_watermark.json")
+    with open(path + ".tmp", "w") as watermark_file:
+        json.dump(
+            {
+                "match_id": match_id,
+                "chunk_size": chunk_size,
+                "exported_at": datetime.now().isoformat(),
+            },
+            watermark_file,
+        )
+    os.replace(path + ".tmp", path)
+
+
+# Function to drop the exported matches and stats, so the next export writes them again.
+def reset_export(directory=export_dir):
+    """
+    Needed when the ids of the matches change, as after the swap of the reprocessed tables, since the watermark and the
+    names of the files are ids. The players snapshot is replaced by every export, so it's kept.
+    """
+    for dataset in ("matches", "stats"):
+        shutil.rmtree(os.path.join(directory, dataset), ignore_errors=True)
+    path = os.path.join(directory, "_watermark.json")
+    if os.path.exists(path):
+        os.remove(path)
+
+
+# Function to write the rows of a day of a chunk.
+def write_partition(df, directory, dataset, day, name):
+    """
+    Args:
+        df (DataFrame): The rows of the day, without the day column.
+        directory (string): Folder of the datasets.
+        dataset (string): Name of the dataset, matches or stats.
+        day (date): Day of the partition.
+        name (string): Name of the file, unique for the chunk.
+    """
+    folder = os.path.join(directory, dataset, f"day={day}")
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{name}.parquet")
+    df.to_parquet(path + ".tmp", index=False, compression=export_compression)
+    os.replace(path + ".tmp", path)
+
+
+# Function to split a chunk into the writes of each day.
+def partition_writes(executor, directory, dataset, df, name):
+    """
+    Returns:
+        List[Future]: The writes of each day of the chunk.
+    """
+    return [
+        executor.submit(
+            write_partition,
+            rows.drop(columns="day"),
+            directory,
+            dataset,
+            day,
+            name,
+        )
+        for day, rows in df.groupby("day", sort=False)
+    ]
+
+
+# Function to export the players as a single snapshot.
+def export_players(directory, chunk_size):
+    """
+    Streams tb_player_info into numbered files of a temporary folder and replaces the previous snapshot with it.
+
+    Returns:
+        int: The amount of players exported.
+    """
+    temporary = os.path.join(directory, "players.tmp")
+    shutil.rmtree(temporary, ignore_errors=True)
+    os.makedirs(temporary)
+    exported = 0
+    for index, df in enumerate(stream_players(chunk_size=chunk_size)):
+        df.reset_index(drop=True).to_parquet(
+            os.path.join(temporary, f"part-{index:06d}.parquet"),
+            index=False,
+            compression=export_compression,
+        )
+        exported += len(df)
+    folder = os.path.join(directory, "players")
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(temporary, folder)
+    return exported
+
+
+# Function to export the matches inserted since the last run.
+def export(directory=export_dir, chunk_size=export_chunk_size, workers=export_workers):
+    """
+    Exports the matches and stats inserted after the watermark and the last EXPORT_RESCAN ids before it, and a new snapshot of the players.
+    The database connection must be open.
+
+    Args:
+        directory (string, optional): Folder of the datasets. Defaults to EXPORT_DIR.
+        chunk_size (int, optional): Amount of match ids of each chunk. Defaults to EXPORT_CHUNK_SIZE.
+        workers (int, optional): Amount of threads writing the files. Defaults to EXPORT_WORKERS.
+
+    Raises:
+        ImportError: If pyarrow isn't installed.
+
+    Returns:
+        int: The amount of matches exported, including the rescanned ones.
+    """
+    if pyarrow is None:
+        raise ImportError("The export needs pyarrow, install it with pip.")
+    os.makedirs(directory, exist_ok=True)
+    watermark, stored_size = read_watermark(directory)
+    # Chunks of another size wouldn't replace the files of the previous runs.
+    chunk_size = stored_size or chunk_size
+    # Matches inserted during the export are left for the next run.
+    last = get_max_match_id()
+    # Starts from the chunk of the first id rescanned.
+    first = max(watermark - export_rescan, 0) // chunk_size * chunk_size
+    print(
+        f"Exporting the matches with ids from {watermark + 1} to {last}, rescanning from {first + 1}."
+    )
+
+    exported = 0
+    started = time.monotonic()
+    with ThreadPoolExecutor(workers) as executor:
+        # The writes of a chunk are only waited for once two chunks per worker are in flight.
+        in_flight = deque()
+        for after in range(first, last, chunk_size):
+            upto = min(after + chunk_size, last)
+            # Named by the whole range of the chunk, so the last chunk is replaced once it's complete.
+            name = f"part-{after + 1:010d}-{after + chunk_size:010d}"
+            matches = get_matches_between(after, upto)
+            stats = get_stats_between(after, upto)
+            writes = partition_writes(
+                executor, directory, "matches", matches, name
+            ) + partition_writes(executor, directory, "stats", stats, name)
+            in_flight.append((upto, len(matches), writes))
+            while in_flight and (
+                len(in_flight) >= workers * 2 or after + chunk_size >= last
+            ):
+                upto, count, writes = in_flight.popleft()
+                for write in writes:
+                    write.result()
+                write_watermark(directory, max(upto, watermark), chunk_size)
+                exported += count
+
+    players = export_players(directory, chunk_size)
+    elapsed = time.monotonic() - started
+    print(
+        f"Exported {exported} matches and {players} players in {elapsed:.1f} seconds, {exported / max(elapsed, 1e-9):.1f} matches/sec."
+    )
+    return exported
@@ -1,81 +1,336 @@
+import aiohttp
+import asyncio
+import json
 import os
-import requests
+import threading
 import time
+import weakref
+import metrics
+from collections import OrderedDict
+from archive import get_archive
 from dotenv import load_dotenv
+from rate_limiter import RateLimiter, get_endpoint
+from routing import api_url, default_platform, get_match_platform, get_region
 
-# Loads the API KEY from the .env file and creates a session for the requests.
+# Loads the API KEY from the .env file.
 load_dotenv("credentials.env")
 api_key = os.getenv("API_KEY")
-session = requests.Session()
 
-retry_after = 0
+# Maximum amount of simultaneous connections kept open by each aiohttp session.
+max_connections = int(os.getenv("MAX_CONNECTIONS", 100))
+
+# One aiohttp session per event loop, since a session can only be used by the loop that created it.
+sessions = weakref.WeakKeyDictionary()
+
+# Background event loop used by the synchronous wrappers, started on the first call.
+sync_loop = None
+sync_loop_lock = threading.Lock()
+
+# Rate limiter shared by every request of the process.
+limiter = RateLimiter()
+
+# APIs whose responses are cached, the ones that don't change between requests made a few minutes apart.
+response_cache_apis = tuple(
+    api
+    for api in os.getenv("RESPONSE_CACHE_APIS", "league-v4,summoner-v4").split(",")
+    if api
+)
+
+# Maximum amount of responses kept on the cache, 0 disables it.
+response_cache_size = int(os.getenv("RESPONSE_CACHE_SIZE", 10000))
+
+# Seconds a cached response is used.
+response_cache_ttl = float(os.getenv("RESPONSE_CACHE_TTL", 300))
+
+# Requests in flight on each event loop, by URL, shared by every caller of the same URL.
+in_flight = weakref.WeakKeyDictionary()
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache of the bodies of the responses, each one expiring after the TTL.
+    Shared by every event loop of the process, so it's guarded by a lock.
+
+    Args:
+        size (int): Maximum amount of responses.
+        ttl (float): Seconds each response is kept.
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        # URL => (expiration, body), the least recently used first.
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    # Get the body of a URL, None when it isn't cached or expired.
+    def get(self, url):
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[url]
+                return None
+            self.entries.move_to_end(url)
+            return entry[1]
+
+    def put(self, url, body):
+        if self.size <= 0:
+            return
+        with self.lock:
+            self.entries[url] = (time.monotonic() + self.ttl, body)
+            self.entries.move_to_end(url)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    # Drop every cached response.
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+# Cache of the responses of the RESPONSE_CACHE_APIS.
+response_cache = ResponseCache(response_cache_size, response_cache_ttl)
+
+
+# Function to get the aiohttp session of the running event loop.
+def get_session():
+    """
+    Returns the session bound to the running event loop, creating it on the first call.
+    All the requests made from the same loop share the connection pool of this session.
+
+    Returns:
+        aiohttp.ClientSession: The session of the running loop.
+    """
+    loop = asyncio.get_running_loop()
+    session = sessions.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(
+            headers={"X-Riot-Token": f"{api_key}"},
+            connector=aiohttp.TCPConnector(limit=max_connections),
+        )
+        sessions[loop] = session
+    return session
+
+
+# Function to close the session of the running event loop.
+async def close_session():
+    """
+    Closes the session of the running event loop, should be awaited before the loop finishes.
+    """
+    session = sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
+# Function to get the background loop used by the synchronous functions.
+def get_sync_loop():
+    """
+    Starts a event loop on a daemon thread on the first call and returns it on the following ones.
+    Every synchronous call is scheduled on this loop, so all threads share the same session.
+
+    Returns:
+        asyncio.AbstractEventLoop: The background event loop.
+    """
+    global sync_loop
+    with sync_loop_lock:
+        if sync_loop is None:
+            sync_loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=sync_loop.run_forever, name="fetch-loop", daemon=True
+            ).start()
+    return sync_loop
+
+
+# Function to run a coroutine from synchronous code.
+def run_sync(coro):
+    """
+    Runs the coroutine on the background loop and blocks until it finishes.
+    Can be called from any thread, but not from inside a running event loop, where the coroutine should be awaited instead.
+
+    Args:
+        coro (coroutine): The coroutine to run.
+
+    Returns:
+        Any: The value returned by the coroutine.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run_coroutine_threadsafe(coro, get_sync_loop()).result()
+    coro.close()
+    raise RuntimeError("Synchronous fetch called from a running event loop, await it.")
 
 
 # Generic function to fetch the data from a given URL.
-def fetch(url):
+async def fetch_async(url, raw=False):
     """
     Function that fetches the data from the URL passed as parameter.
+    The responses of the RESPONSE_CACHE_APIS are read from the cache while they don't expire. When the same URL is
+    already being requested from the same event loop, the caller waits for that request instead of sending another one.
+    Each caller decodes the body on its own, so the dicts returned aren't shared.
+
+    Args:
+        url (string): The URL of the API endpoint.
+        raw (bool, optional): Return the body of the response without decoding it. Defaults to False.
+
+    Returns:
+        Dict: Returns the dict received from the API, or its bytes when raw.
+        NONE: Returns none if any other error is returned.
+    """
+    endpoint = get_endpoint(url)[1]
+    cached = endpoint.split(".")[0] in response_cache_apis
+    body = None
+    if cached:
+        body = response_cache.get(url)
+        metrics.response_cache.inc(1, endpoint, "miss" if body is None else "hit")
+    if body is None:
+        requests = in_flight.setdefault(asyncio.get_running_loop(), {})
+        request = requests.get(url)
+        if request is None:
+            request = asyncio.ensure_future(request_async(url, endpoint))
+            requests[url] = request
+            request.add_done_callback(lambda _: requests.pop(url, None))
+        else:
+            metrics.coalesced_requests.inc(1, endpoint)
+        # A cancelled caller doesn't cancel the request of the others.
+        body = await asyncio.shield(request)
+        if body is None:
+            return None
+        if cached:
+            response_cache.put(url, body)
+    return body if raw else json.loads(body)
+
+
+# Coroutine to send a request, retrying while it's rate limited.
+async def request_async(url, endpoint):
+    """
+    Waits for a slot of the shared rate limiter before each request, so the limits of the key are respected by every worker.
     Continuously fetches the data until a response is received or a error different than 429 occurs.
-    If the error is 429, wait till the api call limit refreshes.
+    If the error is 429, the rate limiter blocks the bucket till the api call limit refreshes and the request is retried.
 
     Args:
         url (string): The URL of the API endpoint.
+        endpoint (string): Name of the endpoint, used on the metrics.
 
     Returns:
-        Dict: Returns the dict received from the API.
+        bytes: Returns the body received from the API.
         NONE: Returns none if any other error is returned.
     """
+    session = get_session()
     while True:
-        global retry_after
-        if retry_after > 0:
-            time.sleep(retry_after + 1)
-            retry_after = 0
         try:
-            # Does a GET request with the given URL and api key on the header.
-            response = session.get(url, headers={"X-Riot-Token": f"{api_key}"})
-            # If the response was successful, just return it.
-            if response.status_code == 200:
-                return response.json()
-            # If the response was unsuccessful with the status code 429, then the rate limit was reached.
-            # A retry after header is going to be received, so the code will sleep until it's possible to do a retry.
-            elif response.status_code == 429:
-                retry_after = int(response.headers.get("Retry-After", 1))
-                print(
-                    f"Rate limit exceeded. Waiting for {retry_after} seconds before retrying..."
+            slept = await limiter.wait_async(url)
+            if slept > 0:
+                metrics.rate_limit_sleep.inc(slept, endpoint)
+            started = time.perf_counter()
+            # Does a GET request with the given URL, the api key is already on the session headers.
+            async with session.get(url) as response:
+                latency = time.perf_counter() - started
+                metrics.api_requests.inc(1, endpoint, response.status)
+                metrics.api_latency.observe(latency, endpoint, response.status)
+                # The limits and counts on the headers are sent on every response, including the errors.
+                retry_after = limiter.update(
+                    url, response.status, response.headers, latency
                 )
-            # If any other error occurs, raise an exception.
-            else:
-                raise Exception(f"Response failed with code: {response.status_code}")
+                # If the response was successful, just return it.
+                if response.status == 200:
+                    return await response.read()
+                # If the response was unsuccessful with the status code 429, then the rate limit was reached.
+                # The next wait on the limiter will sleep until it's possible to do a retry.
+                elif response.status == 429:
+                    print(
+                        f"Rate limit exceeded. Waiting for {retry_after} seconds before retrying..."
+                    )
+                # If any other error occurs, raise an exception.
+                else:
+                    raise Exception(f"Response failed with code: {response.status}")
         except Exception as e:
+            metrics.errors.inc(1, "fetch", type(e).__name__)
             print(e)
             return None
 
 
+def fetch(url):
+    """
+    Synchronous version of fetch_async.
+    """
+    return run_sync(fetch_async(url))
+
+
 # Function to fetch the list of matches of a given player.
-def fetch_matches(puuid, start_value, start_date):
+async def fetch_matches_async(
+    puuid, start_value, start_date, platform=default_platform, end_date=None
+):
     """
     Function that receives a array of matches from the server.
+    The request is sent to the regional cluster of the player's platform.
 
     Args:
         puuid (string): The player whose matches will be fetched.
         start_value (integer): How many matches were already fetched, starting to fetch after it.
         start_date (date): Date to start fetching match data. Converts to timestamp format, which is used by the server.
+        platform (string, optional): Platform of the player. Defaults to the default platform.
+        end_date (date, optional): Date to stop fetching match data. Defaults to None, fetching until now.
 
     Returns:
-        Dict: Returns the dict received from the API.
+        Dict: Returns the dict received from the API, the ids sorted from the newest match.
         NONE: Returns none if any other error is returned to the fecth function.
     """
     timestamp = int(start_date.timestamp())
-    data = fetch(
-        f"https://americas.api.riotgames.com/lol/match/v5/matches/by-puuid/{puuid}/ids?startTime={timestamp}&queue=420&start={start_value}&count=100"
-    )
+    path = f"/lol/match/v5/matches/by-puuid/{puuid}/ids?startTime={timestamp}&queue=420&start={start_value}&count=100"
+    if end_date is not None:
+        path += f"&endTime={int(end_date.timestamp())}"
+    data = await fetch_async(api_url(get_region(platform), path))
     return data
 
 
+def fetch_matches(
+    puuid, start_value, start_date, platform=default_platform, end_date=None
+):
+    """
+    Synchronous version of fetch_matches_async.
+    """
+    return run_sync(
+        fetch_matches_async(puuid, start_value, start_date, platform, end_date)
+    )
+
+
+# Function to fetch the body of a given match.
+async def fetch_match_raw_async(match_id):
+    """
+    Function to fetch the body of a given match, without decoding it.
+    The regional cluster is derived from the platform prefix of the match id.
+    The local archive is checked first, and every payload fetched is stored on it.
+
+    Args:
+        match_id (string): The ID of the match to fetch.
+
+    Returns:
+        bytes: Returns the body received from the API.
+        NONE: Returns none if any other error is returned to the fecth function.
+    """
+    archive = get_archive()
+    if archive is not None and match_id in archive:
+        return await asyncio.to_thread(archive.get_raw, match_id)
+    region = get_region(get_match_platform(match_id))
+    raw = await fetch_async(
+        api_url(region, f"/lol/match/v5/matches/{match_id}"), raw=True
+    )
+    if raw is not None and archive is not None:
+        # The match was fetched, a failure of the archive only loses the local copy.
+        try:
+            await asyncio.to_thread(archive.put, match_id, raw)
+        except Exception as e:
+            print(f"Error archiving the match {match_id}: ", e)
+    return raw
+
+
 # Function to fetch the data from a given match.
-def fetch_match_data(match_id):
+async def fetch_match_data_async(match_id):
     """
-    Function to fetch the data from a given match from the server.
+    Function to fetch the data from a given match from the server, decoded into dicts.
 
     Args:
         match_id (string): The ID of the match to fetch.
@@ -84,65 +339,192 @@ def fetch_match_data(match_id):
         Dict: Returns the dict received from the API.
         NONE: Returns none if any other error is returned to the fecth function.
     """
-    data = fetch(f"https://americas.api.riotgames.com/lol/match/v5/matches/{match_id}")
-    return data
+    raw = await fetch_match_raw_async(match_id)
+    return json.loads(raw) if raw is not None else None
+
+
+def fetch_match_data(match_id):
+    """
+    Synchronous version of fetch_match_data_async.
+    """
+    return run_sync(fetch_match_data_async(match_id))
+
+
+# Function to fetch the timeline of a given match.
+async def fetch_timeline_raw_async(match_id):
+    """
+    Function to fetch the body of the timeline of a given match, without decoding it.
+
+    Args:
+        match_id (string): The ID of the match.
+
+    Returns:
+        bytes: Returns the body received from the API.
+        NONE: Returns none if any other error is returned to the fecth function.
+    """
+    region = get_region(get_match_platform(match_id))
+    return await fetch_async(
+        api_url(region, f"/lol/match/v5/matches/{match_id}/timeline"), raw=True
+    )
+
+
+def fetch_timeline_raw(match_id):
+    """
+    Synchronous version of fetch_timeline_raw_async.
+    """
+    return run_sync(fetch_timeline_raw_async(match_id))
 
 
 # Function to fetch data from a given player.
-def fetch_player_details(summoner_id):
+async def fetch_player_details_async(summoner_id, platform=default_platform):
     """
     Function to fetch the data from a given player.
 
     Args:
         summoner_id (string):  Encrypted summoner ID. Max length 63 characters.
+        platform (string, optional): Platform of the player. Defaults to the default platform.
 
     Returns:
         Dict: Returns the dict received from the API.
     """
 
-    data = fetch(
-        f"https://br1.api.riotgames.com/lol/summoner/v4/summoners/{summoner_id}"
+    data = await fetch_async(
+        api_url(platform, f"/lol/summoner/v4/summoners/{summoner_id}")
     )
     return data
 
 
-def fetch_player_rating(summoner_id):
+def fetch_player_details(summoner_id, platform=default_platform):
+    """
+    Synchronous version of fetch_player_details_async.
+    """
+    return run_sync(fetch_player_details_async(summoner_id, platform))
+
+
+async def fetch_player_rating_async(summoner_id, platform=default_platform):
     """
     Function to fetch the current rating of a given player.
     Receives a list with all the queues for the given player, returns only the soloqueue.
+
     Args:
         summoner_id (string): Encrypted summoner ID. Max length 63 characters.
+        platform (string, optional): Platform of the player. Defaults to the default platform.
 
     Returns:
-        Dict: Returns the dict received from the API.
+        Dict: Returns the soloqueue entry received from the API.
+        NONE: Returns none if the player is unranked on the soloqueue.
+
+    Raises:
+        Exception: If the request failed, so a failure isn't taken as a unranked player.
     """
-    data = fetch(
-        f"https://br1.api.riotgames.com/lol/league/v4/entries/by-summoner/{summoner_id}"
+    data = await fetch_async(
+        api_url(platform, f"/lol/league/v4/entries/by-summoner/{summoner_id}")
+    )
+    if data is None:
+        raise Exception(f"Could not fetch the rating of {summoner_id}")
+    # Players without a soloq entry are unranked on it.
+    return next(
+        (queue for queue in data if queue["queueType"] == "RANKED_SOLO_5x5"), None
+    )
+
+
+def fetch_player_rating(summoner_id, platform=default_platform):
+    """
+    Synchronous version of fetch_player_rating_async.
+    """
+    return run_sync(fetch_player_rating_async(summoner_id, platform))
+
+
+# Function to fetch a page of the players of a division.
+async def fetch_league_entries_async(
+    tier, division, page, platform=default_platform, queue="RANKED_SOLO_5x5"
+):
+    """
+    Function to fetch a page of the league entries of a tier and division, with the rating of up to 205 players.
+    Only the tiers from IRON to DIAMOND are divided, see fetch_apex_league_async for the others.
+
+    Args:
+        tier (string): The tier, such as GOLD.
+        division (string): The division, from I to IV.
+        page (int): The page, starting at 1. Pages past the last one are empty.
+        platform (string, optional): Platform of the players. Defaults to the default platform.
+        queue (string, optional): The queue of the entries. Defaults to the soloqueue.
+
+    Returns:
+        List[Dict]: Returns the entries received from the API.
+    """
+    data = await fetch_async(
+        api_url(
+            platform, f"/lol/league/v4/entries/{queue}/{tier}/{division}?page={page}"
+        )
+    )
+    return data
+
+
+def fetch_league_entries(
+    tier, division, page, platform=default_platform, queue="RANKED_SOLO_5x5"
+):
+    """
+    Synchronous version of fetch_league_entries_async.
+    """
+    return run_sync(fetch_league_entries_async(tier, division, page, platform, queue))
+
+
+# Function to fetch the league of a apex tier.
+async def fetch_apex_league_async(
+    tier, platform=default_platform, queue="RANKED_SOLO_5x5"
+):
+    """
+    Function to fetch every player of a apex tier (MASTER, GRANDMASTER or CHALLENGER), that has a single league.
+
+    Args:
+        tier (string): The apex tier.
+        platform (string, optional): Platform of the players. Defaults to the default platform.
+        queue (string, optional): The queue of the league. Defaults to the soloqueue.
+
+    Returns:
+        Dict: Returns the league received from the API, with the players on the entries key.
+    """
+    data = await fetch_async(
+        api_url(platform, f"/lol/league/v4/{tier.lower()}leagues/by-queue/{queue}")
     )
-    if data is not None:
-        for queue in data:
-            if queue["queueType"] == "RANKED_SOLO_5x5":
-                data = queue
     return data
 
 
-def fetch_top_challenger():
+def fetch_apex_league(tier, platform=default_platform, queue="RANKED_SOLO_5x5"):
+    """
+    Synchronous version of fetch_apex_league_async.
+    """
+    return run_sync(fetch_apex_league_async(tier, platform, queue))
+
+
+async def fetch_top_challenger_async(platform=default_platform):
     """
     Function to fetch the player details of the player with most points on the Challenger queue, fetching the player info based on the summoner id and returning the puuid.
 
+    Args:
+        platform (string, optional): Platform whose Challenger queue is fetched. Defaults to the default platform.
+
     Returns:
         string: Returns the PUUID of the player with most points on the Challenger queue.
     """
-    data = fetch(
-        "https://br1.api.riotgames.com/lol/league/v4/challengerleagues/by-queue/RANKED_SOLO_5x5"
+    data = await fetch_async(
+        api_url(platform, "/lol/league/v4/challengerleagues/by-queue/RANKED_SOLO_5x5")
     )
     max_lp = max(
         range(len(data["entries"])), key=lambda i: data["entries"][i]["leaguePoints"]
     )
     top_one = data["entries"][max_lp]["summonerId"]
-    player_data = fetch_player_details(top_one)
+    player_data = await fetch_player_details_async(top_one, platform)
     return player_data["puuid"]
 
 
+def fetch_top_challenger(platform=default_platform):
+    """
+    Synchronous version of fetch_top_challenger_async.
+    """
+    return run_sync(fetch_top_challenger_async(platform))
+
+
 def get_retry_after():
-    return retry_after
+    return limiter.get_retry_after()
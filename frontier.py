@@ -0,0 +1,191 @@
+import os
+import time
+from collections import deque
+import leases
+from db_operations import (
+    get_default_fetch_date,
+    lease_players,
+    update_schedules,
+)
+from scheduling import schedule
+
+"""
+    Module with the crawl frontier, the queue of the players to fetch.
+    The players that are due are read from the database in batches following the next_fetch order, with a keyset over
+    the (platform, next_fetch) index instead of a full scan for every player. When the end of a platform is reached it
+    starts again from the beginning, where the players due the longest time ago are.
+    The completed players are buffered, and their last_fetch and next_fetch from the scheduling module are updated on a
+    single transaction for many of them.
+    The match list of a player that was fetched before starts at its high-water mark, the start of the newest match of
+    its own last completed match list, when it's before the last_fetch, and stops on the page with that match. The
+    mark only moves when the player is completed, so the matches inserted through the match lists of other players
+    don't move it. The players never fetched start at the default fetch date, as a backfill.
+    Only the players leased by the process are kept, so many processes can share the same players.
+"""
+
+# Amount of players read from each platform at once.
+frontier_batch_size = int(os.getenv("FRONTIER_BATCH_SIZE", 500))
+
+# Amount of completed players that triggers the update of their last_fetch.
+frontier_commit_size = int(os.getenv("FRONTIER_COMMIT_SIZE", 50))
+
+# Maximum amount of seconds a completed player waits for the update of its last_fetch.
+frontier_commit_interval = float(os.getenv("FRONTIER_COMMIT_INTERVAL", 30))
+
+
+class Frontier:
+    """
+    Frontier of the players of a group of platforms.
+    The buffer is only used from the event loop, the lease and flush functions are blocking and should run on a thread.
+
+    Args:
+        platforms (List[string]): The platforms of the players.
+        batch_size (int, optional): Amount of players read from each platform at once.
+        commit_size (int, optional): Amount of completed players that triggers a flush.
+        commit_interval (float, optional): Maximum amount of seconds between flushes with completed players.
+    """
+
+    def __init__(
+        self,
+        platforms,
+        batch_size=frontier_batch_size,
+        commit_size=frontier_commit_size,
+        commit_interval=frontier_commit_interval,
+    ):
+        self.platforms = platforms
+        self.batch_size = batch_size
+        self.commit_size = commit_size
+        self.commit_interval = commit_interval
+        # Position of the last player read from each platform, as (next_fetch, id).
+        self.cursors = {platform: None for platform in platforms}
+        self.buffer = deque()
+        # Puuid => id and schedule of the players handed out and not completed yet.
+        self.leased = {}
+        # Puuid => id, seconds until the next fetch, match rate, list yield and newest match of the completed players waiting for the flush.
+        self.completed = {}
+        # Puuids of the players given back, whose leases are released on the flush.
+        self.released = set()
+        self.last_flush = time.monotonic()
+        # Default last_fetch of the players that were never fetched, read on the first lease.
+        self.default_fetch = None
+
+    # Function to read the next batch of players.
+    def lease(self):
+        """
+        Reads the next batch of each platform, moving their cursors, and leases its players.
+
+        Returns:
+            List[Tuple]: The id, puuid, platform, start of the match list, match where it stops, whether it's a backfill and the schedule of each leased player, sorted by next_fetch.
+        """
+        if self.default_fetch is None:
+            self.default_fetch = get_default_fetch_date()
+        rows = []
+        for platform in self.platforms:
+            batch = lease_players(platform, self.cursors[platform], self.batch_size)
+            if len(batch) < self.batch_size:
+                # End of the platform, the next batch starts from the beginning.
+                self.cursors[platform] = None
+            else:
+                self.cursors[platform] = (batch[-1][3], batch[-1][0])
+            # Players held by this process are already on the buffer or being fetched.
+            batch = [
+                row
+                for row in batch
+                if row[1] not in self.leased and row[1] not in self.completed
+            ]
+            leased = set(leases.claim("player", [row[1] for row in batch]))
+            rows.extend(row for row in batch if row[1] in leased)
+        rows.sort(key=lambda row: (row[3], row[0]))
+        players = []
+        for row in rows:
+            player_id, puuid, platform, next_fetch, last_fetch = row[:5]
+            last_match_id, mark = row[9:11]
+            backfill = last_fetch <= self.default_fetch
+            since = last_fetch
+            if backfill:
+                last_match_id = None
+            elif mark is not None:
+                since = min(mark, last_fetch)
+            # The interval given on the last schedule, doubled for the dormant players.
+            previous = max((next_fetch - last_fetch).total_seconds(), 0)
+            players.append(
+                (
+                    player_id,
+                    puuid,
+                    platform,
+                    since,
+                    last_match_id,
+                    backfill,
+                    (since, previous) + tuple(row[5:9]),
+                )
+            )
+        return players
+
+    # Coroutine to get the next player to fetch.
+    async def next(self, run_db):
+        """
+        Returns the next player from the buffer, reading a new batch when it's empty.
+        Players that are being fetched or waiting for the flush are skipped.
+
+        Args:
+            run_db (coroutine function): Runs a blocking database function, as the one of the crawler.
+
+        Returns:
+            Tuple: The puuid, platform, start of the match list, match where it stops and whether it's a backfill, None if there is no player available.
+        """
+        for _ in range(2):
+            while self.buffer:
+                player_id, puuid, platform, since, last_match_id, backfill, player = (
+                    self.buffer.popleft()
+                )
+                if puuid in self.leased or puuid in self.completed:
+                    continue
+                self.leased[puuid] = (player_id, player)
+                return puuid, platform, since, last_match_id, backfill
+            self.buffer.extend(await run_db(self.lease))
+        return None
+
+    # Function to mark a player as completed.
+    def complete(self, puuid, seen=0, found=0, calls=0, newest=None):
+        """
+        Args:
+            puuid (string): The player whose matches were all processed.
+            seen (int, optional): Amount of matches on the match list of the player, including the known ones.
+            found (int, optional): Amount of new matches found on the match list.
+            calls (int, optional): Amount of calls to the match list, 0 when resumed from the pending queue.
+            newest (string, optional): Newest match on the match list, the new high-water mark. None keeps the current one.
+
+        Returns:
+            bool: True if the completed players should be flushed.
+        """
+        leased = self.leased.pop(puuid, None)
+        if leased is not None:
+            player_id, player = leased
+            self.completed[puuid] = (
+                (player_id,) + schedule(player, seen, found, calls) + (newest,)
+            )
+        return len(self.completed) >= self.commit_size or (
+            self.completed
+            and time.monotonic() - self.last_flush >= self.commit_interval
+        )
+
+    # Function to give back a player that wasn't completed, it's fetched again once the frontier wraps around.
+    def release(self, puuid):
+        if self.leased.pop(puuid, None) is not None:
+            self.released.add(puuid)
+
+    # Function to update the last_fetch and next_fetch of the completed players.
+    def flush(self):
+        """
+        Updates the schedule of every completed player on a single transaction, then releases their leases.
+        Blocking, the players completed while it runs are left for the next flush.
+        """
+        completed = dict(self.completed)
+        released = list(self.released)
+        self.last_flush = time.monotonic()
+        if completed:
+            update_schedules(list(completed.values()))
+        leases.release("player", list(completed) + released)
+        for puuid in completed:
+            self.completed.pop(puuid, None)
+        self.released.difference_update(released)
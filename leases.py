@@ -0,0 +1,86 @@
+import asyncio
+import os
+import socket
+from db_operations import (
+    claim_leases,
+    release_all_leases,
+    release_leases,
+    renew_leases,
+)
+
+"""
+    Module with the leases that split the work between many crawler processes, on the same host or on many hosts.
+    Before fetching a player or a match the process takes its lease on the tb_lease table, and the keys leased by another
+    process are skipped. The leases are renewed while the process is alive, so they only expire when it dies, being taken
+    by the other processes afterwards.
+"""
+
+# Seconds a lease is held without being renewed.
+lease_ttl = int(os.getenv("LEASE_TTL", 600))
+
+# Disables the leases, for a single process crawling the database alone.
+leases_enabled = os.getenv("LEASES", "1") == "1"
+
+
+# Function to get the name of the process on the leases.
+def get_owner():
+    """
+    Returns:
+        string: The host and pid of the process, unique among the processes sharing the database.
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+# Function to lease the keys before working on them.
+def claim(kind, keys):
+    """
+    Blocking, should run on a thread.
+
+    Args:
+        kind (string): Kind of the work, such as player or match.
+        keys (List[string]): The keys to lease.
+
+    Returns:
+        List[string]: The keys leased by the process, in the given order.
+    """
+    if not leases_enabled or not keys:
+        return list(keys)
+    leased = claim_leases(kind, list(dict.fromkeys(keys)), get_owner(), lease_ttl)
+    return [key for key in keys if key in leased]
+
+
+# Function to give back the leases of the keys that were handled or dropped.
+def release(kind, keys):
+    """
+    Blocking, should run on a thread.
+
+    Args:
+        kind (string): Kind of the work, such as player or match.
+        keys (List[string]): The keys to release.
+    """
+    if leases_enabled and keys:
+        release_leases(kind, list(keys), get_owner())
+
+
+# Function to give back every lease of the process.
+def release_all():
+    if leases_enabled:
+        release_all_leases(get_owner())
+
+
+# Coroutine that renews the leases of the process until it's cancelled.
+async def keep_alive(run_db):
+    """
+    Renews the leases three times per TTL, so a slow database doesn't let them expire.
+
+    Args:
+        run_db (coroutine function): Runs a blocking database function, as the one of the crawler.
+    """
+    if not leases_enabled:
+        return
+    while True:
+        await asyncio.sleep(lease_ttl / 3)
+        try:
+            await run_db(renew_leases, get_owner(), lease_ttl)
+        except Exception as e:
+            print("Error renewing the leases: ", e)
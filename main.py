@@ -1,117 +1,203 @@
 # Import the functions on the other modules.
-import concurrent.futures
-from data_treatment import *
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import archive
+import metrics
+from crawler import crawl
+from export import export, export_workers, reset_export
 from db_operations import *
-from fetch import *
+from reprocess import reprocess, reprocess_suffix, reprocess_workers
+from routing import get_platforms
 
 
-# Function to be run through the threads.
-def worker(match):
+# Function to run the crawl on the current process.
+def run_worker(platforms=None, setup=True, writer=None, metrics_port=None):
     """
-    Function to fetch the data and insert into the database.
+    Connects to the database and runs the crawl loop until the user interrupts it.
 
     Args:
-        match (string): Match_id from the match to be fetched.
+        platforms (List[string], optional): The platforms to crawl. Defaults to the PLATFORMS on the enviroment.
+        setup (bool, optional): Create the tables if they don't exist, done once by the launcher when running many workers.
+        writer (string, optional): Name of the archive segments written by the worker. Defaults to the ARCHIVE_WRITER on the enviroment.
+        metrics_port (int, optional): Port of the metrics endpoint of the worker. Defaults to the METRICS_PORT on the enviroment.
     """
+    if writer is not None:
+        archive.archive_writer = writer
+    metrics.start_server(metrics_port)
+    # Try block to get the user interruption of the code.
     try:
-        if is_match_on_db(match):
-            return
-
-        print(f"Starting fetch for the match: {match}")
-        match_data = fetch_match_data(match)
-
-        if match_data is not None:
-
-            new_p_info = []
-            m_info = get_match_info(match_data)
-            p_info = get_player_info(match_data)
-            p_stats = get_player_stats(match_data)
-
-            for player in p_info:
-                if is_player_on_db(player["puuid"]) and last_rating_today(
-                    player["puuid"]
-                ):
-                    continue
-
-                summoner_id = player["summoner_id"]
-                p_rating = get_player_rating(fetch_player_rating(summoner_id))
+        # Create the connection to the mysql database.
+        # Create the tables if they don't exist.
+        connect_mysql()
+        if setup:
+            create_tables()
+
+        # Run the crawl loop, every request is made asynchronously on a single event loop.
+        asyncio.run(crawl(platforms))
+    except KeyboardInterrupt:
+        print("User interrupted the program.")
+    except Error as E:
+        print("A error occurred: %s", E)
+    finally:
+        # Close the mysql connection.
+        close_mysql()
+        metrics.stop_server()
+
+
+# Function to run the crawl on many processes.
+def launch(workers, platforms=None):
+    """
+    Creates the tables and starts the worker processes, waiting for all of them.
+    The workers share the players and matches through the leases, so they can also be started on other hosts against the same database.
 
-                if is_player_on_db(player["puuid"]):
-                    update_rating(p_rating, player["puuid"])
-                    update_rating_date(player["puuid"])
-                    continue
+    Args:
+        workers (int): Amount of worker processes.
+        platforms (List[string], optional): The platforms to crawl. Defaults to the PLATFORMS on the enviroment.
+    """
+    if workers <= 1:
+        run_worker(platforms)
+        return
 
-                player.update(p_rating)
+    connect_mysql()
+    try:
+        create_tables()
+    finally:
+        close_mysql()
+
+    # Spawned instead of forked, so each worker starts its own threads and connection pool.
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(
+            target=run_worker,
+            args=(
+                platforms,
+                False,
+                f"{socket.gethostname()}-{index}",
+                metrics.metrics_port + index if metrics.metrics_port else 0,
+            ),
+            name=f"crawler-{index}",
+        )
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # The interrupt also reaches the workers, wait for them to write the matches in flight.
+        print("User interrupted the program, waiting for the workers.")
+        for process in processes:
+            process.join()
 
-                new_p_info.append(player)
-                update_rating_date(player["puuid"])
-            insert_match_info(m_info)
-            insert_player_info(new_p_info)
-            insert_player_stats(p_stats)
-        print("Finished data fetching from the match:", match)
 
-    except Exception as e:
-        print("Error getting data from the match:", match, " with error: ", e)
+# Function to rebuild the match and stats tables from the archive.
+def run_reprocess(workers, swap=False):
+    """
+    Reprocesses every archived match into the shadow tables, resuming a interrupted run.
 
+    Args:
+        workers (int): Amount of extraction processes.
+        swap (bool, optional): Replace the live tables by the shadow tables once every match is written, refused while a crawler is running. Defaults to False.
+    """
+    try:
+        connect_mysql()
+        create_tables()
+        # The archive must be read after the crawlers stopped, or their last matches are left on the old tables.
+        if swap and count_live_leases():
+            print("Stop every crawler before reprocessing with --swap.")
+            return
+        reprocess(workers=workers)
+        if swap:
+            swap_shadow_tables(reprocess_suffix)
+            print("The shadow tables replaced the live tables.")
+            # The aggregates were computed from the old tables.
+            rebuild_aggregates()
+            print("The champion aggregates were rebuilt.")
+            # The ids of the matches changed, the exported ones are written again by the next export.
+            reset_export()
+            print("The export was reset.")
+    except KeyboardInterrupt:
+        print("User interrupted the reprocessing, run it again to continue.")
+    except Error as E:
+        print("A error occurred: %s", E)
+    finally:
+        close_mysql()
+
+
+# Function to rebuild the aggregated champion stats.
+def run_rebuild_aggregates():
+    """
+    Recomputes tb_champion_stats from every match, after a change on the stats or on the aggregates.
+    The past days are bucketed by the current tier of the players.
+    """
+    try:
+        connect_mysql()
+        create_tables()
+        rebuild_aggregates()
+        print("The champion aggregates were rebuilt.")
+    except KeyboardInterrupt:
+        print("User interrupted the rebuild, the aggregates were left unchanged.")
+    except Error as E:
+        print("A error occurred: %s", E)
+    finally:
+        close_mysql()
+
+
+# Function to export the tables to Parquet.
+def run_export(workers):
+    """
+    Exports the matches inserted since the last export, and a snapshot of the players.
 
-# Try block to get the user interruption of the code.
-try:
-    # Create the connection to the mysql database.
-    # Create the tables if they don't exist.
-    connect_mysql()
-    create_tables()
-
-    # Verify if there is any player on the database whose puuid equals it's puuid.
-    # Only returns false if the database is empty.
-    if empty_db():
-        firstPUUID = fetch_top_challenger()
-        fetch_date = get_default_fetch_date()
-
-    # Infinite loop to get the data.
-    while True:
-        puuid = None
-        last_fetch = None
-        # Try to get the next puuid from the database.
-        try:
-            puuid = get_next_puuid()
-            last_fetch = get_last_fetch(puuid)
-        except Exception as e:
-            print("Error getting next puuid:", e)
-            print("Fetching the top one of the soloq")
-        finally:
-            if not puuid:
-                puuid = firstPUUID
-                last_fetch = fetch_date
-
-        # Creates the match list to be populated, the count to keep track of the current depth of the match list and the date of the last time this puuid was fetched.
-        match_list = []
-        count = 0
-        # Infinite loop that gets the match list of the current player until all the matchs are found.
-        try:
-            while True:
-                # Fetch 100 matches after the count and attach to the full match list. Last fetch is passed to only get matches after the last time it was fetched.
-                matches = fetch_matches(puuid, count, last_fetch)
-                match_list.extend(matches)
-                # If the retrieved matches has 100 matches, then we go to the next iteration to get the remaining.
-                if matches is not None and len(matches) == 100:
-                    count += 100
-                else:
-                    break
-        except Exception as e:
-            print("Error getting the match list: ", e)
-            break
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            future_to_match = {
-                executor.submit(worker, match): match for match in match_list
-            }
-
-        # If every match was succesfully read and inserted, then update the last_fetch from the given player.
-        update_fetch_date(puuid)
-        print("Starting next loop...")
-except KeyboardInterrupt:
-    print("User interrupted the program.")
-except Error as E:
-    print("A error occurred: %s", E)
-finally:
-    # Close the mysql connection.
-    close_mysql()
+    Args:
+        workers (int): Amount of threads writing the files.
+    """
+    try:
+        connect_mysql()
+        export(workers=workers)
+    except KeyboardInterrupt:
+        print("User interrupted the export, run it again to continue.")
+    except Error as E:
+        print("A error occurred: %s", E)
+    finally:
+        close_mysql()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fills the database with the matches fetched from the RIOT API."
+    )
+    parser.add_argument(
+        "mode",
+        nargs="?",
+        default="crawl",
+        choices=["crawl", "reprocess", "rebuild-aggregates", "export"],
+        help="Crawl the API, rebuild the match and stats tables from the archived matches, rebuild the champion aggregates, or export the tables to Parquet.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Amount of crawler processes, of extraction processes when reprocessing, or of writing threads when exporting.",
+    )
+    parser.add_argument(
+        "--platforms",
+        help="Comma separated platforms to crawl. Defaults to the PLATFORMS variable.",
+    )
+    parser.add_argument(
+        "--swap",
+        action="store_true",
+        help="Replace the live tables by the shadow tables after reprocessing.",
+    )
+    args = parser.parse_args()
+    if args.mode == "reprocess":
+        run_reprocess(args.workers or reprocess_workers, args.swap)
+    elif args.mode == "export":
+        run_export(args.workers or export_workers)
+    elif args.mode == "rebuild-aggregates":
+        run_rebuild_aggregates()
+    else:
+        workers = args.workers or int(os.getenv("CRAWL_WORKERS", 1))
+        launch(workers, get_platforms(args.platforms))
@@ -0,0 +1,135 @@
+import hashlib
+import math
+import os
+import threading
+from collections import OrderedDict
+from db_operations import count_matches, get_existing_matches, stream_match_ids
+from leases import leases_enabled
+
+"""
+    Module that drops the matches already on the database before any request is made for them.
+    The same match shows up on the list of up to 10 players, so most of the ids are already known by the process.
+
+    The ids are checked in order against:
+    1. A bounded set of the ids seen by this process, inserted or being inserted.
+    2. A optional Bloom filter warmed with every id of tb_match_info and updated with the ids claimed by this process.
+       A id that isn't on the filter wasn't inserted by this process nor before the warm, so it's only surely not on
+       the database when the process is the only writer, crawling with LEASES=0. With the leases enabled the other
+       processes insert matches the filter never sees, so it isn't used.
+    3. A single bulk query for the remaining ids.
+"""
+
+# Amount of ids kept by the set of known matches.
+known_matches_size = int(os.getenv("KNOWN_MATCHES_SIZE", 1000000))
+
+# Enables the Bloom filter warmed from the database at startup, only when the process is the only writer.
+use_bloom_filter = os.getenv("KNOWN_MATCHES_BLOOM", "1") == "1" and not leases_enabled
+
+# Rate of false positives of the Bloom filter, that only cost a id on the bulk query.
+bloom_error_rate = float(os.getenv("KNOWN_MATCHES_BLOOM_ERROR", 0.01))
+
+
+class BloomFilter:
+    """
+    Set of strings with no false negatives and a configurable rate of false positives, using a fraction of the memory of a set.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    # Positions of the bits of a value, by double hashing a single digest.
+    def positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        for position in self.positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self.positions(value)
+        )
+
+
+class KnownMatches:
+    """
+    Filter of the matches already inserted, shared by every worker of the process.
+    """
+
+    def __init__(self, size=known_matches_size):
+        self.lock = threading.Lock()
+        self.size = size
+        self.known = OrderedDict()
+        self.bloom = None
+
+    # Function to load every match id of the database into a Bloom filter.
+    def warm(self, expected_growth=1000000):
+        """
+        Streams the ids of tb_match_info into a new Bloom filter.
+        The filter is sized for the current amount of matches plus the expected growth, past it the false positives increase.
+
+        Args:
+            expected_growth (int, optional): Matches that will be added while the process runs. Defaults to 1000000.
+        """
+        bloom = BloomFilter(count_matches() + expected_growth, bloom_error_rate)
+        loaded = 0
+        for batch in stream_match_ids():
+            for row in batch:
+                bloom.add(row[0])
+            loaded += len(batch)
+        with self.lock:
+            self.bloom = bloom
+        print(f"Loaded {loaded} known matches into the Bloom filter.")
+
+    # Add ids to the set, dropping the oldest ones when full.
+    def add(self, match_ids):
+        with self.lock:
+            self.add_unlocked(match_ids)
+
+    # Same as add, for callers already holding the lock.
+    def add_unlocked(self, match_ids):
+        for match_id in match_ids:
+            self.known[match_id] = None
+            self.known.move_to_end(match_id)
+            if self.bloom is not None:
+                self.bloom.add(match_id)
+        while len(self.known) > self.size:
+            self.known.popitem(last=False)
+
+    # Remove a id that was claimed but failed to be inserted, so it can be tried again.
+    def discard(self, match_id):
+        with self.lock:
+            self.known.pop(match_id, None)
+
+    # Function to filter the matches that still need to be fetched.
+    def filter_new(self, match_ids):
+        """
+        Returns the ids that aren't on the database, keeping their order and dropping duplicates.
+        The returned ids are claimed as known, so the same match on the list of another player is dropped while it's being inserted.
+        If the insertion fails, the id must be discarded.
+
+        Args:
+            match_ids (List[string]): The ids of the matches found on the match list of a player.
+
+        Returns:
+            List[string]: The ids that should be fetched.
+        """
+        with self.lock:
+            candidates = [m for m in dict.fromkeys(match_ids) if m not in self.known]
+            if self.bloom is not None:
+                unsure = [m for m in candidates if m in self.bloom]
+            else:
+                unsure = candidates
+        existing = get_existing_matches(unsure) if unsure else set()
+        new_matches = [m for m in candidates if m not in existing]
+        with self.lock:
+            # Another worker could have claimed some of the ids during the query.
+            new_matches = [m for m in new_matches if m not in self.known]
+            self.add_unlocked(list(existing) + new_matches)
+        return new_matches
@@ -0,0 +1,169 @@
+import json
+import typing
+from typing import Dict, List, Optional
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+"""
+    Module with the schema of the match-v5 payload, limited to the fields read by the data_treatment module.
+    With msgspec installed, the payload is decoded straight into slotted and typed records and every other field of the
+    response is skipped without being turned into Python objects. Without it, the payload is decoded by the json module
+    and the records are built from the dicts, with the same interface.
+
+    Every field has a default, so a missing field (such as the challenges of a remake) is stored as NULL instead of
+    failing the whole match. The attributes are the snake case of the API fields.
+"""
+
+if msgspec is not None:
+
+    class Record(msgspec.Struct, rename="camel"):
+        """
+        Base of the records, decoded by msgspec.
+        """
+
+else:
+
+    class Record:
+        """
+        Base of the records, built from the dicts decoded by the json module.
+        """
+
+        def __init__(self, **values):
+            for name, default in self.__defaults__.items():
+                setattr(self, name, values.get(name, default))
+
+        def __init_subclass__(cls, **kwargs):
+            super().__init_subclass__(**kwargs)
+            cls.__defaults__ = {
+                name: getattr(cls, name, None) for name in cls.__annotations__
+            }
+            # Key on the payload, nested record type and whether it's a list, of each field.
+            cls.__fields__ = []
+            for name, hint in typing.get_type_hints(cls).items():
+                record_type = nested_record(hint)
+                is_list = typing.get_origin(hint) in (list, List)
+                cls.__fields__.append((name, camel(name), record_type, is_list))
+
+        # Build the record from a dict of the payload, and the nested records from their dicts.
+        @classmethod
+        def from_dict(cls, data):
+            record = cls.__new__(cls)
+            for name, key, record_type, is_list in cls.__fields__:
+                value = data.get(key)
+                if value is None:
+                    value = cls.__defaults__[name]
+                    # Each record gets its own empty list.
+                    value = list(value) if is_list else value
+                elif record_type is not None:
+                    if is_list:
+                        value = [record_type.from_dict(item) for item in value]
+                    else:
+                        value = record_type.from_dict(value)
+                setattr(record, name, value)
+            return record
+
+
+# Function to get the camel case name of a field.
+def camel(name):
+    first, *rest = name.split("_")
+    return first + "".join(part.title() for part in rest)
+
+
+# Function to get the record type of a annotation, as Record, Optional[Record] or List[Record].
+def nested_record(hint):
+    # Dicts of records are left as dicts.
+    if typing.get_origin(hint) in (dict, Dict):
+        return None
+    for candidate in (hint, *typing.get_args(hint)):
+        if isinstance(candidate, type) and issubclass(candidate, Record):
+            return candidate
+    return None
+
+
+class Challenges(Record):
+    kda: Optional[float] = None
+    gold_per_minute: Optional[float] = None
+    damage_per_minute: Optional[float] = None
+    vision_score_per_minute: Optional[float] = None
+    control_wards_placed: Optional[int] = None
+
+
+class Participant(Record):
+    puuid: str = ""
+    summoner_id: Optional[str] = None
+    riot_id_game_name: Optional[str] = None
+    riot_id_tagline: Optional[str] = None
+    profile_icon: Optional[int] = None
+    summoner_level: Optional[int] = None
+    champion_id: Optional[int] = None
+    kills: Optional[int] = None
+    deaths: Optional[int] = None
+    assists: Optional[int] = None
+    gold_earned: Optional[int] = None
+    gold_spent: Optional[int] = None
+    total_damage_dealt_to_champions: Optional[int] = None
+    neutral_minions_killed: Optional[int] = None
+    total_minions_killed: Optional[int] = None
+    vision_score: Optional[int] = None
+    wards_placed: Optional[int] = None
+    wards_killed: Optional[int] = None
+    individual_position: str = "Invalid"
+    team_id: Optional[int] = None
+    game_ended_in_surrender: Optional[bool] = None
+    game_ended_in_early_surrender: Optional[bool] = None
+    challenges: Optional[Challenges] = None
+
+
+class Team(Record):
+    team_id: Optional[int] = None
+    win: Optional[bool] = None
+
+
+class Info(Record):
+    game_creation: Optional[int] = None
+    game_duration: Optional[int] = None
+    platform_id: str = ""
+    participants: List[Participant] = []
+    teams: List[Team] = []
+
+
+class Metadata(Record):
+    match_id: str = ""
+
+
+class Match(Record):
+    metadata: Optional[Metadata] = None
+    info: Optional[Info] = None
+
+
+# Challenges used for the participants without them.
+no_challenges = Challenges()
+
+# Decoder of the match payloads, reused by every call.
+match_decoder = msgspec.json.Decoder(Match) if msgspec is not None else None
+
+
+# Function to decode a match payload.
+def decode_match(raw):
+    """
+    Decodes the body of a match-v5 response into the records, skipping every field the database doesn't use.
+
+    Args:
+        raw (bytes): The body of the response.
+
+    Raises:
+        ValueError: If the payload isn't a match, without the metadata or the info.
+
+    Returns:
+        Match: The decoded match.
+    """
+    if match_decoder is not None:
+        match = match_decoder.decode(raw)
+    else:
+        match = Match.from_dict(json.loads(raw))
+    if match.metadata is None or match.info is None or not match.metadata.match_id:
+        raise ValueError("The payload isn't a match, the metadata or info is missing.")
+    return match
@@ -0,0 +1,455 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+"""
+    Module with the metrics of the crawler, kept in memory and served in the Prometheus text format.
+    The counters and histograms are updated by the fetch, db_operations, writer and crawler modules, from any thread.
+    A HTTP server on localhost serves them on /metrics, and a summary line with the rates since the last one is printed
+    periodically, showing if the time goes to the API, the rate limits, the database or the parsing.
+"""
+
+# Port of the metrics endpoint on localhost, 0 disables it. Each worker process uses the port plus its index.
+metrics_port = int(os.getenv("METRICS_PORT", 9464))
+
+# Seconds between the summary lines, 0 disables them.
+metrics_interval = float(os.getenv("METRICS_INTERVAL", 30))
+
+# Upper bounds in seconds of the buckets of the latency histograms.
+latency_buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Every metric, in the order they are rendered.
+registry = []
+
+
+class Counter:
+    """
+    Value that only increases, one for each combination of labels.
+
+    Args:
+        name (string): Name of the metric.
+        description (string): Help text of the metric.
+        labels (Tuple[string], optional): Names of the labels.
+    """
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def inc(self, amount=1, *labels):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    # Sum of the values of every combination of labels.
+    def total(self):
+        with self.lock:
+            return sum(self.values.values())
+
+    # Sum of the values whose labels pass the condition, a function of the tuple of labels.
+    def total_where(self, condition):
+        with self.lock:
+            return sum(
+                value for labels, value in self.values.items() if condition(labels)
+            )
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Distribution of observed values, one for each combination of labels.
+
+    Args:
+        name (string): Name of the metric.
+        description (string): Help text of the metric.
+        labels (Tuple[string], optional): Names of the labels.
+        buckets (Tuple[float], optional): Upper bounds of the buckets.
+    """
+
+    def __init__(self, name, description, labels=(), buckets=latency_buckets):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        # Labels => [count of each bucket, sum, count].
+        self.values = {}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def observe(self, value, *labels):
+        with self.lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    # Sum and count of every combination of labels.
+    def totals(self):
+        with self.lock:
+            return (
+                sum(entry[1] for entry in self.values.values()),
+                sum(entry[2] for entry in self.values.values()),
+            )
+
+    # Context manager that observes the seconds spent inside it.
+    def time(self, *labels):
+        return Timer(self, labels)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self.lock:
+            for labels, (counts, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, bucket in zip(self.buckets, counts):
+                    cumulative += bucket
+                    bucket_labels = format_labels(
+                        self.labels + ("le",), labels + (str(bound),)
+                    )
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                bucket_labels = format_labels(self.labels + ("le",), labels + ("+Inf",))
+                lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+                lines.append(
+                    f"{self.name}_sum{format_labels(self.labels, labels)} {total}"
+                )
+                lines.append(
+                    f"{self.name}_count{format_labels(self.labels, labels)} {count}"
+                )
+        return lines
+
+
+class Gauge:
+    """
+    Value read when rendered, from the functions tracked by it.
+
+    Args:
+        name (string): Name of the metric.
+        description (string): Help text of the metric.
+        labels (Tuple[string], optional): Names of the labels.
+    """
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.functions = []
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    # Add a function returning a dict of labels => value.
+    def track(self, function):
+        with self.lock:
+            self.functions.append(function)
+
+    def untrack(self, function):
+        with self.lock:
+            self.functions.remove(function)
+
+    # Current values of every tracked function.
+    def read(self):
+        with self.lock:
+            functions = list(self.functions)
+        values = {}
+        for function in functions:
+            values.update(function())
+        return values
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} gauge",
+        ]
+        for labels, value in sorted(self.read().items()):
+            lines.append(f"{self.name}{format_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Timer:
+    """
+    Context manager that observes the seconds spent inside it on a histogram.
+    """
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+# Function to format the labels of a sample.
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+# Metrics of the requests to the API.
+api_requests = Counter(
+    "crawler_api_requests_total",
+    "Responses of the API, by endpoint and status.",
+    ("endpoint", "status"),
+)
+api_latency = Histogram(
+    "crawler_api_request_seconds",
+    "Latency of the requests to the API, by endpoint and status.",
+    ("endpoint", "status"),
+)
+rate_limit_sleep = Counter(
+    "crawler_rate_limit_sleep_seconds_total",
+    "Seconds waited on the rate limiter before the requests, by endpoint.",
+    ("endpoint",),
+)
+response_cache = Counter(
+    "crawler_response_cache_total",
+    "Lookups of the cache of the responses, by endpoint and result (hit or miss).",
+    ("endpoint", "result"),
+)
+coalesced_requests = Counter(
+    "crawler_coalesced_requests_total",
+    "Requests that waited for the same request in flight instead of being sent, by endpoint.",
+    ("endpoint",),
+)
+
+# Metrics of the match lists of the players, the new matches found per call measure the schedule of the players.
+list_calls = Counter(
+    "crawler_match_list_calls_total", "Calls to the match lists of the players."
+)
+new_matches_listed = Counter(
+    "crawler_new_matches_listed_total",
+    "Matches found on the match lists that weren't known.",
+)
+
+# Metrics of the database.
+db_latency = Histogram(
+    "crawler_db_query_seconds",
+    "Latency of the functions of db_operations, by function.",
+    ("function",),
+)
+db_pool_wait = Histogram(
+    "crawler_db_pool_wait_seconds",
+    "Seconds waited for a connection of the pool.",
+)
+db_slot_wait = Histogram(
+    "crawler_db_slot_wait_seconds",
+    "Seconds waited for a free slot of the database limit of the crawler, before the call takes a connection.",
+)
+
+# Metrics of the pipeline.
+matches_written = Counter(
+    "crawler_matches_written_total", "Matches committed to the database."
+)
+parse_latency = Histogram(
+    "crawler_parse_seconds", "Seconds spent extracting the rows of each match."
+)
+errors = Counter(
+    "crawler_errors_total",
+    "Errors by stage and type of the exception.",
+    ("stage", "type"),
+)
+queue_depth = Gauge(
+    "crawler_queue_depth",
+    "Items waiting on each queue, by region and queue.",
+    ("region", "queue"),
+)
+concurrency = Gauge(
+    "crawler_concurrency",
+    "Slots in use (current) and allowed (target) of each adaptive limit.",
+    ("limit", "value"),
+)
+
+
+# Decorator that observes the latency of a function.
+def timed(histogram):
+    """
+    Args:
+        histogram (Histogram): Histogram with a single label, set to the name of the function.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, function.__name__)
+
+        return wrapper
+
+    return decorator
+
+
+# Function to render every metric in the Prometheus text format.
+def render():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Serves the metrics on /metrics.
+    """
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # The scrapes aren't logged.
+    def log_message(self, format, *args):
+        pass
+
+
+# Server of the metrics of the process.
+server = None
+
+
+# Function to start the metrics endpoint.
+def start_server(port=None):
+    """
+    Serves the metrics on http://127.0.0.1:port/metrics from a daemon thread. Failing to bind the port only disables the endpoint.
+
+    Args:
+        port (int, optional): The port. Defaults to METRICS_PORT.
+    """
+    global server
+    port = metrics_port if port is None else port
+    if port == 0 or server is not None:
+        return
+    try:
+        server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    except OSError as e:
+        print(f"Error starting the metrics endpoint on the port {port}: ", e)
+        return
+    server.daemon_threads = True
+    threading.Thread(
+        target=server.serve_forever, name="metrics-server", daemon=True
+    ).start()
+    print(f"Serving the metrics on http://127.0.0.1:{port}/metrics")
+
+
+# Function to stop the metrics endpoint.
+def stop_server():
+    global server
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+        server = None
+
+
+class Summary:
+    """
+    Builds the summary lines, with the rates since the previous line.
+    """
+
+    def __init__(self):
+        self.last = self.snapshot()
+
+    # Totals of the summarized metrics.
+    def snapshot(self):
+        return {
+            "time": time.monotonic(),
+            "matches": matches_written.total(),
+            "requests": api_latency.totals(),
+            "saved": response_cache.total_where(lambda labels: labels[1] == "hit")
+            + coalesced_requests.total(),
+            "lists": list_calls.total(),
+            "listed": new_matches_listed.total(),
+            "sleep": rate_limit_sleep.total(),
+            "db": db_latency.totals(),
+            "pool": db_pool_wait.totals(),
+            "slot": db_slot_wait.totals(),
+            "parse": parse_latency.totals(),
+            "errors": errors.total(),
+        }
+
+    # Average of the observations between two totals of a histogram.
+    @staticmethod
+    def average(current, last):
+        count = current[1] - last[1]
+        return (current[0] - last[0]) / count if count else 0.0
+
+    def line(self):
+        current = self.snapshot()
+        last, self.last = self.last, current
+        elapsed = max(current["time"] - last["time"], 1e-9)
+        requests = current["requests"][1] - last["requests"][1]
+        matches = current["matches"] - last["matches"]
+        lists = current["lists"] - last["lists"]
+        depths = " ".join(
+            f"{region}.{queue}={depth}"
+            for (region, queue), depth in sorted(queue_depth.read().items())
+        )
+        limits = concurrency.read()
+        slots = " ".join(
+            f"{name} {limits[(name, 'current')]}/{limits[(name, 'target')]}"
+            for name in sorted({name for name, _ in limits})
+        )
+        return (
+            f"Metrics: {matches / elapsed:.1f} matches/s, "
+            f"{requests / elapsed:.1f} requests/s averaging {self.average(current['requests'], last['requests']) * 1000:.0f} ms, "
+            f"{matches / max(requests, 1):.2f} matches/request, "
+            f"{current['saved'] - last['saved']} requests saved by the cache and coalescing, "
+            f"{(current['listed'] - last['listed']) / max(lists, 1):.1f} new matches/list, "
+            f"rate limit sleep {(current['sleep'] - last['sleep']) / elapsed:.2f} s/s, "
+            f"db {self.average(current['db'], last['db']) * 1000:.1f} ms, "
+            f"pool wait {self.average(current['pool'], last['pool']) * 1000:.1f} ms, "
+            f"slot wait {self.average(current['slot'], last['slot']) * 1000:.1f} ms, "
+            f"parse {self.average(current['parse'], last['parse']) * 1000:.1f} ms, "
+            f"{current['errors'] - last['errors']} errors, queues {depths or 'empty'}"
+            + (f", concurrency {slots}" if slots else "")
+        )
+
+
+# Coroutine that prints the summary line periodically.
+async def report(interval=None):
+    """
+    Args:
+        interval (float, optional): Seconds between the lines. Defaults to METRICS_INTERVAL.
+    """
+    interval = metrics_interval if interval is None else interval
+    if interval <= 0:
+        return
+    summary = Summary()
+    while True:
+        await asyncio.sleep(interval)
+        print(summary.line())
@@ -0,0 +1,76 @@
+import os
+from db_operations import (
+    dequeue_matches,
+    enqueue_matches,
+    fail_pending_match,
+    get_pending_matches,
+)
+
+"""
+    Module with the durable queue of the matches found and not inserted yet, on the tb_pending_match table.
+    The match list of a player is stored on the queue before its matches are fetched, and each match leaves the queue on
+    the transaction that inserts it. A failed match stays on the queue with its attempts, and is tried again after a
+    backoff that doubles on every attempt. The last_fetch of a player only moves once none of its matches are pending,
+    so a player with pending matches is resumed from the queue, without listing its matches again.
+    A match has a single row, held by the first player that listed it. Once it's given up, the next player listing it
+    takes the row with its attempts reset.
+"""
+
+# Attempts after which a match is given up, kept on the queue with its last error.
+pending_max_attempts = int(os.getenv("PENDING_MAX_ATTEMPTS", 5))
+
+# Seconds before the second attempt of a match, doubled on each attempt.
+pending_backoff = int(os.getenv("PENDING_BACKOFF", 60))
+
+# Maximum seconds between two attempts.
+pending_max_backoff = int(os.getenv("PENDING_MAX_BACKOFF", 6 * 3600))
+
+
+# Function to get the pending matches of a player, before listing its matches.
+def resume(puuid):
+    """
+    Blocking, should run on a thread.
+
+    Args:
+        puuid (string): The player.
+
+    Returns:
+        Tuple[List[string], List[string]]: The matches that can be fetched now, and the ones waiting for their next attempt. Both empty when the player has to be listed.
+    """
+    return get_pending_matches(puuid, pending_max_attempts)
+
+
+# Function to store the match list of a player.
+def enqueue(puuid, platform, match_ids):
+    """
+    Blocking, should run on a thread.
+
+    Args:
+        puuid (string): The player whose match list had the matches.
+        platform (string): Platform of the player.
+        match_ids (List[string]): The matches that aren't inserted.
+
+    Returns:
+        Tuple[List[string], List[string]]: The matches that can be fetched now, and the ones waiting for their next attempt, discovered before by another player.
+    """
+    return enqueue_matches(puuid, platform, match_ids, pending_max_attempts)
+
+
+# Function to record the failure of a match.
+def fail(match_id, error):
+    """
+    Blocking, should run on a thread.
+
+    Args:
+        match_id (string): The ID of the match.
+        error (Exception): The error of the attempt.
+    """
+    fail_pending_match(match_id, repr(error), pending_backoff, pending_max_backoff)
+
+
+# Function to drop matches from the queue, such as the ones found already inserted.
+def drop(match_ids):
+    """
+    Blocking, should run on a thread.
+    """
+    dequeue_matches(match_ids)
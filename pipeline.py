@@ -0,0 +1,103 @@
+import asyncio
+
+"""
+    Module with a generic pipeline of asynchronous stages.
+    Each stage has its own bounded queue and its own amount of workers, and a worker only takes the next item after
+    handing the results to the next stage. When a queue is full the workers of the previous stage wait, so a slow stage
+    slows down the ones before it instead of piling items up in memory.
+"""
+
+
+class Stage:
+    """
+    Step of the pipeline.
+
+    Args:
+        name (string): Name of the stage, used on the error messages.
+        handler (coroutine function): Called as handler(item, emit) for each item, awaiting emit(result) for each result passed to the next stage.
+        workers (int): Amount of items handled at the same time.
+        queue_size (int): Maximum amount of items waiting to be handled.
+    """
+
+    def __init__(self, name, handler, workers, queue_size):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.tasks = []
+
+
+class Pipeline:
+    """
+    Chain of stages, the results of each stage being the items of the next one.
+
+    Args:
+        stages (List[Stage]): The stages, in order.
+        on_error (function): Called as on_error(stage, item, exception) when a handler raises. The item is dropped.
+    """
+
+    def __init__(self, stages, on_error):
+        self.stages = stages
+        self.on_error = on_error
+
+    # Start the workers of every stage.
+    def start(self):
+        for index, stage in enumerate(self.stages):
+            following = self.stages[index + 1] if index + 1 < len(self.stages) else None
+            emit = following.queue.put if following else self.discard
+            stage.tasks = [
+                asyncio.create_task(self.work(stage, emit))
+                for _ in range(stage.workers)
+            ]
+        return self
+
+    # Results of the last stage go nowhere.
+    async def discard(self, item):
+        pass
+
+    # Coroutine to put a item on the first stage, waiting while its queue is full.
+    async def put(self, item):
+        await self.stages[0].queue.put(item)
+
+    # Loop of a worker.
+    async def work(self, stage, emit):
+        while True:
+            item = await stage.queue.get()
+            try:
+                await stage.handler(item, emit)
+            except Exception as e:
+                self.on_error(stage, item, e)
+            finally:
+                stage.queue.task_done()
+
+    # Function to get the amount of items waiting on each stage.
+    def depths(self):
+        """
+        Returns:
+            Dict: The size of the queue of each stage.
+        """
+        return {stage.name: stage.queue.qsize() for stage in self.stages}
+
+    # Coroutine to stop the pipeline.
+    async def drain(self, drop_first=False):
+        """
+        Stops the stages in order, each one after every item before it was handled, so the items in flight reach the end.
+
+        Args:
+            drop_first (bool, optional): Discards the items still waiting on the first stage instead of handling them. Defaults to False.
+
+        Returns:
+            List: The items discarded from the first stage.
+        """
+        dropped = []
+        if drop_first:
+            queue = self.stages[0].queue
+            while not queue.empty():
+                dropped.append(queue.get_nowait())
+                queue.task_done()
+        for stage in self.stages:
+            await stage.queue.join()
+            for task in stage.tasks:
+                task.cancel()
+            await asyncio.gather(*stage.tasks, return_exceptions=True)
+        return dropped
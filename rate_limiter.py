@@ -0,0 +1,328 @@
+import asyncio
+import bisect
+import os
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+"""
+    Module that paces the requests to the RIOT API so they stay just under the rate limits.
+    The limits are learned from the X-App-Rate-Limit and X-Method-Rate-Limit headers, and the local counts
+    are corrected with the X-App-Rate-Limit-Count and X-Method-Rate-Limit-Count headers of every response.
+
+    There is one application bucket per routing host (br1, americas, ...) and one method bucket per host and endpoint.
+    A request is only sent when every window of both buckets has room for it, so the 429 are the exception and not the pacing mechanism.
+
+    The windows hold the send times, but the server counts a request when it arrives, somewhere between the send and the
+    response. Two requests sent a window apart can be counted closer than that when the first one is slower, so every
+    window is padded by the spread of the observed latencies. The requests are also spaced by the size of the shortest
+    window of each bucket divided by its limit, so a window that opens doesn't release its whole budget at once. The
+    longer windows only cap the amount, so their budget can still be used in bursts.
+"""
+
+# Limits assumed for a host before its first response, the ones of a development key.
+default_app_limits = os.getenv("DEFAULT_APP_RATE_LIMIT", "20:1,100:120")
+
+# Fraction of each limit that is used, leaving room for the requests of other processes sharing the key.
+headroom = float(os.getenv("RATE_LIMIT_HEADROOM", 0.95))
+
+# Seconds of latency assumed before the first response.
+initial_latency = float(os.getenv("RATE_LIMIT_INITIAL_LATENCY", 0.5))
+
+# Seconds added to the padding of the windows, for the skew between the clocks of the process and of the server.
+latency_margin = float(os.getenv("RATE_LIMIT_LATENCY_MARGIN", 0.05))
+
+# Endpoints of the API, each one has its own method rate limit.
+endpoints = [
+    ("match-v5.ids", re.compile(r"^/lol/match/v5/matches/by-puuid/[^/]+/ids$")),
+    ("match-v5.match", re.compile(r"^/lol/match/v5/matches/[^/]+$")),
+    ("match-v5.timeline", re.compile(r"^/lol/match/v5/matches/[^/]+/timeline$")),
+    (
+        "league-v4.entries-by-summoner",
+        re.compile(r"^/lol/league/v4/entries/by-summoner/[^/]+$"),
+    ),
+    ("league-v4.entries", re.compile(r"^/lol/league/v4/entries/[^/]+/[^/]+/[^/]+$")),
+    ("league-v4.league", re.compile(r"^/lol/league/v4/[a-z]+leagues/.+$")),
+    ("summoner-v4.summoner", re.compile(r"^/lol/summoner/v4/summoners/.+$")),
+]
+
+
+# Function to get the bucket keys of a URL.
+def get_endpoint(url):
+    """
+    Splits the URL into the routing host and the name of the endpoint.
+
+    Args:
+        url (string): The URL of the request.
+
+    Returns:
+        Tuple[string, string]: The host and the endpoint name. Unknown endpoints are named by their path.
+    """
+    parts = urlsplit(url)
+    host, path = parts.netloc, parts.path
+    # With API_BASE_URL the route is the first segment of the path instead of the subdomain.
+    if not path.startswith("/lol/"):
+        route, _, rest = path[1:].partition("/")
+        host, path = f"{host}/{route}", f"/{rest}"
+    for name, pattern in endpoints:
+        if pattern.match(path):
+            return host, name
+    return host, path
+
+
+# Function to parse the rate limit headers.
+def parse_limits(header):
+    """
+    Parses a header in the format "20:1,100:120", being pairs of amount and window in seconds.
+
+    Args:
+        header (string): The header value.
+
+    Returns:
+        Dict: The amount for each window size in seconds.
+    """
+    limits = {}
+    if header:
+        for pair in header.split(","):
+            amount, seconds = pair.split(":")
+            limits[int(seconds)] = int(amount)
+    return limits
+
+
+class Window:
+    """
+    Sliding window with the send time of the recent requests.
+    Keeping the requests of any interval of the window size under the limit guarantees the fixed windows used by RIOT are never exceeded.
+    """
+
+    def __init__(self, limit, seconds):
+        self.limit = limit
+        self.seconds = seconds
+        # Sorted send times, they can be on the future for requests that are waiting for their slot.
+        self.calls = []
+        # Only the shortest window of a bucket spaces the requests.
+        self.spaced = False
+
+    # Amount of requests that can be sent inside the window.
+    def usable(self):
+        return max(1, int(self.limit * headroom))
+
+    # Seconds between two requests, so the window is used evenly.
+    def spacing(self):
+        return self.seconds / self.usable()
+
+    # Remove the requests that can't affect anything after the given time.
+    def purge(self, now, pad=0.0):
+        expired = bisect.bisect_right(self.calls, now - self.seconds - pad)
+        del self.calls[:expired]
+
+    # Earliest time at or after the given one with room for another request, with the window padded by the given seconds.
+    def next_slot(self, at, pad=0.0):
+        if self.spaced and self.calls:
+            at = max(at, self.calls[-1] + self.spacing())
+        first = bisect.bisect_right(self.calls, at - self.seconds - pad)
+        excess = len(self.calls) - first - self.usable()
+        if excess < 0:
+            return at
+        return self.calls[first + excess] + self.seconds + pad
+
+    # Amount of requests sent inside the window ending at the given time.
+    def count(self, now):
+        return bisect.bisect_right(self.calls, now) - bisect.bisect_right(
+            self.calls, now - self.seconds
+        )
+
+
+class Bucket:
+    """
+    Set of windows sharing the same limit header, being a application or a method limit.
+    """
+
+    def __init__(self, limits):
+        self.windows = {}
+        self.blocked_until = 0
+        self.set_limits(limits)
+
+    # Update the limits, keeping the requests already registered.
+    def set_limits(self, limits):
+        for seconds, limit in limits.items():
+            if seconds in self.windows:
+                self.windows[seconds].limit = limit
+            else:
+                self.windows[seconds] = Window(limit, seconds)
+        for seconds in list(self.windows):
+            if seconds not in limits:
+                del self.windows[seconds]
+        for seconds, window in self.windows.items():
+            window.spaced = seconds == min(self.windows)
+
+    # Earliest time at or after the given one allowed by every window.
+    def next_slot(self, at, pad=0.0):
+        at = max(at, self.blocked_until)
+        for window in self.windows.values():
+            at = max(at, window.next_slot(at, pad))
+        return at
+
+    # Register a request on every window.
+    def add(self, at):
+        for window in self.windows.values():
+            bisect.insort(window.calls, at)
+
+    # Add the requests counted by the server that weren't sent by this process.
+    def sync_counts(self, counts, now):
+        for seconds, count in counts.items():
+            window = self.windows.get(seconds)
+            if window is None:
+                continue
+            missing = count - window.count(now)
+            for _ in range(missing):
+                bisect.insort(window.calls, now)
+
+
+class RateLimiter:
+    """
+    Rate limiter shared by every request of the process.
+    All the state is guarded by a lock that is never held while waiting, so it's safe to use from threads and from coroutines.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.app_buckets = {}
+        self.method_buckets = {}
+        # Highest and lowest latency seen lately, the high one falling slowly and the low one rising slowly.
+        self.latency_high = None
+        self.latency_low = None
+
+    # Seconds added to every window, the spread between the earliest and the latest the server can count a request.
+    def padding(self):
+        if self.latency_high is None:
+            return initial_latency + latency_margin
+        # The server counts a request at the earliest half way to the response of the fastest one.
+        return self.latency_high - self.latency_low / 2 + latency_margin
+
+    # Get the buckets of a request, creating them when needed.
+    def get_buckets(self, host, endpoint):
+        app = self.app_buckets.get(host)
+        if app is None:
+            app = self.app_buckets[host] = Bucket(parse_limits(default_app_limits))
+        method = self.method_buckets.get((host, endpoint))
+        if method is None:
+            method = self.method_buckets[(host, endpoint)] = Bucket({})
+        return app, method
+
+    # Function to reserve a slot for a request.
+    def reserve(self, url):
+        """
+        Reserves the earliest slot allowed by the application and method buckets of the URL.
+
+        Args:
+            url (string): The URL that will be requested.
+
+        Returns:
+            float: Seconds to wait before sending the request.
+        """
+        now = time.monotonic()
+        with self.lock:
+            app, method = self.get_buckets(*get_endpoint(url))
+            pad = self.padding()
+            for bucket in (app, method):
+                for window in bucket.windows.values():
+                    window.purge(now, pad)
+            # Repeat until both buckets agree on the slot, since moving it for one can collide with the other.
+            at = now
+            while True:
+                slot = method.next_slot(app.next_slot(at, pad), pad)
+                if slot == at:
+                    break
+                at = slot
+            app.add(at)
+            method.add(at)
+        return at - now
+
+    # Function to wait for a slot on synchronous code.
+    def wait(self, url):
+        """
+        Blocks the thread until the request to the URL can be sent.
+
+        Args:
+            url (string): The URL that will be requested.
+
+        Returns:
+            float: Seconds waited.
+        """
+        delay = self.reserve(url)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    # Coroutine to wait for a slot on asynchronous code.
+    async def wait_async(self, url):
+        """
+        Suspends the coroutine until the request to the URL can be sent.
+
+        Args:
+            url (string): The URL that will be requested.
+
+        Returns:
+            float: Seconds waited.
+        """
+        delay = self.reserve(url)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+    # Function to update the limits with the headers of a response.
+    def update(self, url, status, headers, latency=None):
+        """
+        Updates the limits and counts of the buckets with the headers of a response.
+        On a 429 the bucket named by the X-Rate-Limit-Type header is blocked for the Retry-After seconds.
+
+        Args:
+            url (string): The URL that was requested.
+            status (int): The status code of the response.
+            headers (Mapping): The headers of the response.
+            latency (float, optional): Seconds from sending the request to the response, used to pad the windows.
+
+        Returns:
+            float: Seconds the request should wait before being retried, 0 if it wasn't rate limited.
+        """
+        now = time.monotonic()
+        with self.lock:
+            app, method = self.get_buckets(*get_endpoint(url))
+            if latency is not None:
+                if self.latency_high is None:
+                    self.latency_high = self.latency_low = latency
+                self.latency_high = max(
+                    latency, 0.9 * self.latency_high + 0.1 * latency
+                )
+                self.latency_low = min(latency, 0.9 * self.latency_low + 0.1 * latency)
+            for bucket, name in ((app, "App"), (method, "Method")):
+                limits = parse_limits(headers.get(f"X-{name}-Rate-Limit"))
+                if limits:
+                    bucket.set_limits(limits)
+                    bucket.sync_counts(
+                        parse_limits(headers.get(f"X-{name}-Rate-Limit-Count")), now
+                    )
+            if status != 429:
+                return 0
+            retry_after = int(headers.get("Retry-After", 1))
+            # Service limits don't belong to the key, but blocking the method avoids hammering it.
+            if headers.get("X-Rate-Limit-Type") == "application":
+                app.blocked_until = max(app.blocked_until, now + retry_after)
+            else:
+                method.blocked_until = max(method.blocked_until, now + retry_after)
+            return retry_after
+
+    # Function to get the longest block caused by a 429.
+    def get_retry_after(self):
+        """
+        Returns:
+            float: Seconds until every bucket blocked by a 429 is released.
+        """
+        now = time.monotonic()
+        with self.lock:
+            buckets = list(self.app_buckets.values()) + list(
+                self.method_buckets.values()
+            )
+            return max([bucket.blocked_until - now for bucket in buckets] + [0])
@@ -0,0 +1,171 @@
+import asyncio
+import os
+import time
+from data_treatment import get_player_rating
+from db_operations import update_ratings
+from fetch import (
+    fetch_apex_league_async,
+    fetch_league_entries_async,
+    fetch_player_rating_async,
+)
+
+"""
+    Module with the service that keeps the rating of the players up to date with as few requests as possible.
+    The ratings are cached by summoner id for the rating TTL, so a player that shows up on many matches is only rated once.
+    Concurrent requests for the same player are coalesced into a single request.
+    The bulk refresh rates whole divisions with the paged league-v4 entries, about 200 players per request.
+"""
+
+# Seconds a rating is considered up to date, one day by default as the last_rating column is a day.
+rating_ttl = float(os.getenv("RATING_TTL", 86400))
+
+# Maximum amount of ratings kept by the cache.
+rating_cache_size = int(os.getenv("RATING_CACHE_SIZE", 200000))
+
+# Amount of ratings written on each transaction of the bulk refresh.
+rating_batch_size = int(os.getenv("RATING_BATCH_SIZE", 500))
+
+# Tiers and divisions listed by the bulk refresh.
+divided_tiers = ["IRON", "BRONZE", "SILVER", "GOLD", "PLATINUM", "EMERALD", "DIAMOND"]
+apex_tiers = ["MASTER", "GRANDMASTER", "CHALLENGER"]
+divisions = ["I", "II", "III", "IV"]
+
+# Marks a cached rating as missing, for unranked players.
+unranked = None
+
+# Marks a player whose rating on the database is up to date, but isn't cached.
+rated_on_db = object()
+
+
+class RatingService:
+    """
+    Cache of the treated ratings, as returned by get_player_rating, shared by every region of the process.
+    Only used from the event loop, so it doesn't need a lock.
+    """
+
+    def __init__(self, ttl=rating_ttl, size=rating_cache_size):
+        self.ttl = ttl
+        self.size = size
+        # Summoner id => (expiration, rating). The rating is None for unranked players.
+        self.cache = {}
+        # Summoner id => future of the request in flight.
+        self.in_flight = {}
+
+    # Function to check if the rating of a player is up to date.
+    def is_fresh(self, summoner_id):
+        entry = self.cache.get(summoner_id)
+        return entry is not None and entry[0] > time.monotonic()
+
+    # Function to cache a rating.
+    def put(self, summoner_id, rating, rated_at=None):
+        """
+        Args:
+            summoner_id (string): Encrypted summoner ID.
+            rating (dict): The treated rating, None for unranked players or rated_on_db for players rated on the database.
+            rated_at (float, optional): time.time() of when the rating was taken. Defaults to now.
+        """
+        age = 0 if rated_at is None else max(0, time.time() - rated_at)
+        if len(self.cache) >= self.size:
+            self.evict()
+        self.cache[summoner_id] = (time.monotonic() + self.ttl - age, rating)
+
+    # Drop the expired ratings, or the oldest half when none expired.
+    def evict(self):
+        now = time.monotonic()
+        expired = [key for key, (expires, _) in self.cache.items() if expires <= now]
+        if not expired:
+            expired = sorted(self.cache, key=lambda key: self.cache[key][0])
+            expired = expired[: len(expired) // 2]
+        for key in expired:
+            del self.cache[key]
+
+    # Coroutine to get the rating of a player.
+    async def get(self, summoner_id, platform):
+        """
+        Returns the cached rating when it's up to date, otherwise fetches it.
+        If a request for the same player is in flight, waits for it instead of sending another.
+
+        Args:
+            summoner_id (string): Encrypted summoner ID.
+            platform (string): Platform of the player.
+
+        Returns:
+            Dict: The treated rating, None if the player is unranked.
+
+        Raises:
+            Exception: If the request failed. Failures aren't cached, the match goes to the pending queue and the player is rated on its next attempt.
+        """
+        if self.is_fresh(summoner_id) and self.cache[summoner_id][1] is not rated_on_db:
+            return self.cache[summoner_id][1]
+        future = self.in_flight.get(summoner_id)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[summoner_id] = future
+        try:
+            p_rating = await fetch_player_rating_async(summoner_id, platform)
+            rating = get_player_rating(p_rating) if p_rating is not None else unranked
+            self.put(summoner_id, rating)
+            future.set_result(rating)
+            return rating
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Retrieve the exception so it's not reported when nobody else waits for it.
+            future.exception()
+            raise
+        finally:
+            del self.in_flight[summoner_id]
+
+    # Coroutine to rate every player of a platform with the paged league entries.
+    async def refresh_platform(self, platform, run_db):
+        """
+        Lists every division of the soloqueue, caching the ratings and writing them in batches.
+        Each page has the rating of about 200 players, instead of one request per player.
+
+        Args:
+            platform (string): The platform to refresh.
+            run_db (coroutine function): Runs a blocking database function, as the one of the crawler.
+
+        Returns:
+            int: The amount of ratings refreshed.
+        """
+        pending = []
+        refreshed = 0
+
+        # Cache the entries and write them when a batch is complete.
+        async def add_entries(entries, tier=None):
+            nonlocal pending, refreshed
+            for entry in entries:
+                if tier is not None:
+                    entry = dict(entry, tier=tier)
+                rating = get_player_rating(entry)
+                self.put(entry["summonerId"], rating)
+                pending.append((rating, entry.get("puuid"), entry["summonerId"]))
+            refreshed += len(entries)
+            if len(pending) >= rating_batch_size:
+                batch, pending = pending, []
+                await run_db(update_ratings, batch)
+
+        for tier in apex_tiers:
+            league = await fetch_apex_league_async(tier, platform)
+            if league is not None:
+                await add_entries(league["entries"], league["tier"])
+        for tier in divided_tiers:
+            for division in divisions:
+                page = 1
+                while True:
+                    entries = await fetch_league_entries_async(
+                        tier, division, page, platform
+                    )
+                    if not entries:
+                        break
+                    await add_entries(entries)
+                    page += 1
+        if pending:
+            await run_db(update_ratings, pending)
+        print(f"Refreshed the rating of {refreshed} players of {platform}.")
+        return refreshed
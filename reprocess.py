@@ -0,0 +1,165 @@
+import json
+import multiprocessing
+import os
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from archive import Archive, archive_dir
+from data_treatment import get_match_info, get_player_info, get_stats_columns
+from db_operations import create_shadow_tables, get_existing_matches, insert_matches
+from writer import parsed_match
+
+"""
+    Module with the offline reprocessing of the archived matches, rebuilding the match and stats tables without any request.
+    The payloads are read from the archive in chunks and the data_treatment extractors run on a pool of processes, with the
+    stats of a whole chunk extracted as columns. The rows are written on shadow tables, one transaction per chunk, while
+    the live tables keep being used.
+    The chunks already written are skipped, so a interrupted run continues where it stopped.
+"""
+
+# Amount of processes running the extractors.
+reprocess_workers = int(os.getenv("REPROCESS_WORKERS", os.cpu_count() or 1))
+
+# Amount of matches of each chunk, extracted by a single process and written on a single transaction.
+reprocess_chunk_size = int(os.getenv("REPROCESS_CHUNK_SIZE", 500))
+
+# Suffix of the shadow tables.
+reprocess_suffix = os.getenv("REPROCESS_SUFFIX", "_shadow")
+
+# Seconds between the progress reports.
+reprocess_report_interval = float(os.getenv("REPROCESS_REPORT_INTERVAL", 10))
+
+
+# Function to extract the rows of a chunk of matches, runs on the worker processes.
+def extract_chunk(records):
+    """
+    The stats of the whole chunk are extracted as columns, falling back to each match on its own when one of them fails.
+
+    Args:
+        records (List[Tuple[string, bytes]]): The match_id and compressed payload of each match.
+
+    Returns:
+        Tuple[List[Dict], Dict, List[Tuple]]: The parsed matches without stats, the stats of every match as columns, and the match_id and error of the ones that failed.
+    """
+    matches = []
+    payloads = []
+    errors = []
+    for match_id, compressed in records:
+        try:
+            data = json.loads(zlib.decompress(compressed))
+            matches.append(
+                parsed_match(get_match_info(data), get_player_info(data), [], [])
+            )
+            payloads.append(data)
+        except Exception as e:
+            errors.append((match_id, repr(e)))
+    try:
+        return matches, get_stats_columns(payloads), errors
+    except Exception:
+        pass
+
+    # Find the matches that can't be extracted.
+    valid = []
+    for match, data in zip(matches, payloads):
+        try:
+            get_stats_columns([data])
+            valid.append((match, data))
+        except Exception as e:
+            errors.append((data["metadata"]["matchId"], repr(e)))
+    return (
+        [match for match, _ in valid],
+        get_stats_columns([data for _, data in valid]),
+        errors,
+    )
+
+
+# Generator of the chunks that weren't written yet.
+def pending_chunks(archive, match_table, chunk_size):
+    """
+    Splits the archived matches in chunks, in the order of the files, dropping the ones already on the shadow table with a query per chunk.
+
+    Args:
+        archive (Archive): The archive being reprocessed.
+        match_table (string): The shadow table of the matches.
+        chunk_size (int): Amount of matches of each chunk.
+
+    Yields:
+        List[Tuple[string, bytes]]: The match_id and compressed payload of each match of the chunk.
+    """
+    match_ids = archive.ordered()
+    for start in range(0, len(match_ids), chunk_size):
+        chunk = match_ids[start : start + chunk_size]
+        existing = get_existing_matches(chunk, match_table)
+        records = [
+            (match_id, archive.get_compressed(match_id))
+            for match_id in chunk
+            if match_id not in existing
+        ]
+        if records:
+            yield records
+
+
+# Function to rebuild the match and stats tables from the archive.
+def reprocess(
+    suffix=reprocess_suffix,
+    workers=reprocess_workers,
+    chunk_size=reprocess_chunk_size,
+    directory=archive_dir,
+):
+    """
+    Writes every archived match on the shadow tables, creating them when needed.
+    The players that aren't on tb_player_info are inserted on it, without rating, since the ids of the stats point to it.
+    The database connection must be open.
+
+    Args:
+        suffix (string, optional): Suffix of the shadow tables. Defaults to REPROCESS_SUFFIX.
+        workers (int, optional): Amount of extraction processes. Defaults to REPROCESS_WORKERS.
+        chunk_size (int, optional): Amount of matches of each chunk. Defaults to REPROCESS_CHUNK_SIZE.
+        directory (string, optional): Folder of the archive. Defaults to ARCHIVE_DIR.
+
+    Returns:
+        int: The amount of matches written.
+    """
+    match_table, stats_table = create_shadow_tables(suffix)
+    archive = Archive(directory, read_only=True)
+    print(f"Reprocessing {len(archive)} archived matches into {match_table}.")
+
+    written = 0
+    failed = 0
+    started = last_report = time.monotonic()
+    # Spawned instead of forked, so the workers don't inherit the connection pool.
+    context = multiprocessing.get_context("spawn")
+    try:
+        with ProcessPoolExecutor(workers, mp_context=context) as executor:
+            # Two chunks per worker are kept in flight, so the workers don't wait for the writes.
+            in_flight = deque()
+            chunks = pending_chunks(archive, match_table, chunk_size)
+            while True:
+                for records in chunks:
+                    in_flight.append(executor.submit(extract_chunk, records))
+                    if len(in_flight) >= workers * 2:
+                        break
+                if not in_flight:
+                    break
+                matches, stats, errors = in_flight.popleft().result()
+                for match_id, error in errors:
+                    print(f"Error reprocessing the match {match_id}: {error}")
+                if matches:
+                    insert_matches(matches, match_table, stats_table, stats)
+                written += len(matches)
+                failed += len(errors)
+
+                now = time.monotonic()
+                if now - last_report >= reprocess_report_interval:
+                    last_report = now
+                    print(
+                        f"Reprocessed {written} matches, {written / (now - started):.1f} matches/sec."
+                    )
+    finally:
+        archive.close()
+    elapsed = time.monotonic() - started
+    print(
+        f"Reprocessed {written} matches in {elapsed:.1f} seconds, {written / max(elapsed, 1e-9):.1f} matches/sec, {failed} failed."
+    )
+    return written
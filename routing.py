@@ -0,0 +1,119 @@
+import os
+from dotenv import load_dotenv
+
+"""
+    Module with the routing values of the RIOT API.
+    The league-v4 and summoner-v4 endpoints are served by the platform of the player (br1, na1, euw1, ...),
+    while the match-v5 endpoints are served by the regional cluster that the platform belongs to.
+    Each host has its own rate limit, so crawling multiple regions multiplies the available budget.
+"""
+
+load_dotenv("credentials.env")
+
+# Base URL of a server standing in for the API, such as the mock server of the benchmarks, the route being the first segment of the path.
+api_base_url = os.getenv("API_BASE_URL")
+
+# Regional cluster of each platform.
+platform_regions = {
+    "br1": "americas",
+    "la1": "americas",
+    "la2": "americas",
+    "na1": "americas",
+    "eun1": "europe",
+    "euw1": "europe",
+    "me1": "europe",
+    "ru": "europe",
+    "tr1": "europe",
+    "jp1": "asia",
+    "kr": "asia",
+    "oc1": "sea",
+    "ph2": "sea",
+    "sg2": "sea",
+    "th2": "sea",
+    "tw2": "sea",
+    "vn2": "sea",
+}
+
+# Platform used when none is given, the only one crawled before the routing existed.
+default_platform = os.getenv("DEFAULT_PLATFORM", "br1")
+
+
+# Function to get the regional cluster of a platform.
+def get_region(platform):
+    """
+    Args:
+        platform (string): The platform routing value, such as br1 or euw1.
+
+    Raises:
+        ValueError: If the platform is unknown.
+
+    Returns:
+        string: The regional routing value, such as americas or europe.
+    """
+    try:
+        return platform_regions[platform.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown platform: {platform}")
+
+
+# Function to get the platform of a match based on its id.
+def get_match_platform(match_id):
+    """
+    The match ids are prefixed by the platform in upper case, as in BR1_2912345678.
+
+    Args:
+        match_id (string): The id of the match.
+
+    Returns:
+        string: The platform of the match.
+    """
+    return match_id.split("_")[0].lower()
+
+
+# Function to get the platforms that should be crawled.
+def get_platforms(platforms=None):
+    """
+    Reads the comma separated PLATFORMS variable from the enviroment, defaulting to the default platform.
+
+    Args:
+        platforms (string, optional): Comma separated platforms used instead of the enviroment variable.
+
+    Returns:
+        List[string]: The platforms to crawl.
+    """
+    if platforms is None:
+        platforms = os.getenv("PLATFORMS", default_platform)
+    platforms = [p.strip().lower() for p in platforms.split(",") if p.strip()]
+    for platform in platforms:
+        get_region(platform)
+    return platforms
+
+
+# Function to group the platforms by their regional cluster.
+def group_by_region(platforms):
+    """
+    Args:
+        platforms (List[string]): The platforms to group.
+
+    Returns:
+        Dict: The list of platforms of each region.
+    """
+    regions = {}
+    for platform in platforms:
+        regions.setdefault(get_region(platform), []).append(platform)
+    return regions
+
+
+# Function to build the URL of a endpoint.
+def api_url(route, path):
+    """
+    Args:
+        route (string): The platform or region that serves the endpoint.
+        path (string): The path of the endpoint, starting with a slash.
+
+    Returns:
+        string: The full URL.
+    """
+    if api_base_url:
+        return f"{api_base_url.rstrip('/')}/{route}{path}"
+    return f"https://{route}.api.riotgames.com{path}"
@@ -0,0 +1,92 @@
+import os
+from datetime import datetime
+
+"""
+    Module with the adaptive schedule of the players, deciding when each one is fetched again.
+    A call to the match list of a player that didn't play since the last one is wasted, so instead of fetching every
+    player in turn, each one is due again after the time it takes to play about SCHEDULE_TARGET_MATCHES matches.
+    The match rate of a player is the average of the matches per day seen on its match lists, weighted by its tier and
+    league points since the higher ratings have their matches requested the most. Players whose match lists keep
+    returning no new matches, as the dormant accounts, have the interval doubled on every fetch until the maximum.
+"""
+
+# Amount of new matches expected on the next fetch of a player.
+schedule_target_matches = float(os.getenv("SCHEDULE_TARGET_MATCHES", 5))
+
+# Minimum seconds between two fetches of a player.
+schedule_min_interval = float(os.getenv("SCHEDULE_MIN_INTERVAL", 3600))
+
+# Maximum seconds between two fetches of a player, reached by the dormant accounts.
+schedule_max_interval = float(os.getenv("SCHEDULE_MAX_INTERVAL", 30 * 86400))
+
+# Weight of the last fetch on the averages of the match rate and the yield, between 0 and 1.
+schedule_smoothing = float(os.getenv("SCHEDULE_SMOOTHING", 0.5))
+
+# Average of new matches per call below which the player is backed off.
+schedule_dormant_yield = float(os.getenv("SCHEDULE_DORMANT_YIELD", 1))
+
+# Weight of the match rate of each tier, the unranked players use the None key.
+tier_weights = {
+    None: 0.75,
+    "IRON": 0.5,
+    "BRONZE": 0.6,
+    "SILVER": 0.7,
+    "GOLD": 0.8,
+    "PLATINUM": 0.9,
+    "EMERALD": 1.0,
+    "DIAMOND": 1.25,
+    "MASTER": 1.5,
+    "GRANDMASTER": 1.75,
+    "CHALLENGER": 2.0,
+}
+
+
+# Function to get the weight of the rating of a player.
+def tier_weight(tier, league_points):
+    """
+    Args:
+        tier (string): Tier of the player, None if unranked.
+        league_points (int): League points of the player, unbounded on the master tiers.
+
+    Returns:
+        float: The weight of the tier, raised by half for every 1000 league points.
+    """
+    return tier_weights.get(tier, 1.0) * (1 + (league_points or 0) / 2000)
+
+
+# Function to add an observation to an average.
+def smooth(average, value):
+    if average is None:
+        return value
+    return schedule_smoothing * value + (1 - schedule_smoothing) * average
+
+
+# Function to schedule the next fetch of a player.
+def schedule(player, seen, found, calls, now=None):
+    """
+    Args:
+        player (Tuple): The since, previous interval in seconds, match_rate, list_yield, tier and league_points of the player.
+        seen (int): Amount of matches of the player listed since the start of its match list, including the known ones.
+        found (int): Amount of new matches found.
+        calls (int): Amount of calls to the match list, 0 when resumed from the pending queue.
+        now (datetime, optional): Time of the fetch. Defaults to now.
+
+    Returns:
+        Tuple[float, float, float]: The seconds until the next fetch, and the updated match rate and list yield.
+    """
+    since, previous, match_rate, list_yield, tier, league_points = player
+    now = now or datetime.now()
+    if calls:
+        days = max((now - since).total_seconds(), schedule_min_interval) / 86400
+        match_rate = smooth(match_rate, seen / days)
+        list_yield = smooth(list_yield, found / calls)
+    expected = (match_rate or 0) * tier_weight(tier, league_points)
+    if expected > 0:
+        interval = schedule_target_matches / expected * 86400
+    else:
+        interval = schedule_max_interval
+    # The dormant players wait twice as much as the last time.
+    if list_yield is not None and list_yield < schedule_dormant_yield:
+        interval = max(interval, 2 * previous)
+    interval = min(max(interval, schedule_min_interval), schedule_max_interval)
+    return interval, match_rate, list_yield
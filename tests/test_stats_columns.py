@@ -0,0 +1,38 @@
+import json
+import random
+import numpy as np
+from benchmarks.synthetic import make_match, make_players
+from data_treatment import get_match_rows, get_player_stats, get_stats_columns
+from match_schema import decode_match
+
+"""
+    Tests of the columnar extraction of the stats against the per-match functions, without database.
+"""
+
+
+# Function to get the values of each row of the columns, None for the masked ones as the database gets them.
+def column_rows(columns):
+    values = [
+        column.tolist() if hasattr(column, "tolist") else column
+        for column in columns.values()
+    ]
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+def test_zero_duration_matches_both_paths():
+    rng = random.Random(0)
+    data = make_match("BR1_1", make_players(10), rng)
+    data["info"]["gameDuration"] = 0
+    columns = column_rows(get_stats_columns([data]))
+    _, _, decoded = get_match_rows(decode_match(json.dumps(data).encode()))
+    for column_row, decoded_row, dict_row in zip(
+        columns, decoded, get_player_stats(data)
+    ):
+        assert column_row["cs_per_min"] is None
+        assert decoded_row["cs_per_min"] is None
+        assert dict_row["cs_per_min"] is None
+        for column, value in column_row.items():
+            if isinstance(value, float):
+                assert np.isclose(value, decoded_row[column])
+            else:
+                assert value == decoded_row[column]
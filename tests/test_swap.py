@@ -0,0 +1,72 @@
+import json
+import random
+import uuid
+import pytest
+from benchmarks.synthetic import make_match, make_players, make_rating, make_timeline
+from data_treatment import (
+    get_match_info,
+    get_player_info,
+    get_player_rating,
+    get_player_stats,
+)
+from db_operations import *
+from timeline import get_timeline_row, parse_timeline
+from writer import parsed_match
+
+"""
+    Tests of the swap of the shadow tables of a reprocess.
+    Uses the database of the enviroment, so it should point to a database used only for tests, the tables left by a
+    previous swap are dropped. Skipped when the database can't be reached.
+"""
+
+suffix = "_test_shadow"
+
+
+@pytest.fixture(scope="module")
+def database():
+    try:
+        connect_mysql()
+        create_tables()
+    except Exception as e:
+        pytest.skip(f"No database for the tests: {e}")
+    for table in ("tb_player_stats_old", "tb_match_info_old"):
+        execute_query(f"DROP TABLE IF EXISTS {table}")
+    yield
+    close_mysql()
+
+
+# Function to parse a synthetic match with its timeline, as the crawler does.
+def parse_match(players, rng):
+    match_id = f"BR1_{uuid.uuid4().hex[:12]}"
+    participants = rng.sample(players, 10)
+    data = make_match(match_id, participants, rng)
+    p_info = get_player_info(data)
+    for player, participant in zip(p_info, participants):
+        player.update(get_player_rating(make_rating(participant, rng)))
+    raw = json.dumps(make_timeline(match_id, participants, rng=rng)).encode()
+    timeline = get_timeline_row(parse_timeline(raw))
+    return match_id, parsed_match(
+        get_match_info(data),
+        p_info,
+        get_player_stats(data),
+        [],
+        timeline,
+    )
+
+
+def test_insert_timeline_after_swap(database):
+    rng = random.Random(0)
+    players = make_players(20, seed=rng.randrange(1 << 30))
+    before_id, before = parse_match(players, rng)
+    insert_matches([before])
+
+    # The reprocess writes the same match to the shadow tables, with a new id.
+    match_table, stats_table = create_shadow_tables(suffix)
+    insert_matches([before], match_table, stats_table)
+    swap_shadow_tables(suffix)
+
+    after_id, after = parse_match(players, rng)
+    insert_matches([after])
+    blobs = get_timeline_blobs([before_id, after_id])
+    assert blobs[before_id] == before["timeline"]["data"]
+    assert blobs[after_id] == after["timeline"]["data"]
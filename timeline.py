@@ -0,0 +1,233 @@
+import json
+import os
+import struct
+import zlib
+from typing import Dict, List, Optional
+import numpy as np
+from db_operations import get_timeline_blobs
+from match_schema import Record, msgspec
+
+"""
+    Module with the parsing and storage of the match-v5 timelines.
+    A timeline has a frame per minute with the state of each participant, plus every event of the match. Only the
+    per-minute series of each participant are kept, packed as a single array per match instead of a row per minute.
+
+    The array has the shape (participants, frames, series), with the series on the order of timeline_series. The values
+    are stored as the difference to the previous frame, which are small numbers for all the series, and compressed.
+    The participants follow the participantId order, the same order of the participants of the match.
+"""
+
+# Enables the fetch of the timeline of each match, costing a extra request per match.
+fetch_timelines = os.getenv("FETCH_TIMELINES", "0") == "1"
+
+# Series stored for each participant and frame.
+timeline_series = ["gold", "xp", "cs", "x", "y"]
+
+# Version of the format of the blobs.
+timeline_version = 1
+
+# Header of the blobs, the version and the amount of participants, frames and series.
+timeline_header = struct.Struct("<BBHB")
+
+
+class Position(Record):
+    x: int = 0
+    y: int = 0
+
+
+class ParticipantFrame(Record):
+    total_gold: int = 0
+    xp: int = 0
+    minions_killed: int = 0
+    jungle_minions_killed: int = 0
+    position: Optional[Position] = None
+
+
+class Frame(Record):
+    timestamp: int = 0
+    participant_frames: Dict[str, ParticipantFrame] = {}
+
+
+class TimelineInfo(Record):
+    frames: List[Frame] = []
+
+
+class TimelineMetadata(Record):
+    match_id: str = ""
+
+
+class Timeline(Record):
+    metadata: Optional[TimelineMetadata] = None
+    info: Optional[TimelineInfo] = None
+
+
+# Decoder of the timelines, skipping the events.
+timeline_decoder = msgspec.json.Decoder(Timeline) if msgspec is not None else None
+
+
+# Function to read the series of a participant frame decoded into a record.
+def read_record_frame(participant):
+    position = participant.position
+    return (
+        participant.total_gold,
+        participant.xp,
+        participant.minions_killed + participant.jungle_minions_killed,
+        position.x if position else 0,
+        position.y if position else 0,
+    )
+
+
+# Function to read the series of a participant frame decoded into a dict.
+def read_dict_frame(participant):
+    position = participant.get("position") or {}
+    return (
+        participant.get("totalGold", 0),
+        participant.get("xp", 0),
+        participant.get("minionsKilled", 0) + participant.get("jungleMinionsKilled", 0),
+        position.get("x", 0),
+        position.get("y", 0),
+    )
+
+
+# Function to get the series of a timeline as a array.
+def parse_timeline(raw):
+    """
+    Decodes the body of a timeline response, reading only the participant frames.
+
+    Args:
+        raw (bytes): The body of the response.
+
+    Raises:
+        ValueError: If the payload isn't a timeline.
+
+    Returns:
+        ndarray: The values with the shape (participants, frames, series).
+    """
+    if timeline_decoder is not None:
+        info = timeline_decoder.decode(raw).info
+        if info is None:
+            raise ValueError("The payload isn't a timeline, the info is missing.")
+        frames = [frame.participant_frames for frame in info.frames]
+        read = read_record_frame
+    else:
+        info = json.loads(raw).get("info")
+        if info is None:
+            raise ValueError("The payload isn't a timeline, the info is missing.")
+        frames = [
+            frame.get("participantFrames", {}) for frame in info.get("frames", [])
+        ]
+        read = read_dict_frame
+
+    # The participant frames are keyed by the participantId, from "1" to "10".
+    participants = max((int(key) for frame in frames for key in frame), default=0)
+    values = np.zeros((participants, len(frames), len(timeline_series)), np.int32)
+    for index, frame in enumerate(frames):
+        for participant_id, participant in frame.items():
+            values[int(participant_id) - 1, index] = read(participant)
+    return values
+
+
+# Function to pack the series of a timeline.
+def pack_timeline(values):
+    """
+    Args:
+        values (ndarray): The values with the shape (participants, frames, series), as returned by parse_timeline.
+
+    Returns:
+        bytes: The blob stored on the database.
+    """
+    participants, frames, series = values.shape
+    deltas = np.diff(values, axis=1, prepend=0).astype("<i4")
+    return timeline_header.pack(
+        timeline_version, participants, frames, series
+    ) + zlib.compress(deltas.tobytes(), 9)
+
+
+# Function to get the row of tb_match_timeline of a timeline.
+def get_timeline_row(values):
+    """
+    Args:
+        values (ndarray): The values with the shape (participants, frames, series), as returned by parse_timeline.
+
+    Returns:
+        Dict: The participants, frames and packed data of the timeline, without the match_id.
+    """
+    return {
+        "participants": values.shape[0],
+        "frames": values.shape[1],
+        "data": pack_timeline(values),
+    }
+
+
+# Function to unpack the series of a timeline.
+def unpack_timeline(blob):
+    """
+    Args:
+        blob (bytes): The blob stored on the database.
+
+    Raises:
+        ValueError: If the blob has a unknown version.
+
+    Returns:
+        ndarray: The values with the shape (participants, frames, series).
+    """
+    version, participants, frames, series = timeline_header.unpack_from(blob)
+    if version != timeline_version:
+        raise ValueError(f"Unknown version of the timeline blob: {version}")
+    deltas = np.frombuffer(
+        zlib.decompress(blob[timeline_header.size :]), dtype="<i4"
+    ).reshape(participants, frames, series)
+    return np.cumsum(deltas, axis=1, dtype=np.int32)
+
+
+# Function to get a series of every participant.
+def get_series(blob, name):
+    """
+    Args:
+        blob (bytes): The blob stored on the database.
+        name (string): The series, one of timeline_series.
+
+    Returns:
+        ndarray: The values with the shape (participants, frames).
+    """
+    return unpack_timeline(blob)[:, :, timeline_series.index(name)]
+
+
+# Function to get the gold of every participant by minute.
+def get_gold(blob):
+    return get_series(blob, "gold")
+
+
+# Function to get the experience of every participant by minute.
+def get_xp(blob):
+    return get_series(blob, "xp")
+
+
+# Function to get the minions and monsters killed of every participant by minute.
+def get_cs(blob):
+    return get_series(blob, "cs")
+
+
+# Function to get the position of every participant by minute.
+def get_positions(blob):
+    """
+    Returns:
+        ndarray: The x and y with the shape (participants, frames, 2).
+    """
+    values = unpack_timeline(blob)
+    return values[:, :, [timeline_series.index("x"), timeline_series.index("y")]]
+
+
+# Function to load the timelines of many matches.
+def load_timelines(match_ids):
+    """
+    Args:
+        match_ids (List[string]): The ids of the matches, as given by the API.
+
+    Returns:
+        Dict: The values of the timeline of each match that has one, with the shape (participants, frames, series).
+    """
+    return {
+        match_id: unpack_timeline(blob)
+        for match_id, blob in get_timeline_blobs(match_ids).items()
+    }
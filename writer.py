@@ -0,0 +1,145 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from db_operations import insert_matches
+from metrics import errors, matches_written
+
+"""
+    Module with the write-behind writer of the crawler.
+    The parsed matches are put on a queue and a dedicated thread writes them in batches, each batch on a single transaction.
+    A batch is written when it reaches the batch size or when its oldest match waited for the flush interval.
+"""
+
+# Maximum amount of matches written on each transaction.
+write_batch_size = int(os.getenv("WRITE_BATCH_SIZE", 50))
+
+# Maximum amount of seconds a match waits on the queue before its batch is written.
+write_flush_interval = float(os.getenv("WRITE_FLUSH_INTERVAL", 2.0))
+
+# Maximum amount of matches waiting on the queue, submitting blocks while it's full.
+write_queue_size = int(os.getenv("WRITE_QUEUE_SIZE", 500))
+
+
+# Function to build the parsed match accepted by the writer.
+def parsed_match(match_info, player_info, player_stats, rating_updates, timeline=None):
+    """
+    Args:
+        match_info (Dict): Information about the match, as returned by get_match_info.
+        player_info (List[Dict]): Players that aren't on the database, with their rating.
+        player_stats (List[Dict]): Stats of each player, as returned by get_player_stats.
+        rating_updates (List[Tuple]): Rating and puuid of the players already on the database.
+        timeline (Dict, optional): The row of the timeline, as returned by get_timeline_row.
+
+    Returns:
+        Dict: The parsed match.
+    """
+    return {
+        "match_info": match_info,
+        "player_info": player_info,
+        "player_stats": player_stats,
+        "rating_updates": rating_updates,
+        "timeline": timeline,
+    }
+
+
+class MatchWriter:
+    """
+    Writer thread that takes parsed matches from a bounded queue and writes them in batches.
+    """
+
+    def __init__(
+        self,
+        batch_size=write_batch_size,
+        flush_interval=write_flush_interval,
+        queue_size=write_queue_size,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = None
+        self.stopping = threading.Event()
+
+    # Start the writer thread.
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.run, name="match-writer", daemon=True
+        )
+        self.thread.start()
+        return self
+
+    # Function to submit a match to be written.
+    def submit(self, match):
+        """
+        Puts the match on the queue, blocking while the queue is full so the producers slow down to the writing speed.
+
+        Args:
+            match (Dict): The parsed match, as built by parsed_match.
+
+        Returns:
+            Future: Resolved with the int id of the match once its batch is committed, or with the exception if it failed.
+        """
+        future = Future()
+        self.queue.put((match, future))
+        return future
+
+    # Function to stop the writer.
+    def stop(self):
+        """
+        Writes every match already on the queue and waits for the thread to finish.
+        """
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    # Loop of the writer thread.
+    def run(self):
+        while not (self.stopping.is_set() and self.queue.empty()):
+            batch = self.collect()
+            if batch:
+                self.write(batch)
+
+    # Collect matches until the batch is full or the oldest one waited for the flush interval.
+    def collect(self):
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            timeout = 0.1 if deadline is None else deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=min(timeout, 0.1)))
+            except queue.Empty:
+                if self.stopping.is_set() or deadline is None:
+                    break
+                continue
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+        return batch
+
+    # Function to write a batch, isolating the failing matches.
+    def write(self, batch):
+        """
+        Writes the batch on a single transaction. If it fails, each match is written on its own transaction,
+        so a single bad match doesn't discard the rest of the batch.
+
+        Args:
+            batch (List[Tuple]): The matches and their futures.
+        """
+        try:
+            match_ids = insert_matches([match for match, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                errors.inc(1, "write", type(e).__name__)
+                batch[0][1].set_exception(e)
+                return
+            print(
+                f"Error writing a batch of {len(batch)} matches, writing one by one:", e
+            )
+            for item in batch:
+                self.write([item])
+            return
+        matches_written.inc(len(batch))
+        for match, future in batch:
+            future.set_result(match_ids.get(match["match_info"]["match_id"][0]))